@@ -0,0 +1,81 @@
+# keeps what is derived from the entries (the related-entry graph, the themes) current without making writes wait.
+#
+# a write only calls request(). A background thread waits until no request came in for debounce_ms (or max_delay_ms
+# passed since the first pending one) and then runs update() of every component once, so a burst of writes costs
+# one update and a full rebuild (first start, a switch of the embedding model) never runs on a request thread.
+# every component catches up from change_log: an update that fails is made up by the next one.
+import threading
+import time
+
+from services.metrics.tracker import metrics
+
+
+class DerivedRefresher(threading.Thread):
+    def __init__(self, components, debounce_ms=200, max_delay_ms=2000):
+        super().__init__(name="derived-refresh", daemon=True)
+        self.components = components  # {name: object with update()}
+        self.debounce = debounce_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self._cond = threading.Condition()
+        self._requested = 0  # requests so far
+        self._done = 0  # requests covered by a finished refresh
+        self._first_pending = None
+        self._last_request = None
+        self._closed = False
+
+    def start(self):
+        super().start()
+        return self
+
+    def request(self):
+        """ Ask for a refresh, returns at once """
+        with self._cond:
+            now = time.monotonic()
+            self._requested += 1
+            self._last_request = now
+            if self._first_pending is None:
+                self._first_pending = now
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """ Wait until every request made before this call is processed. Returns False on timeout """
+        with self._cond:
+            target = self._requested
+            return self._cond.wait_for(lambda: self._done >= target or self._closed, timeout)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join()
+
+    def refresh(self):
+        for name, component in self.components.items():
+            started = time.perf_counter()
+            # a failure here must not stop the thread, the next refresh catches up
+            try:
+                component.update()
+            except Exception as e:
+                print(f"Error updating {name}: {e}")
+            metrics.record(f"derived.{name}", time.perf_counter() - started)
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._requested > self._done or self._closed)
+                # debounce: let a burst of writes settle, but not for longer than max_delay
+                while not self._closed:
+                    deadline = min(self._last_request + self.debounce, self._first_pending + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                target = self._requested
+                self._first_pending = None
+            self.refresh()
+            with self._cond:
+                self._done = target
+                self._cond.notify_all()
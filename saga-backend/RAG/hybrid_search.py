@@ -0,0 +1,149 @@
+# hybrid search: a lexical ranking (FTS5 / bm25, see the full_text_search migration) and a semantic top-k
+# (cosine similarity over the in-memory VectorIndex) run concurrently and are fused with reciprocal-rank fusion:
+#
+#     score(entry) = sum over retrievers of 1 / (rrf_k + rank)
+#
+# RRF only looks at ranks, so bm25 scores and cosine similarities do not need to be calibrated against each other.
+# both retrievers apply the same filters: SQL clauses for the lexical side, an allow-list of ids for the semantic side.
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.sbert.embeddings_sbert import get_embedding
+from services.metrics.tracker import metrics
+
+# bm25 column weights: title, content, summary
+BM25_WEIGHTS = (5.0, 1.0, 2.0)
+
+
+def fts_query(text):
+    """ Turn free text into an FTS5 query: every word quoted (no FTS syntax from users), any word may match """
+    words = re.findall(r"\w+", text.lower())
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+def rrf_fuse(rankings, rrf_k=60):
+    """ Reciprocal-rank fusion of several ranked id lists. Returns [(id, score)], best first """
+    scores = {}
+    for ranking in rankings:
+        for rank, entry_id in enumerate(ranking, start=1):
+            scores[entry_id] = scores.get(entry_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridSearcher:
+    def __init__(self, db_path, index, rrf_k=60, candidates=50, max_workers=4):
+        self.db_path = db_path
+        self.index = index
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._local = threading.local()
+
+    def _connection(self):
+        # one connection per worker thread, so the retrievers never wait on each other for a connection
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def lexical(self, query, clauses, params, k):
+        """ Top-k (id, bm25) for the query, bm25 is lower-is-better """
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = f"""
+            SELECT e.id, bm25(journal_fts, {", ".join(str(w) for w in BM25_WEIGHTS)}) AS score
+            FROM journal_fts JOIN journal_entries e ON e.doc_id = journal_fts.rowid
+            WHERE journal_fts MATCH ?
+        """
+        if clauses:
+            sql += " AND " + " AND ".join(clauses)
+        sql += " ORDER BY score LIMIT ?"
+        return self._connection().execute(sql, [match, *params, k]).fetchall()
+
+    def allowed_ids(self, clauses, params):
+        """ Ids that pass the filters, None when there are no filters """
+        if not clauses:
+            return None
+        sql = "SELECT id FROM journal_entries WHERE " + " AND ".join(clauses)
+        return {row[0] for row in self._connection().execute(sql, params)}
+
+    def semantic(self, query, clauses, params, k):
+        """ Top-k (id, cosine similarity) for the query, plus the time spent embedding it """
+        # encode with the model of the version the index is compared against, not whichever one is the default
+        version, model_name = self.index.registry.active_model()
+        started = time.perf_counter()
+        query_embedding = get_embedding(query, model_name=model_name)
+        embed_seconds = time.perf_counter() - started
+        hits = self.index.search(query_embedding, k=k, allowed_ids=self.allowed_ids(clauses, params), version=version)
+        return hits, embed_seconds
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - started
+
+    def _hydrate(self, ids):
+        if not ids:
+            return {}
+        rows = self._connection().execute(
+            "SELECT id, title, date, summary, promptType FROM journal_entries WHERE id IN ({})".format(",".join("?" * len(ids))),
+            ids,
+        ).fetchall()
+        return {row[0]: row for row in rows}
+
+    def search(self, query, clauses=None, params=None, k=10):
+        """
+        Run both retrievers concurrently on `query`, restricted by the SQL filter clauses, and fuse them.
+        Returns {"hits": [...], "timings_ms": {...}}
+        """
+        clauses, params = clauses or [], params or []
+        started = time.perf_counter()
+        lexical_future = self._pool.submit(self._timed, self.lexical, query, clauses, params, self.candidates)
+        semantic_future = self._pool.submit(self._timed, self.semantic, query, clauses, params, self.candidates)
+        lexical_hits, lexical_seconds = lexical_future.result()
+        (semantic_hits, embed_seconds), semantic_seconds = semantic_future.result()
+        retrieved = time.perf_counter()
+
+        fused = rrf_fuse([[hit[0] for hit in lexical_hits], [hit[0] for hit in semantic_hits]], self.rrf_k)[:k]
+        lexical_ranks = {hit[0]: rank for rank, hit in enumerate(lexical_hits, start=1)}
+        semantic_ranks = {hit[0]: (rank, hit[1]) for rank, hit in enumerate(semantic_hits, start=1)}
+        fused_at = time.perf_counter()
+
+        rows = self._hydrate([entry_id for entry_id, _ in fused])
+        hits = []
+        for entry_id, score in fused:
+            row = rows.get(entry_id)
+            if row is None:  # deleted between retrieval and hydration
+                continue
+            semantic_rank, semantic_score = semantic_ranks.get(entry_id, (None, None))
+            hits.append({
+                "id": row[0],
+                "title": row[1],
+                "date": row[2],
+                "summary": row[3],
+                "promptType": row[4],
+                "score": round(score, 6),
+                "lexical_rank": lexical_ranks.get(entry_id),
+                "semantic_rank": semantic_rank,
+                "semantic_score": None if semantic_score is None else round(semantic_score, 4),
+            })
+        finished = time.perf_counter()
+
+        metrics.record("search.lexical", lexical_seconds)
+        metrics.record("search.semantic", semantic_seconds)
+        metrics.record("search.total", finished - started)
+        timings = {
+            "lexical": lexical_seconds,
+            "embed": embed_seconds,
+            "semantic": semantic_seconds,
+            "retrieval": retrieved - started,  # both retrievers, in parallel: ~max(lexical, semantic)
+            "fusion": fused_at - retrieved,
+            "hydrate": finished - fused_at,
+            "total": finished - started,
+        }
+        return {"hits": hits, "timings_ms": {name: round(seconds * 1000, 2) for name, seconds in timings.items()}}
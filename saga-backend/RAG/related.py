@@ -0,0 +1,189 @@
+# precomputed "related entries": the k nearest neighbours (cosine similarity of summaryEmbedding) of every entry,
+# stored in entry_neighbors (see the related_entries migration) so showing them is one primary-key range read.
+#
+# build:  all-pairs similarity in blocks of rows (block @ matrix.T), top-k per row with argpartition,
+#         so memory stays at block_size x n floats however large the journal gets.
+# update: follows change_log from the seq the graph was last synced to. For the changed entries:
+#         - their own lists are recomputed
+#         - lists that mention a changed or deleted entry are recomputed (their ranking may no longer hold)
+#         - every other list can only change by a changed entry moving into its top-k: merged in place. Each list's
+#           floor (its k-th score) is kept in entry_neighbor_floor, indexed by score, so only the lists a changed
+#           vector beats are read and rewritten
+# a switch of the embedding model rebuilds the graph.
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from services.metrics.tracker import metrics
+
+STATE_NAME = "summary_knn"
+# floor of a list shorter than k: below any cosine similarity, every candidate gets in
+OPEN = -2.0
+
+
+class RelatedGraph:
+    def __init__(self, db_path, index, k=10, block_size=256):
+        self.db_path = db_path
+        self.index = index
+        self.k = k
+        self.block_size = block_size
+        self._lock = threading.Lock()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def top_k(self, query_ids, ids, matrix):
+        """ Yield (entry_id, [(neighbor_id, score), ...]) for query_ids, computed block by block """
+        positions = {entry_id: i for i, entry_id in enumerate(ids)}
+        k = min(self.k, len(ids) - 1)
+        if k <= 0:
+            for entry_id in query_ids:
+                yield entry_id, []
+            return
+        for start in range(0, len(query_ids), self.block_size):
+            block_ids = query_ids[start:start + self.block_size]
+            rows = [positions[entry_id] for entry_id in block_ids]
+            sims = matrix[rows] @ matrix.T
+            sims[np.arange(len(rows)), rows] = -np.inf  # an entry is not related to itself
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_sims = np.take_along_axis(top_sims, order, axis=1)
+            for entry_id, neighbors, scores in zip(block_ids, top, top_sims):
+                yield entry_id, [(ids[j], float(score)) for j, score in zip(neighbors, scores)]
+
+    def _insert(self, cursor, entry_id, neighbors):
+        cursor.executemany(
+            "INSERT INTO entry_neighbors (entry_id, rank, neighbor_id, score) VALUES (?, ?, ?, ?)",
+            [(entry_id, rank, neighbor_id, score) for rank, (neighbor_id, score) in enumerate(neighbors, start=1)],
+        )
+        floor = neighbors[-1][1] if len(neighbors) >= self.k else OPEN
+        cursor.execute("INSERT OR REPLACE INTO entry_neighbor_floor (entry_id, score) VALUES (?, ?)", (entry_id, floor))
+
+    def _write(self, cursor, entry_id, neighbors):
+        cursor.execute("DELETE FROM entry_neighbors WHERE entry_id = ?", (entry_id,))
+        self._insert(cursor, entry_id, neighbors)
+
+    def _remove(self, cursor, entry_id):
+        cursor.execute("DELETE FROM entry_neighbors WHERE entry_id = ?", (entry_id,))
+        cursor.execute("DELETE FROM entry_neighbor_floor WHERE entry_id = ?", (entry_id,))
+
+    def _save_state(self, cursor, version, last_seq):
+        cursor.execute("""
+            INSERT INTO related_graph_state (name, version, last_seq, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET version = excluded.version, last_seq = excluded.last_seq, updated_at = excluded.updated_at
+        """, (STATE_NAME, version, last_seq, datetime.now().isoformat()))
+
+    def _read_state(self, cursor):
+        return cursor.execute("SELECT version, last_seq FROM related_graph_state WHERE name = ?", (STATE_NAME,)).fetchone()
+
+    def build(self, conn, ids, matrix, last_seq, version):
+        """ Recompute the whole graph from a snapshot of the vector index """
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DELETE FROM entry_neighbors")
+            cursor.execute("DELETE FROM entry_neighbor_floor")
+            for entry_id, neighbors in self.top_k(ids, ids, matrix):
+                self._insert(cursor, entry_id, neighbors)
+            self._save_state(cursor, version, last_seq)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _apply_changes(self, conn, ids, matrix, last_seq, version, synced_seq):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # another worker process may have synced the graph in the meantime
+            state = self._read_state(cursor)
+            if state is None or state[0] != version or state[1] != synced_seq:
+                conn.rollback()
+                return False
+
+            changed = [row[0] for row in cursor.execute(
+                "SELECT entry_id FROM change_log WHERE seq > ? AND seq <= ?", (synced_seq, last_seq)
+            )]
+            positions = {entry_id: i for i, entry_id in enumerate(ids)}
+            changed_set = set(changed)
+            present = [entry_id for entry_id in changed if entry_id in positions]
+
+            stale = set()
+            for start in range(0, len(changed), 500):
+                chunk = changed[start:start + 500]
+                cursor.execute(
+                    "SELECT DISTINCT entry_id FROM entry_neighbors WHERE neighbor_id IN ({})".format(",".join("?" * len(chunk))),
+                    chunk,
+                )
+                stale.update(row[0] for row in cursor.fetchall())
+            for entry_id in changed_set - positions.keys():
+                self._remove(cursor, entry_id)
+
+            recompute = present + [entry_id for entry_id in stale - changed_set if entry_id in positions]
+            for entry_id, neighbors in self.top_k(recompute, ids, matrix):
+                self._write(cursor, entry_id, neighbors)
+
+            # every other list: only the ones whose floor a changed entry now beats (a range read on the score index)
+            skip = set(recompute)
+            merged_lists = 0
+            for start in range(0, len(present), self.block_size):
+                block = present[start:start + self.block_size]
+                columns = [positions[entry_id] for entry_id in block]
+                sims = matrix @ matrix[columns].T
+                sims[columns, np.arange(len(block))] = -np.inf  # an entry is not related to itself
+                best = sims.max(axis=1)
+                floors = cursor.execute(
+                    "SELECT entry_id, score FROM entry_neighbor_floor WHERE score < ?", (float(best.max()),)
+                ).fetchall()
+                rows = np.array([positions.get(entry_id, -1) for entry_id, _ in floors], dtype=np.int64)
+                scores = np.array([floor for _, floor in floors], dtype=np.float32)
+                beaten = np.flatnonzero((rows >= 0) & (best[rows] > scores))
+                for n in beaten:
+                    (entry_id, floor), i = floors[n], rows[n]
+                    if entry_id in skip:
+                        continue
+                    candidates = [(block[j], float(sims[i, j])) for j in np.flatnonzero(sims[i] > floor)]
+                    neighbors = cursor.execute(
+                        "SELECT neighbor_id, score FROM entry_neighbors WHERE entry_id = ? ORDER BY rank", (entry_id,)
+                    ).fetchall()
+                    merged = sorted(neighbors + candidates, key=lambda item: item[1], reverse=True)[:self.k]
+                    self._write(cursor, entry_id, merged)
+                    merged_lists += 1
+
+            self._save_state(cursor, version, last_seq)
+            conn.commit()
+            metrics.increment("related.updated_entries", len(changed))
+            metrics.increment("related.merged_lists", merged_lists)
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+    def update(self):
+        """ Bring the graph up to date with the db: incremental when possible, a full build otherwise """
+        with self._lock:
+            self.index.refresh()
+            ids, matrix, last_seq, version = self.index.snapshot()
+            conn = self.connect()
+            try:
+                state = self._read_state(conn.cursor())
+                if state is None or state[0] != version:
+                    self.build(conn, ids, matrix, last_seq, version)
+                elif state[1] < last_seq:
+                    self._apply_changes(conn, ids, matrix, last_seq, version, state[1])
+            finally:
+                conn.close()
+
+    def related(self, conn, entry_id, k=None):
+        """ The stored neighbours of an entry, best first """
+        return conn.execute("""
+            SELECT n.neighbor_id, n.score, e.title, e.date, e.summary
+            FROM entry_neighbors n JOIN journal_entries e ON e.id = n.neighbor_id
+            WHERE n.entry_id = ?
+            ORDER BY n.rank
+            LIMIT ?
+        """, (entry_id, k or self.k)).fetchall()
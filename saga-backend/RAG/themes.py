@@ -0,0 +1,188 @@
+# theme clusters over the summary embeddings, so prompt generation can send a short theme digest
+# instead of the raw text of recent entries (and the LLM no longer has to find the themes itself).
+#
+# build:  mini-batch k-means (sklearn) over the normalized vectors of the active model version.
+# update: follows change_log like the related-entries graph. A new or changed vector is assigned to its nearest
+#         centroid, which then moves towards it with a per-centroid learning rate of 1 / weight (the mini-batch
+#         k-means update). An entry that moves to another theme or is deleted is taken off its old theme's weight,
+#         one that stays in its theme is not counted again. Once the journal has doubled in size since the last
+#         build, or the model changed, the clusters are rebuilt from scratch.
+#
+# digest: the largest themes among recent, prompt-eligible entries, each with the summaries closest to its centroid.
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from services.sbert.embeddings_sbert import embedding_to_blob, embedding_from_blob
+from services.openAI.summaries import FALLBACK_SUMMARY
+from RAG.vector_index import normalize
+
+STATE_NAME = "summary_themes"
+
+
+class ThemeModel:
+    def __init__(self, db_path, index, n_themes=8, batch_size=256, min_entries=None):
+        self.db_path = db_path
+        self.index = index
+        self.n_themes = n_themes
+        self.batch_size = batch_size
+        # below this many entries themes are not meaningful, the digest stays empty
+        self.min_entries = min_entries if min_entries is not None else 2 * n_themes
+        self._lock = threading.Lock()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _read_state(self, cursor):
+        return cursor.execute(
+            "SELECT version, last_seq, built_size FROM theme_state WHERE name = ?", (STATE_NAME,)
+        ).fetchone()
+
+    def _save_state(self, cursor, version, last_seq, built_size):
+        cursor.execute("""
+            INSERT INTO theme_state (name, version, last_seq, built_size, updated_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET version = excluded.version, last_seq = excluded.last_seq,
+                built_size = excluded.built_size, updated_at = excluded.updated_at
+        """, (STATE_NAME, version, last_seq, built_size, datetime.now().isoformat()))
+
+    def build(self, conn, ids, matrix, last_seq, version):
+        """ Cluster every vector of the snapshot from scratch """
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DELETE FROM themes")
+            cursor.execute("DELETE FROM entry_themes")
+            if len(ids) >= self.min_entries:
+                kmeans = MiniBatchKMeans(
+                    n_clusters=self.n_themes, batch_size=self.batch_size, n_init=3, random_state=0
+                ).fit(matrix)
+                centroids = normalize(kmeans.cluster_centers_.astype(np.float32))
+                labels = kmeans.labels_
+                weights = np.bincount(labels, minlength=self.n_themes)
+                cursor.executemany(
+                    "INSERT INTO themes (theme_id, centroid, weight) VALUES (?, ?, ?)",
+                    [(theme_id, embedding_to_blob(centroids[theme_id]), int(weights[theme_id])) for theme_id in range(self.n_themes)],
+                )
+                similarities = np.einsum("ij,ij->i", matrix, centroids[labels])
+                cursor.executemany(
+                    "INSERT INTO entry_themes (entry_id, theme_id, similarity) VALUES (?, ?, ?)",
+                    [(entry_id, int(label), float(similarity)) for entry_id, label, similarity in zip(ids, labels, similarities)],
+                )
+            self._save_state(cursor, version, last_seq, len(ids))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _apply_changes(self, conn, ids, matrix, last_seq, version, synced_seq, built_size):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            state = self._read_state(cursor)
+            if state is None or state[0] != version or state[1] != synced_seq:
+                conn.rollback()
+                return False
+
+            changed = [row[0] for row in cursor.execute(
+                "SELECT entry_id FROM change_log WHERE seq > ? AND seq <= ?", (synced_seq, last_seq)
+            )]
+            positions = {entry_id: i for i, entry_id in enumerate(ids)}
+            themes = cursor.execute("SELECT theme_id, centroid, weight FROM themes ORDER BY theme_id").fetchall()
+            theme_ids = [row[0] for row in themes]
+            centroids = np.vstack([embedding_from_blob(row[1]) for row in themes]).copy() if themes else None
+            weights = [row[2] for row in themes]
+            theme_positions = {theme_id: i for i, theme_id in enumerate(theme_ids)}
+            moved = set()
+
+            for entry_id in changed:
+                row = cursor.execute("SELECT theme_id FROM entry_themes WHERE entry_id = ?", (entry_id,)).fetchone()
+                previous = theme_positions.get(row[0]) if row else None
+                if entry_id not in positions or centroids is None:
+                    if previous is not None:
+                        weights[previous] = max(weights[previous] - 1, 0)
+                        moved.add(previous)
+                    cursor.execute("DELETE FROM entry_themes WHERE entry_id = ?", (entry_id,))
+                    continue
+                vector = matrix[positions[entry_id]]
+                nearest = int(np.argmax(centroids @ vector))
+                if nearest == previous:
+                    # already a member (often not even a new vector, e.g. an edited title): only the similarity
+                    cursor.execute(
+                        "UPDATE entry_themes SET similarity = ? WHERE entry_id = ?",
+                        (float(centroids[nearest] @ vector), entry_id),
+                    )
+                    continue
+                if previous is not None:
+                    weights[previous] = max(weights[previous] - 1, 0)
+                    moved.add(previous)
+                weights[nearest] += 1
+                rate = 1.0 / weights[nearest]
+                centroids[nearest] = normalize((1.0 - rate) * centroids[nearest] + rate * vector)
+                moved.add(nearest)
+                cursor.execute(
+                    "INSERT OR REPLACE INTO entry_themes (entry_id, theme_id, similarity) VALUES (?, ?, ?)",
+                    (entry_id, theme_ids[nearest], float(centroids[nearest] @ vector)),
+                )
+
+            cursor.executemany(
+                "UPDATE themes SET centroid = ?, weight = ? WHERE theme_id = ?",
+                [(embedding_to_blob(centroids[i]), weights[i], theme_ids[i]) for i in moved],
+            )
+            self._save_state(cursor, version, last_seq, built_size)
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+    def update(self):
+        """ Bring the themes up to date with the db: incremental when possible, a rebuild otherwise """
+        with self._lock:
+            self.index.refresh()
+            ids, matrix, last_seq, version = self.index.snapshot()
+            conn = self.connect()
+            try:
+                state = self._read_state(conn.cursor())
+                if (state is None or state[0] != version
+                        or len(ids) > 2 * state[2]
+                        or (state[2] < self.min_entries <= len(ids))):
+                    self.build(conn, ids, matrix, last_seq, version)
+                elif state[1] < last_seq:
+                    self._apply_changes(conn, ids, matrix, last_seq, version, state[1], state[2])
+            finally:
+                conn.close()
+
+    def themes(self, conn, since_epoch=None, max_themes=5, representatives=3):
+        """ Largest themes among prompt-eligible entries (dated since_epoch or later), with representative summaries """
+        filters = "e.use_for_prompt_generation = 1 AND e.summary IS NOT NULL AND e.summary != ?"
+        params = [FALLBACK_SUMMARY]
+        if since_epoch is not None:
+            filters += " AND e.date_epoch >= ?"
+            params.append(since_epoch)
+        sizes = conn.execute(f"""
+            SELECT t.theme_id, COUNT(*) FROM entry_themes t JOIN journal_entries e ON e.id = t.entry_id
+            WHERE {filters}
+            GROUP BY t.theme_id ORDER BY COUNT(*) DESC, t.theme_id LIMIT ?
+        """, (*params, max_themes)).fetchall()
+        result = []
+        for theme_id, size in sizes:
+            summaries = conn.execute(f"""
+                SELECT e.summary FROM entry_themes t JOIN journal_entries e ON e.id = t.entry_id
+                WHERE t.theme_id = ? AND {filters}
+                ORDER BY t.similarity DESC LIMIT ?
+            """, (theme_id, *params, representatives)).fetchall()
+            result.append({"theme_id": theme_id, "size": size, "summaries": [row[0] for row in summaries]})
+        return result
+
+    def digest(self, conn, window_days=90, max_themes=5, representatives=3):
+        """ Compact text for the prompt: one line per theme. Empty when there are no themes (yet) """
+        since_epoch = int(time.time()) - window_days * 86400 if window_days else None
+        lines = [
+            f"- {theme['size']} entries: " + " | ".join(theme["summaries"])
+            for theme in self.themes(conn, since_epoch, max_themes, representatives)
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,144 @@
+# in-memory index of the summary embeddings of the active model version.
+# keeps an (n, dim) matrix of L2-normalized vectors, so cosine similarity for a query is one matrix-vector product.
+#
+# the index follows the database through change_log (see services/db/migrations.py): before each search it reads
+# the rows that changed since the last seq it has seen and reloads only those. That also picks up writes made by
+# other processes and by background jobs (backfill, re-embedding). A model switch triggers a full reload.
+import sqlite3
+import threading
+
+import numpy as np
+
+from services.sbert.embeddings_sbert import embedding_from_blob
+from services.metrics.tracker import metrics
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    def __init__(self, db_path, registry):
+        self.db_path = db_path
+        self.registry = registry
+        self.version = None
+        self.last_seq = 0
+        self.ids = []
+        self.positions = {}
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _load_all(self, version):
+        cursor = self._conn.cursor()
+        self.last_seq = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        rows = cursor.execute(
+            "SELECT id, summaryEmbedding FROM journal_entries WHERE summaryEmbedding IS NOT NULL AND embeddingModel = ?",
+            (version,),
+        ).fetchall()
+        self.ids = [row[0] for row in rows]
+        self.positions = {entry_id: i for i, entry_id in enumerate(self.ids)}
+        if rows:
+            self.matrix = normalize(np.vstack([embedding_from_blob(row[1]) for row in rows]))
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.version = version
+
+    def _remove(self, entry_id):
+        # swap with the last row, so removal does not shift the whole matrix
+        position = self.positions.pop(entry_id)
+        last = len(self.ids) - 1
+        if position != last:
+            moved = self.ids[last]
+            self.ids[position] = moved
+            self.matrix[position] = self.matrix[last]
+            self.positions[moved] = position
+        self.ids.pop()
+        self.matrix = self.matrix[:last]
+
+    def _append(self, entry_ids, vectors):
+        # one vstack per catch-up: stacking row by row would copy the whole matrix for every new entry
+        block = np.vstack(vectors)
+        self.matrix = block if self.matrix.size == 0 else np.vstack([self.matrix, block])
+        for entry_id in entry_ids:
+            self.positions[entry_id] = len(self.ids)
+            self.ids.append(entry_id)
+
+    def _catch_up(self):
+        """ Apply the changes logged since last_seq. Returns the ids that changed """
+        cursor = self._conn.cursor()
+        changes = cursor.execute(
+            "SELECT entry_id, seq FROM change_log WHERE seq > ? ORDER BY seq", (self.last_seq,)
+        ).fetchall()
+        if not changes:
+            return []
+        changed_ids = [change[0] for change in changes]
+        rows = {}
+        for start in range(0, len(changed_ids), 500):
+            chunk = changed_ids[start:start + 500]
+            cursor.execute(
+                "SELECT id, summaryEmbedding, embeddingModel FROM journal_entries WHERE id IN ({})".format(",".join("?" * len(chunk))),
+                chunk,
+            )
+            rows.update({row[0]: row for row in cursor.fetchall()})
+        new_ids, new_vectors = [], []
+        for entry_id in changed_ids:  # change_log has one row per entry, so no id comes twice
+            row = rows.get(entry_id)
+            if row is not None and row[1] is not None and row[2] == self.version:
+                vector = normalize(embedding_from_blob(row[1]).astype(np.float32))
+                if entry_id in self.positions:
+                    self.matrix[self.positions[entry_id]] = vector
+                else:
+                    new_ids.append(entry_id)
+                    new_vectors.append(vector)
+            elif entry_id in self.positions:
+                self._remove(entry_id)
+        if new_ids:
+            self._append(new_ids, new_vectors)
+        self.last_seq = changes[-1][1]
+        return changed_ids
+
+    def refresh(self):
+        """ Bring the index up to date with the db. Returns the changed ids, or None after a full reload """
+        with self._lock:
+            version = self.registry.active_version()
+            if version != self.version:
+                self._load_all(version)
+                return None
+            return self._catch_up()
+
+    def snapshot(self):
+        """ (ids, matrix, last_seq, version) as of now, safe to use without holding the lock """
+        with self._lock:
+            return list(self.ids), self.matrix.copy(), self.last_seq, self.version
+
+    def vector(self, entry_id):
+        with self._lock:
+            position = self.positions.get(entry_id)
+            return None if position is None else self.matrix[position].copy()
+
+    def search(self, query_embedding, k=10, allowed_ids=None, version=None):
+        """
+        Top-k (id, cosine similarity), optionally restricted to allowed_ids. If version is given (the model version
+        the query was encoded with) and the index holds another one, there are no hits: the vectors do not compare
+        """
+        self.refresh()
+        with self._lock:
+            if version is not None and version != self.version:
+                metrics.increment("vector_index.version_mismatch")
+                return []
+            if not self.ids:
+                return []
+            scores = self.matrix @ normalize(np.asarray(query_embedding, dtype=np.float32))
+            ids = self.ids
+            if allowed_ids is not None:
+                mask = np.fromiter((entry_id in allowed_ids for entry_id in ids), dtype=bool, count=len(ids))
+                scores = np.where(mask, scores, -np.inf)
+            k = min(k, len(ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(ids[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
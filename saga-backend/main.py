@@ -1,5 +1,8 @@
 from urllib import request
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Query, Header, Response, Depends
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,19 +10,50 @@ import openai
 import os
 from dotenv import load_dotenv
 import uuid
+import hmac
+import json
+import time
 from datetime import datetime
 import sqlite3
 from sklearn.metrics.pairwise import cosine_similarity
 
 # import from other folders
-from services.sbert.embeddings_sbert import get_embedding, embedding_to_blob, embedding_from_blob  # the embedding function for db
+from services.sbert.embeddings_sbert import MODEL_NAME, get_embedding, embedding_to_blob, embedding_from_blob, inference  # the embedding function for db
+from services.sbert.inference_pool import InferenceSaturatedError
+from services.sbert.model_registry import ModelRegistry
+from services.backfill.backfill import BackfillJob
+from services.db.migrations import migrate
+from services.db.writer import GroupCommitWriter
+from services.db.compression import codec_for, codec_from_env, set_fts_decoding
+from services.db.backup import BackupJob, list_backups
+from services.db.idempotency import IdempotencyStore, IdempotencyConflict, REPLAY
+from services.db.queries import is_valid_date, date_filters, keyset_page, encode_cursor, current_seq, etag_for, etag_matches
 from services.openAI.system_messages import reflective_mode, daily_mode, creative_mode
+from services.openAI.llm_client import LLMClient, CircuitBreaker, LLMUnavailableError
+from services.openAI.summaries import summarize, FALLBACK_SUMMARY
+from services.openAI.prompt_pool import PromptPool, PROMPT_TYPES
+from services.metrics.tracker import metrics
+from RAG.vector_index import VectorIndex
+from RAG.hybrid_search import HybridSearcher
+from RAG.related import RelatedGraph
+from RAG.themes import ThemeModel
+from RAG.derived import DerivedRefresher
 
 # load env variables
 load_dotenv()
 
-# init openai client
-client = openai.OpenAI()
+# init openai client (retries are handled by the LLMClient wrapper, not by the SDK)
+client = openai.OpenAI(max_retries=0)
+llm = LLMClient(
+    client,
+    timeout=float(os.getenv("SAGA_LLM_TIMEOUT", "20")),
+    max_retries=int(os.getenv("SAGA_LLM_MAX_RETRIES", "2")),
+    hedge=os.getenv("SAGA_LLM_HEDGE", "true").lower() == "true",
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("SAGA_LLM_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("SAGA_LLM_BREAKER_RESET", "30")),
+    ),
+)
 
 # init FastAPI app
 app = FastAPI()
@@ -36,8 +70,20 @@ app.add_middleware(
     allow_headers=[
         "*"
     ],
+    # readable by the frontend: conditional GET / sync and back-off hints
+    expose_headers=["ETag", "X-Change-Seq", "Retry-After", "Idempotent-Replayed"],
 )
 
+# the embedding executor is full: tell the client to back off instead of queueing more torch work
+@app.exception_handler(InferenceSaturatedError)
+def inference_saturated_handler(request: Request, exc: InferenceSaturatedError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # ensure correct data types w. pydantic
 class JournalEntry(BaseModel):
     id: Optional[str] = None
@@ -52,25 +98,104 @@ class JournalEntry(BaseModel):
 
 
 # create connection and cursor
-conn = sqlite3.connect('journal.db', check_same_thread=False) # the connection between the app and the db
+DB_PATH = os.getenv("SAGA_DB_PATH", "journal.db")
+conn = sqlite3.connect(DB_PATH, check_same_thread=False) # the connection between the app and the db
 cursor = conn.cursor() # the object that executes SQL commands (translator)
+# WAL: background jobs use their own connections, readers and the writer should not block each other
+cursor.execute("PRAGMA journal_mode=WAL").fetchall()
+
+# create / upgrade the tables (versioned migrations, see services/db/migrations.py)
+migrate(conn)
+
+# optional compression of entry content at rest (SAGA_COMPRESS_CONTENT=zlib|zstd, see services/db/compression.py).
+# SQL reads the text through saga_content(content), which handles plain and compressed rows alike
+CONTENT_COMPRESSION = codec_from_env()
+content_codec = codec_for(conn)
+if CONTENT_COMPRESSION:
+    # the FTS triggers have to decode compressed rows from now on
+    set_fts_decoding(conn, True)
+
+# all entry writes go through one writer thread that commits them in small batches (one fsync per batch).
+# the shared connection above is only used for reads
+writer = GroupCommitWriter(
+    DB_PATH,
+    max_batch=int(os.getenv("SAGA_WRITE_MAX_BATCH", "64")),
+    max_wait_ms=float(os.getenv("SAGA_WRITE_WINDOW_MS", "2")),
+).start()
+
+# responses of requests sent with an Idempotency-Key header, so a client retry does not redo the LLM work
+idempotency = IdempotencyStore(DB_PATH, writer, ttl=float(os.getenv("SAGA_IDEMPOTENCY_TTL", str(24 * 3600))))
+
+# embedding model versions (tags every stored embedding, runs re-embedding when the model changes)
+registry = ModelRegistry(DB_PATH, writer=writer)
+registry.bootstrap()
+registry.start_reembedding()  # resumes an interrupted re-embedding job, if any
+
+# search: in-memory vectors of the active model (kept current through change_log) + FTS5 for the lexical side
+vector_index = VectorIndex(DB_PATH, registry)
+searcher = HybridSearcher(DB_PATH, vector_index)
+
+# related entries: kNN graph over the summary embeddings, kept current in the background after writes
+related = RelatedGraph(DB_PATH, vector_index, k=int(os.getenv("SAGA_RELATED_K", "10")))
+# themes: clusters of the summary embeddings, for the compact prompt context (see build_prompt_messages)
+theme_model = ThemeModel(DB_PATH, vector_index, n_themes=int(os.getenv("SAGA_THEMES", "8")))
+# "entries" sends the recent entries to the LLM as they are, "themes" sends the theme digest instead
+PROMPT_CONTEXT = os.getenv("SAGA_PROMPT_CONTEXT", "entries")
+THEME_WINDOW_DAYS = int(os.getenv("SAGA_THEME_WINDOW_DAYS", "90"))
+
+
+# writes only ask for a refresh: one background thread catches both up after a burst of writes settles
+# (SAGA_DERIVED_DEBOUNCE_MS), the initial build and the rebuild after a model switch run there too
+derived = DerivedRefresher(
+    {"related": related, "themes": theme_model},
+    debounce_ms=float(os.getenv("SAGA_DERIVED_DEBOUNCE_MS", "200")),
+).start()
+
+
+def refresh_derived():
+    derived.request()
+
+
+refresh_derived()
+
+# pre-generated prompts for default requests (no customPrompt). Off unless SAGA_PROMPT_POOL_SIZE > 0:
+# every pooled prompt is an LLM call made ahead of time, some are thrown away when the entries change
+PROMPT_POOL_SIZE = int(os.getenv("SAGA_PROMPT_POOL_SIZE", "0"))
+prompt_pool = PromptPool(llm, size=PROMPT_POOL_SIZE) if PROMPT_POOL_SIZE > 0 else None
+# the frontend sends its newest entries as recentEntries, the pool is prefilled with the same context
+PROMPT_POOL_RECENT = int(os.getenv("SAGA_PROMPT_POOL_RECENT", "3"))
+
+
+def run_idempotent(scope, key, payload, handler):
+    """
+    Run handler() at most once per Idempotency-Key: a retry gets the stored response, and waits for it
+    if the first request is still running. Without a key, handler() just runs.
+    """
+    if not key:
+        return handler()
+    try:
+        outcome, stored = idempotency.begin(key, scope, payload)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if outcome == REPLAY:
+        status_code, body = stored
+        return JSONResponse(status_code=status_code, content=body, headers={"Idempotent-Replayed": "true"})
 
-# create table if it doesn't exist (only runs once, even when restarting the app)
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS journal_entries (
-    id TEXT PRIMARY KEY,
-    title TEXT NOT NULL,
-    content TEXT NOT NULL,
-    date DATETIME DEFAULT CURRENT_TIMESTAMP,
-    summary TEXT DEFAULT NULL,
-    prompt TEXT DEFAULT NULL,
-    promptType TEXT DEFAULT NULL,
-    summaryEmbedding BLOB,
-    use_for_prompt_generation BOOLEAN DEFAULT TRUE
-);
-""")
-conn.commit() # save changes
-
+    try:
+        result = handler()
+    except HTTPException as e:
+        # client errors are answers too (e.g. 404), server errors and overload are worth a real retry
+        if e.status_code < 500:
+            idempotency.settle(key, scope, e.status_code, {"detail": e.detail})
+        else:
+            idempotency.abort(key, scope)
+        raise
+    except Exception:
+        idempotency.abort(key, scope)
+        raise
+    # the work is done: the response goes back even if it could not be stored (the key is released then)
+    idempotency.settle(key, scope, 200, jsonable_encoder(result))
+    return result
 
 
 @app.get("/") # home route
@@ -79,40 +204,54 @@ def home():
 
 
 # POST: add new entry to the .db database
+# send an Idempotency-Key header to make retries safe: the entry is created (and summarized) only once
 @app.post("/journal/")
-def add_entry(entry: JournalEntry):
+def add_entry(entry: JournalEntry, idempotency_key: Optional[str] = Header(None, max_length=255)):
+    payload = entry.model_dump(exclude={"summaryEmbedding"})
+    return run_idempotent("POST /journal/", idempotency_key, payload, lambda: create_entry(entry))
+
+
+def check_date(date):
+    # date_epoch (date filters, paging order) is derived from date by SQLite, it has to be able to parse it
+    if date and not is_valid_date(date):
+        raise HTTPException(status_code=422, detail="date must be an ISO date or datetime, e.g. 2025-11-17T09:30:00")
+
+
+def create_entry(entry: JournalEntry):
+    check_date(entry.date)
     entry.id = str(uuid.uuid4())
     if not entry.date:
         entry.date = datetime.now().isoformat()
 
-    prompt_text = f"Summarize this journal post in one short sentence, in the second person in past tense: \"{entry.content}\""
-
+    embedding_model = None
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You summarize journal entries in a single sentence."},
-                {"role": "user", "content": prompt_text}
-            ],
-            max_tokens=60
-        )
-        summary_text = response.choices[0].message.content.strip()
-        entry.summary = summary_text
-
-        # generate embedding for the summary
-        embedding = get_embedding(entry.summary)
-        #entry.summaryEmbedding = embedding.tobytes() # sqllite does not support numpy.ndarray. Convert to bytes for storage
-        entry.summaryEmbedding = embedding_to_blob(embedding) # alternative way to convert to blob
-    
+        entry.summary = summarize(llm, entry.content)
     except Exception as e:
         print(f"Error calling OpenAI API: {e}")
-        entry.summary = "Could not generate summary."
+        entry.summary = FALLBACK_SUMMARY  # summary and embedding are filled in later by the backfill job
 
-    
-    # insert the new entry into the database
-    cursor.execute("INSERT INTO journal_entries (id, title, content, date, summary, prompt, promptType, summaryEmbedding, use_for_prompt_generation) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-                   (entry.id, entry.title, entry.content, entry.date, entry.summary, entry.prompt, entry.promptType, entry.summaryEmbedding, entry.use_for_prompt_generation))
-    conn.commit()
+    if entry.summary != FALLBACK_SUMMARY:
+        # generate embedding for the summary, with the model its version tag names
+        version, model_name = registry.active_model()
+        try:
+            embedding = get_embedding(entry.summary, model_name=model_name)
+            #entry.summaryEmbedding = embedding.tobytes() # sqllite does not support numpy.ndarray. Convert to bytes for storage
+            entry.summaryEmbedding = embedding_to_blob(embedding) # alternative way to convert to blob
+            embedding_model = version
+        except Exception as e:
+            # the summary is already paid for: store it without a vector, the backfill job embeds it later
+            if not isinstance(e, InferenceSaturatedError):
+                print(f"Error embedding the summary: {e}")
+            metrics.increment("entries.embedding_deferred")
+
+    # insert the new entry into the database (returns once it is committed)
+    writer.execute(lambda write_cursor: write_cursor.execute(
+        "INSERT INTO journal_entries (id, title, content, date, summary, prompt, promptType, summaryEmbedding, use_for_prompt_generation, embeddingModel) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
+        (entry.id, entry.title, content_codec.encode(entry.content, CONTENT_COMPRESSION), entry.date, entry.summary, entry.prompt, entry.promptType, entry.summaryEmbedding, entry.use_for_prompt_generation, embedding_model)
+    ))
+    if entry.summaryEmbedding is not None:
+        refresh_derived()
+    refill_prompt_pool()
 
     # return entry without embedding (internal only)
     entry_dict = entry.model_dump()
@@ -120,82 +259,206 @@ def add_entry(entry: JournalEntry):
 
     return {"message": "Entry added with summary", "entry": entry_dict}
 
-#GET: fetch all entries from the .db database
+#GET: fetch entries from the .db database
+# optional server-side filters, all index-backed:
+#   start / end      ISO date or datetime, inclusive ("last 30 days")
+#   month / day      month (1-12) and/or day of month (1-31) in any year ("on this day")
+#   limit / cursor   page size and the next_cursor of the previous page (most recent N = just limit)
+#   sort             "desc" (newest first, default) or "asc"
+#   include_content  false leaves content out (null): list views that only show titles/summaries skip reading it
+# responses carry an ETag (the current change seq): send it back as If-None-Match to get a 304 when nothing changed,
+# X-Change-Seq is the `since` to use for GET /journal/changes afterwards
 @app.get("/journal/")
-def get_entries(search: Optional[str] = None):
+def get_entries(
+    response: Response,
+    search: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    month: Optional[int] = Query(None, ge=1, le=12),
+    day: Optional[int] = Query(None, ge=1, le=31),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor_value: Optional[str] = Query(None, alias="cursor"),
+    sort: str = Query("desc", pattern="^(asc|desc)$"),
+    include_content: bool = True,
+    if_none_match: Optional[str] = Header(None),
+):
+    try:
+        clauses, params = date_filters(start, end, month, day)
+        order_by = keyset_page(clauses, params, sort, cursor_value)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # read before the query: a write in between makes the tag older than the data, never newer
+    seq = current_seq(cursor)
+    sync_headers = {"ETag": etag_for(seq), "X-Change-Seq": str(seq), "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, sync_headers["ETag"]):
+        return Response(status_code=304, headers=sync_headers)
+    response.headers.update(sync_headers)
     if search:
-        cursor.execute("SELECT id, title, content, date, summary, prompt, promptType, use_for_prompt_generation FROM journal_entries WHERE title LIKE ? OR content LIKE ?", (f"%{search}%", f"%{search}%"))
-    else:
-        cursor.execute("SELECT id, title, content, date, summary, prompt, promptType, use_for_prompt_generation FROM journal_entries")
+        clauses.append("(title LIKE ? OR saga_content(content) LIKE ?)")
+        params.extend([f"%{search}%", f"%{search}%"])
+
+    content_column = "saga_content(content)" if include_content else "NULL"
+    sql = f"SELECT id, title, {content_column}, date, summary, prompt, promptType, use_for_prompt_generation, date_epoch FROM journal_entries"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " " + order_by
+    if limit:
+        # one extra row tells us whether there is a next page
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    cursor.execute(sql, params)
     rows = cursor.fetchall()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][8], rows[-1][0])
     entries = [{"id": row[0], "title": row[1], "content": row[2], "date": row[3], "summary": row[4], "prompt": row[5], "promptType": row[6], "use_for_prompt_generation": row[7]} for row in rows]
     conn.commit()
-    return {"entries": entries}
+    return {"entries": entries, "next_cursor": next_cursor}
+
+
+# GET: change feed for incremental sync. Everything written after `since` (a seq from X-Change-Seq or next_since),
+# in write order: the current version of changed entries ("upsert") and tombstones of deleted ones ("delete").
+# an entry that changed several times appears once, with its latest seq.
+@app.get("/journal/changes")
+def get_changes(
+    response: Response,
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    if_none_match: Optional[str] = Header(None),
+):
+    seq = current_seq(cursor)
+    sync_headers = {"ETag": etag_for(seq), "X-Change-Seq": str(seq), "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, sync_headers["ETag"]):
+        return Response(status_code=304, headers=sync_headers)
+    response.headers.update(sync_headers)
+
+    cursor.execute("""
+        SELECT c.seq, c.op, c.entry_id, e.title, saga_content(e.content), e.date, e.summary, e.prompt, e.promptType, e.use_for_prompt_generation
+        FROM change_log c LEFT JOIN journal_entries e ON e.id = c.entry_id
+        WHERE c.seq > ?
+        ORDER BY c.seq
+        LIMIT ?
+    """, (since, limit + 1))
+    rows = cursor.fetchall()
+    conn.commit()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes = []
+    for row in rows:
+        if row[1] == "delete" or row[3] is None:
+            changes.append({"seq": row[0], "op": "delete", "id": row[2]})
+        else:
+            entry = {"id": row[2], "title": row[3], "content": row[4], "date": row[5], "summary": row[6], "prompt": row[7], "promptType": row[8], "use_for_prompt_generation": row[9]}
+            changes.append({"seq": row[0], "op": "upsert", "entry": entry})
+    return {
+        "changes": changes,
+        "next_since": rows[-1][0] if rows else since,
+        "has_more": has_more,
+    }
+
+
+# GET: hybrid search. Lexical (bm25) and semantic (embedding top-k) retrieval run in parallel and are fused
+# with reciprocal-rank fusion. Takes the same temporal filters as GET /journal/, plus promptType.
+@app.get("/journal/search")
+def search_entries(
+    q: str = Query(..., min_length=1),
+    k: int = Query(10, ge=1, le=100),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    month: Optional[int] = Query(None, ge=1, le=12),
+    day: Optional[int] = Query(None, ge=1, le=31),
+    promptType: Optional[str] = None,
+):
+    try:
+        clauses, params = date_filters(start, end, month, day)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if promptType:
+        clauses.append("promptType = ?")
+        params.append(promptType)
+    return searcher.search(q, clauses, params, k=k)
 
 
 # PUT: update an existing entry in the .db database
 @app.put("/journal/{entry_id}")
-def update_entry(entry_id: str, updated_entry: JournalEntry):
+def update_entry(entry_id: str, updated_entry: JournalEntry, idempotency_key: Optional[str] = Header(None, max_length=255)):
+    payload = updated_entry.model_dump(exclude={"summaryEmbedding"})
+    return run_idempotent(f"PUT /journal/{entry_id}", idempotency_key, payload, lambda: apply_update(entry_id, updated_entry))
+
+
+def apply_update(entry_id: str, updated_entry: JournalEntry):
     # fetch the original entry from the database
-    cursor.execute("SELECT content, summary, prompt, promptType FROM journal_entries WHERE id = ?", (entry_id,))
+    cursor.execute("SELECT saga_content(content), summary, prompt, promptType FROM journal_entries WHERE id = ?", (entry_id,))
     original_entry_row = cursor.fetchone()
 
     if not original_entry_row:
         raise HTTPException(status_code=404, detail="Entry not found")
+    check_date(updated_entry.date)
 
     original_content, original_summary, original_prompt, original_promptType = original_entry_row
 
     new_summary = original_summary
     # if the content has changed, generate a new summary
     if updated_entry.content != original_content:
-        prompt_text = f"""Summarize this journal post in one short sentence, in the second person in past tense: \"{updated_entry.content}\""""
         try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You summarize journal entries in a single sentence."},
-                    {"role": "user", "content": prompt_text}
-                ],
-                max_tokens=60
-            )
-            new_summary = response.choices[0].message.content.strip()
+            new_summary = summarize(llm, updated_entry.content)
         except Exception as e:
             print(f"Error calling OpenAI API: {e}")
-            new_summary = "Could not generate summary."
+            new_summary = FALLBACK_SUMMARY
 
-    new_embedding = None
+    entry_date = updated_entry.date if updated_entry.date else datetime.now().isoformat()
+    columns = {
+        "title": updated_entry.title,
+        "content": content_codec.encode(updated_entry.content, CONTENT_COMPRESSION),
+        "summary": new_summary,
+        "date": entry_date,
+        "prompt": updated_entry.prompt,
+        "promptType": updated_entry.promptType,
+        "use_for_prompt_generation": updated_entry.use_for_prompt_generation,
+    }
+    # the stored embedding is only replaced when the summary changed
     if new_summary != original_summary:
-        embedding = get_embedding(new_summary)
-        new_embedding = embedding.tobytes()
+        columns["summaryEmbedding"] = None
+        columns["embeddingModel"] = None
+        # the fallback text is not worth embedding, the backfill job retries the summary later
+        if new_summary != FALLBACK_SUMMARY:
+            version, model_name = registry.active_model()
+            try:
+                columns["summaryEmbedding"] = embedding_to_blob(get_embedding(new_summary, model_name=model_name))
+                columns["embeddingModel"] = version
+            except Exception as e:
+                # as in create_entry: keep the new summary, the backfill job embeds it later
+                if not isinstance(e, InferenceSaturatedError):
+                    print(f"Error embedding the summary: {e}")
+                metrics.increment("entries.embedding_deferred")
 
     # update the database with the new content and summary
-    cursor.execute(
-        """
-        UPDATE journal_entries
-        SET title = ?, content = ?, summary = ?, date = ?, prompt = ?, promptType = ?, summaryEmbedding = ?, use_for_prompt_generation = ?
-        WHERE id = ?
-        """,
-        (updated_entry.title,
-         updated_entry.content,
-         new_summary,
-         updated_entry.date if updated_entry.date else datetime.now().isoformat(),
-         updated_entry.prompt,
-         updated_entry.promptType,
-         new_embedding,
-         updated_entry.use_for_prompt_generation,
-         entry_id)
-    )
-    conn.commit()
+    def write_update(write_cursor):
+        write_cursor.execute(
+            "UPDATE journal_entries SET {} WHERE id = ?".format(", ".join(f"{column} = ?" for column in columns)),
+            (*columns.values(), entry_id)
+        )
+        updated = write_cursor.rowcount
+        if "summaryEmbedding" in columns:
+            registry.invalidate(entry_id, write_cursor.connection)
+        return updated
 
-    if cursor.rowcount == 0:
+    if writer.execute(write_update) == 0:
         raise HTTPException(status_code=404, detail="Entry not found")
+    if "summaryEmbedding" in columns:
+        refresh_derived()
+    refill_prompt_pool()
     
     updated_entry_dict = {
         "id": entry_id,
         "title": updated_entry.title,
         "content": updated_entry.content,
         "summary": new_summary,
-        "date": updated_entry.date if updated_entry.date else datetime.now().isoformat(),
+        "date": entry_date,
         "prompt": updated_entry.prompt,
         "promptType": updated_entry.promptType,
         "use_for_prompt_generation": updated_entry.use_for_prompt_generation
@@ -208,22 +471,38 @@ def update_entry(entry_id: str, updated_entry: JournalEntry):
 # DELETE: delete an entry from the .db database
 @app.delete("/journal/{entry_id}")
 def delete_entry(entry_id: str):
-    cursor.execute("DELETE FROM journal_entries WHERE id = ?", (entry_id,))
-    conn.commit()
+    def write_delete(write_cursor):
+        write_cursor.execute("DELETE FROM journal_entries WHERE id = ?", (entry_id,))
+        deleted = write_cursor.rowcount
+        registry.invalidate(entry_id, write_cursor.connection)
+        return deleted
 
-    if cursor.rowcount == 0:
+    if writer.execute(write_delete) == 0:
         raise HTTPException(status_code=404, detail="Entry not found")
+    refresh_derived()
+    refill_prompt_pool()
 
     return {"message": f"Entry with id {entry_id} deleted successfully"}
 
+
+# GET: entries related to this one (nearest summaries), read from the precomputed neighbour graph
+@app.get("/journal/{entry_id}/related")
+def get_related_entries(entry_id: str, k: Optional[int] = Query(None, ge=1, le=50)):
+    cursor.execute("SELECT 1 FROM journal_entries WHERE id = ?", (entry_id,))
+    if cursor.fetchone() is None:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    rows = related.related(conn, entry_id, k)
+    conn.commit()
+    return {"related": [{"id": row[0], "score": round(row[1], 4), "title": row[2], "date": row[3], "summary": row[4]} for row in rows]}
+
 class PromptRequest(BaseModel):
     promptType: str
     recentEntries: List[JournalEntry]
     customPrompt: Optional[str] = None
+    context: Optional[str] = None  # "entries" or "themes", defaults to SAGA_PROMPT_CONTEXT
 
-# POST II: generate a writing prompt based on query (RAG)
-@app.post("/generate-prompt")
-def generate_prompt(request: PromptRequest):
+# build the system + user messages for prompt generation (shared by the normal and the streaming endpoint)
+def build_prompt_messages(request: PromptRequest):
     # ----- SYSTEM MESSAGE -----
     if request.promptType == "reflective":
         system_message = reflective_mode
@@ -247,13 +526,15 @@ def generate_prompt(request: PromptRequest):
     # ----- OPTIONAL RAG FOR CUSTOM PROMPT -----
     similar_contents_text = ""
     if request.customPrompt:
-        query_embedding = get_embedding(user_message)
+        version, model_name = registry.active_model()
+        query_embedding = get_embedding(user_message, model_name=model_name)
 
+        # only compare against vectors from the model the query was embedded with
         cursor.execute("""
             SELECT id, summaryEmbedding
             FROM journal_entries
-            WHERE use_for_prompt_generation = 1
-        """)
+            WHERE use_for_prompt_generation = 1 AND summaryEmbedding IS NOT NULL AND embeddingModel = ?
+        """, (version,))
 
         rows = cursor.fetchall()
 
@@ -272,7 +553,7 @@ def generate_prompt(request: PromptRequest):
             top_similar_entries = similar_entries[:5]
 
             cursor.execute(
-                "SELECT content FROM journal_entries WHERE id IN ({seq})".format(
+                "SELECT saga_content(content) FROM journal_entries WHERE id IN ({seq})".format(
                     seq=",".join(["?"] * len(top_similar_entries))
                 ),
                 tuple([entry[0] for entry in top_similar_entries]),
@@ -280,8 +561,15 @@ def generate_prompt(request: PromptRequest):
             similar_contents = cursor.fetchall()
             similar_contents_text = "\n".join([content[0] for content in similar_contents])
 
+    # ----- THEME DIGEST INSTEAD OF THE RAW ENTRIES -----
+    theme_digest = ""
+    if (request.context or PROMPT_CONTEXT) == "themes" and not similar_contents_text:
+        theme_digest = theme_model.digest(conn, window_days=THEME_WINDOW_DAYS)
+
     # ----- ATTACH CONTEXT FROM ENTRIES -----
-    if request.recentEntries:
+    if theme_digest:
+        user_message += f"\n\nThemes in recent entries (number of entries: representative summaries):\n{theme_digest}"
+    elif request.recentEntries:
         # only include entries marked for prompt generation
         filtered_recent_entries = [
             e for e in request.recentEntries 
@@ -299,19 +587,200 @@ def generate_prompt(request: PromptRequest):
                 user_message += f"\n\nRecent entries:\n{recent_entries_text}"
 
 
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def default_prompt_request(prompt_type):
+    """ The request the frontend sends for a plain "new prompt": the newest entries as recentEntries """
+    cursor.execute(
+        "SELECT id, title, saga_content(content), date, use_for_prompt_generation FROM journal_entries ORDER BY date_epoch DESC, id DESC LIMIT ?",
+        (PROMPT_POOL_RECENT,),
+    )
+    recent = [
+        JournalEntry(id=row[0], title=row[1], content=row[2], date=row[3], use_for_prompt_generation=bool(row[4]))
+        for row in cursor.fetchall()
+    ]
+    return PromptRequest(promptType=prompt_type, recentEntries=recent)
+
+
+def refill_prompt_pool():
+    # the entries changed: prefill the pools that are in use for the new context, in the background
+    if prompt_pool is None:
+        return
+    try:
+        for prompt_type in prompt_pool.warm_types():
+            prompt_pool.prefill(prompt_type, build_prompt_messages(default_prompt_request(prompt_type)))
+    except Exception as e:
+        print(f"Error refilling the prompt pool: {e}")
+
+
+# POST II: generate a writing prompt based on query (RAG)
+@app.post("/generate-prompt")
+def generate_prompt(request: PromptRequest):
+    messages = build_prompt_messages(request)
+
+    # default request: answer from the pool if it holds a prompt made for exactly these messages
+    if prompt_pool is not None and not request.customPrompt and request.promptType in PROMPT_TYPES:
+        prompt = prompt_pool.take(request.promptType, messages)
+        if prompt is not None:
+            return {"prompt": prompt}
+
     # ----- CALL OPENAI -----
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message},
-            ],
-            max_tokens=60,
-        )
-        prompt = response.choices[0].message.content.strip()
+        prompt = llm.complete(messages, max_tokens=60)
         return {"prompt": prompt}
 
+    except LLMUnavailableError as e:
+        print(f"OpenAI API unavailable for prompt generation: {e}")
+        headers = {"Retry-After": str(int(e.retry_after) + 1)} if e.retry_after else None
+        raise HTTPException(status_code=503, detail="Could not generate prompt.", headers=headers)
     except Exception as e:
         print(f"Error calling OpenAI API for prompt generation: {e}")
         raise HTTPException(status_code=500, detail="Could not generate prompt.")
+
+
+def sse_event(data, event=None):
+    """ Format a dict as a server-sent event """
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+# POST III: same as /generate-prompt, but tokens are forwarded over SSE as they arrive
+@app.post("/generate-prompt/stream")
+async def generate_prompt_stream(request: PromptRequest, http_request: Request):
+    # RAG lookup + embedding are blocking, keep them off the event loop
+    messages = await run_in_threadpool(build_prompt_messages, request)
+
+    async def event_stream():
+        started = time.perf_counter()
+        try:
+            stream = await run_in_threadpool(llm.stream, messages, max_tokens=60)
+        except Exception as e:
+            print(f"Error calling OpenAI API for prompt streaming: {e}")
+            metrics.increment("generate_prompt_stream.errors")
+            yield sse_event({"detail": "Could not generate prompt."}, event="error")
+            return
+
+        tokens = []
+        completed = False
+        try:
+            async for chunk in iterate_in_threadpool(stream):
+                # stop pulling from OpenAI as soon as the client is gone
+                if await http_request.is_disconnected():
+                    metrics.increment("generate_prompt_stream.cancelled")
+                    break
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if not token:
+                    continue
+                if not tokens:
+                    metrics.record("generate_prompt_stream.ttft", time.perf_counter() - started)
+                tokens.append(token)
+                yield sse_event({"token": token})
+            else:
+                completed = True
+        except Exception as e:
+            print(f"Error while streaming prompt from OpenAI API: {e}")
+            metrics.increment("generate_prompt_stream.errors")
+            yield sse_event({"detail": "Could not generate prompt."}, event="error")
+        finally:
+            # closes the upstream HTTP response, so a cancelled request stops generating tokens
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+        if completed:
+            metrics.record("generate_prompt_stream.total", time.perf_counter() - started)
+            yield sse_event({"prompt": "".join(tokens).strip()}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# GET: latency percentiles and counters tracked by the app
+@app.get("/metrics")
+def get_metrics():
+    summary = metrics.summary()
+    summary["inference"] = inference.stats()
+    summary["prompt_pool"] = prompt_pool.stats() if prompt_pool else None
+    summary["writer"] = writer.stats()
+    return summary
+
+
+# admin endpoints: with SAGA_ADMIN_TOKEN set, they need it in the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("SAGA_ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if ADMIN_TOKEN and not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required")
+
+# registering a model makes the server download and load it: only these (comma separated) model names are accepted
+ALLOWED_MODELS = {MODEL_NAME} | {name.strip() for name in os.getenv("SAGA_ALLOWED_MODELS", "").split(",") if name.strip()}
+
+
+class ModelVersionRequest(BaseModel):
+    version: str
+    model_name: str
+
+# GET: registered embedding models and the progress of a running re-embedding job
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+def list_models():
+    job = registry.job.progress() if registry.job else None
+    return {"active": registry.active_version(), "models": registry.list_models(), "reembedding": job}
+
+# POST: register a new embedding model version and start re-embedding in the background.
+# queries keep using the current model until every entry has been re-embedded, then switch over at once.
+@app.post("/admin/models", dependencies=[Depends(require_admin)])
+def register_model(request: ModelVersionRequest):
+    if request.model_name not in ALLOWED_MODELS:
+        raise HTTPException(status_code=403, detail=f"Model {request.model_name} is not allowed, add it to SAGA_ALLOWED_MODELS")
+    try:
+        registry.register(request.version, request.model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    job = registry.start_reembedding()
+    return {"message": f"Re-embedding with {request.model_name} started", "reembedding": job.progress()}
+
+backfill_job = None
+
+# POST: start filling in missing/stale summaries and embeddings in the background (resumes from the last checkpoint)
+@app.post("/admin/backfill", dependencies=[Depends(require_admin)])
+def start_backfill(batch_size: int = 256, llm_concurrency: int = 4):
+    global backfill_job
+    if backfill_job is not None and backfill_job.is_alive():
+        raise HTTPException(status_code=409, detail="Backfill is already running")
+    backfill_job = BackfillJob(DB_PATH, llm, registry, batch_size=batch_size, llm_concurrency=llm_concurrency)
+    backfill_job.start()
+    return {"message": "Backfill started", "backfill": backfill_job.progress()}
+
+# GET: progress and throughput of the last backfill run
+@app.get("/admin/backfill", dependencies=[Depends(require_admin)])
+def get_backfill():
+    return {"backfill": backfill_job.progress() if backfill_job else None}
+
+# online backups (see services/db/backup.py): a consistent copy of journal.db, taken while writes continue
+BACKUP_DIR = os.getenv("SAGA_BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("SAGA_BACKUP_KEEP", "0")) or None
+backup_job = None
+
+# POST: start a snapshot in the background. Smaller steps / longer sleeps: slower backup, less impact on requests
+@app.post("/admin/backup", dependencies=[Depends(require_admin)])
+def start_backup(pages_per_step: int = Query(256, ge=1), sleep_ms: float = Query(10, ge=0)):
+    global backup_job
+    if backup_job is not None and backup_job.is_alive():
+        raise HTTPException(status_code=409, detail="Backup is already running")
+    backup_job = BackupJob(DB_PATH, BACKUP_DIR, pages_per_step=pages_per_step, sleep_ms=sleep_ms, keep=BACKUP_KEEP)
+    backup_job.start()
+    return {"message": "Backup started", "backup": backup_job.progress()}
+
+# GET: progress of the last backup and the snapshots on disk (newest first)
+@app.get("/admin/backup", dependencies=[Depends(require_admin)])
+def get_backup():
+    return {"backup": backup_job.progress() if backup_job else None, "snapshots": list_backups(BACKUP_DIR)}
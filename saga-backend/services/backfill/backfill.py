@@ -0,0 +1,195 @@
+# batch backfill for rows that dropped out of RAG retrieval:
+# - no summary, or the fallback summary stored when OpenAI failed   -> summarize (LLM) + embed
+# - a summary but no embedding                                        -> embed
+# - an embedding from another model version than the active one      -> embed
+#
+# rows are processed in id order, in batches: summaries with bounded LLM concurrency, then one
+# batched encode call for the whole batch. After each batch the last id is checkpointed in
+# `backfill_checkpoints` (created by services/db/migrations.py), so an interrupted run continues where it stopped.
+#
+# run from saga-backend/:  python -m services.backfill.backfill --batch-size 256 --llm-concurrency 4
+# or through the API:      POST /admin/backfill
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from services.openAI.summaries import summarize, FALLBACK_SUMMARY
+from services.sbert.embeddings_sbert import get_embeddings, embedding_to_blob
+from services.metrics.tracker import metrics
+from services.db.compression import codec_for
+
+CHECKPOINT_NAME = "summaries_and_embeddings"
+
+
+class BackfillJob(threading.Thread):
+    def __init__(self, db_path, llm, registry, batch_size=256, llm_concurrency=4, max_batches=None):
+        super().__init__(name="backfill", daemon=True)
+        self.db_path = db_path
+        self.llm = llm
+        self.registry = registry
+        self.batch_size = batch_size
+        self.llm_concurrency = llm_concurrency
+        self.max_batches = max_batches
+        self.status = "pending"
+        self.error = None
+        self.stats = {"processed": 0, "summarized": 0, "embedded": 0, "failed": 0, "batches": 0, "elapsed_s": 0.0}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def progress(self):
+        elapsed = self.stats["elapsed_s"]
+        return {
+            "status": self.status,
+            "error": self.error,
+            **self.stats,
+            "rows_per_s": round(self.stats["processed"] / elapsed, 2) if elapsed else None,
+        }
+
+    def _next_batch(self, cursor, last_id, active_version):
+        cursor.execute("""
+            SELECT id, content, summary FROM journal_entries
+            WHERE id > ?
+            AND (summary IS NULL OR summary = ? OR summaryEmbedding IS NULL
+                 OR embeddingModel IS NULL OR embeddingModel != ?)
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, FALLBACK_SUMMARY, active_version, self.batch_size))
+        return cursor.fetchall()
+
+    def _summarize(self, content):
+        try:
+            return summarize(self.llm, content)
+        except Exception as e:
+            print(f"Backfill: could not summarize entry: {e}")
+            return None
+
+    def process_batch(self, conn, rows, active_version, model_name=None):
+        """ Summarize what needs a summary and embed everything in one encode call. Returns the row updates """
+        needs_summary = [row for row in rows if row[2] is None or row[2] == FALLBACK_SUMMARY]
+        needs_summary_ids = {row[0] for row in needs_summary}
+        summaries = {row[0]: row[2] for row in rows if row[0] not in needs_summary_ids}
+
+        if needs_summary:
+            content_codec = codec_for(conn)  # content may be stored compressed
+            # bounded concurrency: at most llm_concurrency LLM calls in flight
+            with ThreadPoolExecutor(max_workers=self.llm_concurrency) as pool:
+                results = pool.map(self._summarize, [content_codec.decode(row[1]) for row in needs_summary])
+                for row, summary in zip(needs_summary, results):
+                    if summary is None:
+                        self.stats["failed"] += 1
+                    else:
+                        summaries[row[0]] = summary
+                        self.stats["summarized"] += 1
+
+        ids = list(summaries)
+        if not ids:
+            return []
+        # the model of the version the rows are tagged with, not whichever one is the default by now
+        embeddings = get_embeddings([summaries[i] for i in ids], lane="bulk", model_name=model_name)
+
+        contents = {row[0]: row[1] for row in rows}
+        return [
+            (summaries[entry_id], embedding_to_blob(embedding), active_version, entry_id, contents[entry_id])
+            for entry_id, embedding in zip(ids, embeddings)
+        ]
+
+    def write_batch(self, cursor, updates, last_id, processed):
+        """ Store the updates of a batch together with its checkpoint. Returns the number of rows written """
+        embedded = 0
+        for update in updates:
+            # skip rows whose content was edited while we were working on them (compares the stored value)
+            cursor.execute("""
+                UPDATE journal_entries SET summary = ?, summaryEmbedding = ?, embeddingModel = ?
+                WHERE id = ? AND content = ?
+            """, update)
+            if cursor.rowcount:
+                embedded += 1
+                self.registry.invalidate(update[3], cursor.connection)
+        cursor.execute("""
+            INSERT INTO backfill_checkpoints (name, last_id, processed, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id,
+                processed = backfill_checkpoints.processed + ?, updated_at = excluded.updated_at
+        """, (CHECKPOINT_NAME, last_id, processed, datetime.now().isoformat(), processed))
+        return embedded
+
+    def run(self):
+        self.status = "running"
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            # reads only: the writes go through the registry's writer (see write_batch)
+            cursor = conn.cursor()
+            cursor.execute("SELECT last_id FROM backfill_checkpoints WHERE name = ?", (CHECKPOINT_NAME,))
+            checkpoint = cursor.fetchone()
+            last_id = checkpoint[0] if checkpoint else ""
+            active_version, model_name = self.registry.active_model()
+
+            while not self._stop_event.is_set():
+                if self.max_batches is not None and self.stats["batches"] >= self.max_batches:
+                    self.status = "stopped"
+                    return
+                rows = self._next_batch(cursor, last_id, active_version)
+                if not rows:
+                    # done: the next run starts from the beginning again
+                    self.registry.write(lambda write_cursor: write_cursor.execute(
+                        "DELETE FROM backfill_checkpoints WHERE name = ?", (CHECKPOINT_NAME,)
+                    ))
+                    self.status = "complete"
+                    return
+
+                updates = self.process_batch(conn, rows, active_version, model_name)
+                batch_last_id = rows[-1][0]
+                # the batch and its checkpoint are committed together
+                self.stats["embedded"] += self.registry.write(
+                    lambda write_cursor: self.write_batch(write_cursor, updates, batch_last_id, len(rows))
+                )
+                last_id = batch_last_id
+                self.stats["processed"] += len(rows)
+                self.stats["batches"] += 1
+                metrics.increment("backfill.rows", len(rows))
+                self.stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+            self.status = "stopped"
+        except Exception as e:
+            print(f"Error during backfill: {e}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+            conn.close()
+
+
+if __name__ == "__main__":
+    import openai
+    from dotenv import load_dotenv
+    from services.openAI.llm_client import LLMClient
+    from services.sbert.model_registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Fill in missing or stale summaries and embeddings")
+    parser.add_argument("--db", default=os.getenv("SAGA_DB_PATH", "journal.db"))
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--max-batches", type=int, default=None, help="stop after this many batches (resume later)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    registry = ModelRegistry(args.db)
+    registry.bootstrap()
+    job = BackfillJob(
+        args.db,
+        LLMClient(openai.OpenAI(max_retries=0)),
+        registry,
+        batch_size=args.batch_size,
+        llm_concurrency=args.llm_concurrency,
+        max_batches=args.max_batches,
+    )
+    try:
+        job.run()
+    except KeyboardInterrupt:
+        job.stop()
+    print(job.progress())
@@ -0,0 +1,193 @@
+# online backup of journal.db while the app keeps serving and writing.
+#
+# the copy uses SQLite's online backup API a few pages per step, with a short sleep between steps, so it never
+# holds the disk (or the GIL) for long and foreground requests keep their latency.
+# the source connection holds one read transaction for the whole copy. In WAL mode that is a consistent snapshot
+# that writers do not wait for, and it keeps the backup API from restarting every time another connection commits
+# (without it a journal under constant writes would never finish backing up).
+# checkpoints: a passive checkpoint before the copy keeps the WAL small; while the snapshot is held no checkpoint
+# gets past it, so a second passive one after the copy lets the WAL catch up. Neither one blocks writers.
+#
+# everything derived from the rows - embeddings, the related-entry graph, themes, model versions, change_log -
+# lives in the same file, so a snapshot is consistent across all of it (the in-memory vector index is rebuilt from
+# it on startup). Each snapshot is written to <name>.partial, checked and renamed, with a <name>.json manifest
+# holding the change_log seq it was taken at: after a restore, clients resync with GET /journal/changes?since=<seq>.
+#
+# run from saga-backend/:  python -m services.db.backup --dir backups --keep 7
+# or through the API:      POST /admin/backup
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from services.metrics.tracker import metrics
+from services.db.queries import current_seq
+
+PREFIX = "journal-"
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+class BackupJob(threading.Thread):
+    def __init__(self, db_path, backup_dir, pages_per_step=256, sleep_ms=10, keep=None):
+        super().__init__(name="backup", daemon=True)
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.pages_per_step = pages_per_step
+        self.sleep = sleep_ms / 1000
+        self.keep = keep
+        self.status = "pending"
+        self.error = None
+        self.path = None
+        self.stats = {"pages_total": 0, "pages_copied": 0, "steps": 0, "restarts": 0, "elapsed_s": 0.0}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def progress(self):
+        total = self.stats["pages_total"]
+        return {
+            "status": self.status,
+            "error": self.error,
+            "path": self.path,
+            **self.stats,
+            "percent": round(100 * self.stats["pages_copied"] / total, 1) if total else None,
+        }
+
+    def _progress_callback(self):
+        last = [time.perf_counter()]
+
+        def callback(status, remaining, total):
+            now = time.perf_counter()
+            # time between callbacks is one step plus the sleep after the previous one
+            metrics.record("backup.step", max(0.0, now - last[0] - (self.sleep if self.stats["steps"] else 0)))
+            last[0] = now
+            copied = total - remaining
+            if copied < self.stats["pages_copied"]:
+                self.stats["restarts"] += 1  # only happens if the snapshot was not held
+            self.stats.update(pages_total=total, pages_copied=copied, steps=self.stats["steps"] + 1)
+            if self._stop_event.is_set():
+                raise BackupCancelled()  # aborts conn.backup()
+        return callback
+
+    def snapshot(self):
+        """ Copy the database to a new file in backup_dir. Returns the manifest """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = PREFIX + datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        final_path = os.path.join(self.backup_dir, name + ".db")
+        partial_path = final_path + ".partial"
+
+        source = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            source.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+            # the snapshot: every page copied below is read as of this point
+            source.execute("BEGIN")
+            seq = current_seq(source.cursor())
+            schema_version = source.execute("PRAGMA user_version").fetchone()[0]
+            entries = source.execute("SELECT COUNT(*) FROM journal_entries").fetchone()[0]
+
+            target = sqlite3.connect(partial_path)
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=self._progress_callback(), sleep=self.sleep)
+                # a single self-contained file, no -wal next to it
+                target.execute("PRAGMA journal_mode=DELETE").fetchall()
+                check = target.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                target.close()
+            source.execute("COMMIT")
+            source.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        finally:
+            source.close()
+
+        if check != "ok":
+            os.remove(partial_path)
+            raise RuntimeError(f"Backup failed its integrity check: {check}")
+        os.replace(partial_path, final_path)
+        manifest = {
+            "path": final_path,
+            "created_at": datetime.now().isoformat(),
+            "change_seq": seq,
+            "schema_version": schema_version,
+            "entries": entries,
+            "bytes": os.path.getsize(final_path),
+        }
+        with open(final_path[:-3] + ".json", "w") as f:
+            json.dump(manifest, f, indent=2)
+        self.path = final_path
+        return manifest
+
+    def run(self):
+        self.status = "running"
+        started = time.perf_counter()
+        try:
+            self.snapshot()
+            if self.keep:
+                prune(self.backup_dir, self.keep)
+            self.status = "complete"
+        except BackupCancelled:
+            self.status = "stopped"
+        except Exception as e:
+            print(f"Error during backup: {e}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+            metrics.increment(f"backup.{self.status}")
+
+
+def list_backups(backup_dir):
+    """ Manifests of the finished snapshots in backup_dir, newest first """
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for file_name in sorted(os.listdir(backup_dir), reverse=True):
+        if not (file_name.startswith(PREFIX) and file_name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(backup_dir, file_name)) as f:
+                backups.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Error reading backup manifest {file_name}: {e}")
+    return backups
+
+
+def prune(backup_dir, keep):
+    """ Delete all but the newest keep snapshots. Returns the deleted paths """
+    deleted = []
+    for manifest in list_backups(backup_dir)[keep:]:
+        for path in (manifest["path"], manifest["path"][:-3] + ".json"):
+            if os.path.exists(path):
+                os.remove(path)
+        deleted.append(manifest["path"])
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up journal.db without stopping the server")
+    parser.add_argument("--db", default=os.getenv("SAGA_DB_PATH", "journal.db"))
+    parser.add_argument("--dir", default=os.getenv("SAGA_BACKUP_DIR", "backups"))
+    parser.add_argument("--pages", type=int, default=256, help="pages copied per step")
+    parser.add_argument("--sleep-ms", type=float, default=10, help="pause between steps")
+    parser.add_argument("--keep", type=int, default=None, help="delete all but the newest KEEP snapshots afterwards")
+    parser.add_argument("--list", action="store_true", help="only list the existing snapshots")
+    args = parser.parse_args()
+
+    if args.list:
+        print(json.dumps(list_backups(args.dir), indent=2))
+    else:
+        job = BackupJob(args.db, args.dir, pages_per_step=args.pages, sleep_ms=args.sleep_ms, keep=args.keep)
+        try:
+            job.run()
+        except KeyboardInterrupt:
+            job.stop()
+        print(job.progress())
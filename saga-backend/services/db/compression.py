@@ -0,0 +1,334 @@
+# optional compression of journal_entries.content at rest.
+#
+# a row's content is either plain TEXT (the default, and every row written before compression was turned on)
+# or a BLOB: MAGIC + codec byte + 4-byte dictionary id + compressed UTF-8. Both kinds can live side by side,
+# readers do not care which one a row has.
+#
+# codecs: zlib (standard library) with a preset dictionary, or zstd with a trained dictionary when the optional
+# `zstandard` package is installed. Dictionaries are trained on the journal's own text (short entries compress
+# poorly on their own, a shared dictionary of common words and phrases fixes most of that) and stored in
+# compression_dicts, so old rows stay readable after a new dictionary is trained.
+#
+# SQL: register(conn) adds saga_content(content) -> text, used by the app wherever SQL needs the text itself
+# (LIKE search, reads). migrate() and the group-commit writer register their connections themselves.
+#
+# FTS: by default the full-text triggers index the plain content column and need no app function, so the database
+# stays writable from any SQLite client. Only while compressed rows can exist (compression enabled, or rows left
+# compressed) do the triggers decode through saga_content() - see set_fts_decoding(). In that state every
+# connection that writes journal_entries must call register(conn) first; the sqlite3 CLI can not. To go back:
+#   python -m services.db.compression --decompress
+#
+# write path: set SAGA_COMPRESS_CONTENT=zlib (or zstd), new and edited entries are stored compressed.
+# existing rows, size and read-throughput report:
+#   python -m services.db.compression --train --compress --benchmark   (from saga-backend/)
+import argparse
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+MAGIC = b"SZ"
+HEADER = struct.Struct(">2scI")  # magic, codec, dictionary id
+CODECS = {"zlib": b"z", "zstd": b"s"}
+MIN_SIZE = 64  # shorter texts are not worth a header and a dictionary lookup
+ZLIB_DICT_SIZE = 32 * 1024  # zlib only looks back 32 KB
+
+
+def codec_from_env():
+    codec = os.getenv("SAGA_COMPRESS_CONTENT", "off").lower()
+    if codec == "zstd" and zstandard is None:
+        print("SAGA_COMPRESS_CONTENT=zstd but the zstandard package is not installed, using zlib")
+        return "zlib"
+    return codec if codec in CODECS else None
+
+
+class ContentCodec:
+    """ Encode/decode the content values of one database. Its dictionaries are cached, keyed by their id """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._dicts = {}  # dict_id -> (codec, dictionary bytes)
+        self._active = {}  # codec -> dict_id used for new writes (the newest one)
+        self._lock = threading.Lock()
+
+    def load(self, conn):
+        """ Cache every dictionary stored in the database of this connection """
+        rows = conn.execute("SELECT dict_id, codec, data FROM compression_dicts ORDER BY dict_id").fetchall()
+        with self._lock:
+            for dict_id, codec, data in rows:
+                self._dicts[dict_id] = (codec, bytes(data))
+                self._active[codec] = dict_id
+
+    def _dictionary(self, dict_id):
+        if dict_id not in self._dicts and self.path:
+            # trained by another process since we last looked
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                self.load(conn)
+            finally:
+                conn.close()
+        if dict_id not in self._dicts:
+            raise RuntimeError(f"Compression dictionary {dict_id} not found")
+        return self._dicts[dict_id][1]
+
+    def encode(self, text, codec):
+        """ Stored value for text: compressed when a codec is given and it saves space, else the text itself """
+        if codec is None or text is None:
+            return text
+        raw = text.encode("utf-8")
+        if len(raw) < MIN_SIZE:
+            return text
+        dict_id = self._active.get(codec, 0)
+        dictionary = self._dicts[dict_id][1] if dict_id else None
+        if codec == "zstd":
+            if zstandard is None:
+                return text
+            zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            payload = zstandard.ZstdCompressor(level=9, dict_data=zdict).compress(raw)
+        else:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15, **({"zdict": dictionary} if dictionary else {}))
+            payload = compressor.compress(raw) + compressor.flush()
+        value = HEADER.pack(MAGIC, CODECS[codec], dict_id) + payload
+        return value if len(value) < len(raw) else text
+
+    def decode(self, value):
+        """ Text for a stored value, plain or compressed """
+        if not isinstance(value, bytes) or value[:2] != MAGIC:
+            return value
+        _, codec, dict_id = HEADER.unpack_from(value)
+        payload = value[HEADER.size:]
+        dictionary = self._dictionary(dict_id) if dict_id else None
+        if codec == CODECS["zstd"]:
+            if zstandard is None:
+                raise RuntimeError("Entry was compressed with zstd, install the zstandard package to read it")
+            zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdDecompressor(dict_data=zdict).decompress(payload).decode("utf-8")
+        decompressor = zlib.decompressobj(-15, **({"zdict": dictionary} if dictionary else {}))
+        return (decompressor.decompress(payload) + decompressor.flush()).decode("utf-8")
+
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+
+def codec_for(conn):
+    """ The codec of the database this connection points at (one per database file, per process) """
+    path = conn.execute("PRAGMA database_list").fetchall()[0][2]
+    if not path:  # in-memory database: private to this connection
+        return ContentCodec()
+    path = os.path.realpath(path)
+    with _codecs_lock:
+        if path not in _codecs:
+            _codecs[path] = ContentCodec(path)
+        return _codecs[path]
+
+
+def register(conn):
+    """ Add saga_content() to a connection and cache the dictionaries of its database. Returns the codec """
+    content_codec = codec_for(conn)
+    conn.create_function("saga_content", 1, content_codec.decode, deterministic=True)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'compression_dicts'").fetchall():
+        content_codec.load(conn)
+    return content_codec
+
+
+FTS_TRIGGERS = ("journal_fts_insert", "journal_fts_update", "journal_fts_delete")
+
+
+def install_fts_triggers(cursor, decode):
+    """ (Re)create the triggers that keep journal_fts in sync, reading content through saga_content() if decode """
+    def text(column):
+        return f"saga_content({column})" if decode else column
+
+    for trigger in FTS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute(f"""
+    CREATE TRIGGER journal_fts_insert
+    AFTER INSERT ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET doc_id = (SELECT COALESCE(MAX(doc_id), 0) + 1 FROM journal_entries) WHERE id = NEW.id;
+        INSERT INTO journal_fts(rowid, title, content, summary)
+        SELECT doc_id, title, {text("content")}, summary FROM journal_entries WHERE id = NEW.id;
+    END;
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER journal_fts_update
+    AFTER UPDATE OF title, content, summary ON journal_entries
+    BEGIN
+        INSERT INTO journal_fts(journal_fts, rowid, title, content, summary) VALUES('delete', OLD.doc_id, OLD.title, {text("OLD.content")}, OLD.summary);
+        INSERT INTO journal_fts(rowid, title, content, summary) VALUES (NEW.doc_id, NEW.title, {text("NEW.content")}, NEW.summary);
+    END;
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER journal_fts_delete
+    AFTER DELETE ON journal_entries
+    BEGIN
+        INSERT INTO journal_fts(journal_fts, rowid, title, content, summary) VALUES('delete', OLD.doc_id, OLD.title, {text("OLD.content")}, OLD.summary);
+    END;
+    """)
+
+
+def fts_decoding(conn):
+    """ Whether the FTS triggers currently decode content with saga_content() """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'journal_fts_update'").fetchone()
+    return bool(row and "saga_content" in row[0])
+
+
+def set_fts_decoding(conn, enabled):
+    """
+    Switch the FTS triggers between plain and decoding. The indexed text is the same either way as long as all
+    rows are plain, so no reindex is needed; switching back to plain is refused while compressed rows remain.
+    """
+    if fts_decoding(conn) == enabled:
+        return
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if not enabled and conn.execute("SELECT 1 FROM journal_entries WHERE typeof(content) = 'blob' LIMIT 1").fetchone():
+            raise RuntimeError("Entries are still stored compressed, decompress them first")
+        install_fts_triggers(conn, enabled)
+
+
+def train_zlib_dictionary(samples, size=ZLIB_DICT_SIZE):
+    """
+    zlib preset dictionary: the most frequent words and word pairs of the samples.
+    zlib finds matches closer to the data cheaper, so the most frequent ones go last.
+    """
+    counts = Counter()
+    for text in samples:
+        words = text.split()
+        counts.update(words)
+        counts.update(" ".join(pair) for pair in zip(words, words[1:]))
+    # weigh by the bytes a match saves
+    ranked = sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True)
+    chosen, total = [], 0
+    for phrase, count in ranked:
+        if count < 2:
+            continue
+        piece = (phrase + " ").encode("utf-8")
+        if total + len(piece) > size:
+            break
+        chosen.append(piece)
+        total += len(piece)
+    return b"".join(reversed(chosen))
+
+
+def train(conn, codec_name, size=None, max_samples=2000):
+    """ Train a dictionary on up to max_samples entries and store it. Returns its id, or None with too little text """
+    content_codec = register(conn)
+    samples = [content_codec.decode(row[0]) for row in conn.execute(
+        "SELECT content FROM journal_entries ORDER BY date_epoch DESC LIMIT ?", (max_samples,)
+    )]
+    if len(samples) < 8:
+        return None
+    if codec_name == "zstd":
+        encoded = [sample.encode("utf-8") for sample in samples]
+        data = zstandard.train_dictionary(size or 16 * 1024, encoded).as_bytes()
+    else:
+        data = train_zlib_dictionary(samples, size or ZLIB_DICT_SIZE)
+    cursor = conn.execute(
+        "INSERT INTO compression_dicts (codec, data, samples, created_at) VALUES (?, ?, ?, ?)",
+        (codec_name, data, len(samples), datetime.now().isoformat()),
+    )
+    conn.commit()
+    content_codec.load(conn)
+    return cursor.lastrowid
+
+
+def recompress(conn, codec_name, batch_size=500):
+    """ Rewrite every row's content with codec_name (None: back to plain text). Returns the number of rows changed """
+    content_codec = register(conn)
+    if codec_name:
+        set_fts_decoding(conn, True)
+    changed, last_rowid = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, content FROM journal_entries WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            if codec_name is None:
+                set_fts_decoding(conn, False)
+            return changed
+        updates = []
+        for rowid, value in rows:
+            stored = content_codec.encode(content_codec.decode(value), codec_name)
+            if stored != value:
+                updates.append((stored, rowid))
+        conn.executemany("UPDATE journal_entries SET content = ? WHERE rowid = ?", updates)
+        conn.commit()
+        changed += len(updates)
+        last_rowid = rows[-1][0]
+
+
+def storage_report(conn):
+    """ Database size and how much of it is entry content """
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count, free_pages = conn.execute("PRAGMA page_count").fetchone()[0], conn.execute("PRAGMA freelist_count").fetchone()[0]
+    rows, compressed, stored, text = conn.execute(
+        "SELECT COUNT(*), SUM(typeof(content) = 'blob'), SUM(length(CAST(content AS BLOB))), SUM(length(CAST(saga_content(content) AS BLOB))) FROM journal_entries"
+    ).fetchone()
+    return {
+        "rows": rows,
+        "compressed_rows": compressed or 0,
+        "content_bytes_stored": stored or 0,
+        "content_bytes_text": text or 0,
+        "ratio": round(text / stored, 2) if stored else None,
+        "db_bytes": page_size * page_count,
+        "db_bytes_free": page_size * free_pages,  # reclaimed by VACUUM
+    }
+
+
+def read_benchmark(conn, repeat=3):
+    """ Rows/s of a newest-first list view without content, and of a full read with content decoded """
+    results = {}
+    for name, sql in (
+        ("list_without_content", "SELECT id, title, date, summary FROM journal_entries ORDER BY date_epoch DESC"),
+        ("list_with_content", "SELECT id, title, saga_content(content), date, summary FROM journal_entries ORDER BY date_epoch DESC"),
+    ):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = len(conn.execute(sql).fetchall())
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {"rows": rows, "rows_per_s": round(rows / best) if best else None}
+    return results
+
+
+if __name__ == "__main__":
+    from services.db.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Compress journal entry content at rest and report the effect")
+    parser.add_argument("--db", default=os.getenv("SAGA_DB_PATH", "journal.db"))
+    parser.add_argument("--codec", choices=sorted(CODECS), default=codec_from_env() or "zlib")
+    parser.add_argument("--train", action="store_true", help="train a new dictionary on the journal's text")
+    parser.add_argument("--compress", action="store_true", help="rewrite all rows compressed with --codec")
+    parser.add_argument("--decompress", action="store_true", help="rewrite all rows as plain text")
+    parser.add_argument("--vacuum", action="store_true", help="give the freed pages back to the file system")
+    parser.add_argument("--benchmark", action="store_true", help="report size and read throughput")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    migrate(conn)
+    report = {"before": storage_report(conn)}
+    if args.benchmark:
+        report["before"]["reads"] = read_benchmark(conn)
+    if args.train:
+        report["dictionary"] = train(conn, args.codec)
+    if args.compress or args.decompress:
+        report["rewritten_rows"] = recompress(conn, None if args.decompress else args.codec)
+    if args.vacuum:
+        conn.execute("VACUUM")
+    report["after"] = storage_report(conn)
+    if args.benchmark:
+        report["after"]["reads"] = read_benchmark(conn)
+    conn.close()
+    print(report)
@@ -0,0 +1,138 @@
+# Idempotency-Key support: a request sent again with the same key gets the stored response of the first one,
+# instead of doing the work (LLM summary, embedding, new row) a second time.
+#
+# per (key, scope) the idempotency_keys table holds one row:
+#   in_flight  the first request is still running: a retry waits for it (up to wait_timeout) instead of starting over
+#   done       its status code and JSON body, replayed to every retry until the row expires
+# a key reused with a different request body is rejected. An in_flight row older than `lease` belongs to a request
+# that died halfway (e.g. the process was killed): the next retry takes it over. A response that can not be stored
+# releases the key (settle), so retries run again instead of waiting for the lease.
+# rows are written through the group-commit writer, so the check-and-claim in begin() is atomic.
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+REPLAY = "replay"
+RUN = "run"
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, db_path, writer, ttl=24 * 3600, lease=300, wait_timeout=60, poll_interval=0.05):
+        self.db_path = db_path
+        self.writer = writer
+        self.ttl = ttl
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._finished = threading.Condition()
+
+    def _claim(self, key, scope, fingerprint):
+        """ Writer mutation: claim the key, or report what is stored under it """
+        def mutation(cursor):
+            now = time.time()
+            # expired keys are cleaned up a few at a time, on the way
+            cursor.execute(
+                "DELETE FROM idempotency_keys WHERE rowid IN (SELECT rowid FROM idempotency_keys WHERE expires_at < ? LIMIT 100)",
+                (now,),
+            )
+            cursor.execute("DELETE FROM idempotency_keys WHERE key = ? AND scope = ? AND expires_at < ?", (key, scope, now))
+            cursor.execute(
+                "INSERT OR IGNORE INTO idempotency_keys (key, scope, request_hash, status, created_at, expires_at) VALUES (?, ?, ?, 'in_flight', ?, ?)",
+                (key, scope, fingerprint, now, now + self.ttl),
+            )
+            if cursor.rowcount:
+                return RUN, None
+            row = cursor.execute(
+                "SELECT request_hash, status, status_code, response, created_at FROM idempotency_keys WHERE key = ? AND scope = ?",
+                (key, scope),
+            ).fetchone()
+            if row[0] != fingerprint:
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+            if row[1] == "done":
+                return REPLAY, (row[2], json.loads(row[3]))
+            if now - row[4] > self.lease:
+                cursor.execute(
+                    "UPDATE idempotency_keys SET created_at = ?, expires_at = ? WHERE key = ? AND scope = ?",
+                    (now, now + self.ttl, key, scope),
+                )
+                return RUN, None
+            return "wait", None
+        return mutation
+
+    def begin(self, key, scope, payload):
+        """
+        RUN: the caller owns the key and must call complete() or abort().
+        REPLAY, (status_code, body): the stored response.
+        Waits while another request with the key is in flight, raises IdempotencyConflict if that takes too long.
+        """
+        fingerprint = request_hash(payload)
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            outcome, stored = self.writer.execute(self._claim(key, scope, fingerprint))
+            if outcome != "wait":
+                return outcome, stored
+            # wait with plain reads until the other request finished (or its lease ran out), then claim again
+            while True:
+                if time.monotonic() > deadline:
+                    raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", 409)
+                # woken early when a request in this process finishes, polling covers other processes
+                with self._finished:
+                    self._finished.wait(self.poll_interval)
+                row = self._status(key, scope)
+                if row is None or row[0] == "done" or time.time() - row[1] > self.lease:
+                    break
+
+    def _status(self, key, scope):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            return conn.execute(
+                "SELECT status, created_at FROM idempotency_keys WHERE key = ? AND scope = ?", (key, scope)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    def complete(self, key, scope, status_code, body):
+        """ Store the response, retries get it from now on """
+        self.writer.execute(lambda cursor: cursor.execute(
+            "UPDATE idempotency_keys SET status = 'done', status_code = ?, response = ? WHERE key = ? AND scope = ?",
+            (status_code, json.dumps(body), key, scope),
+        ))
+        with self._finished:
+            self._finished.notify_all()
+
+    def settle(self, key, scope, status_code, body, attempts=2):
+        """
+        complete(), tried `attempts` times. If the response can not be stored the key is released with abort()
+        instead of staying in_flight, where retries would get 409 until the lease runs out. Returns True if stored
+        """
+        for attempt in range(attempts):
+            try:
+                self.complete(key, scope, status_code, body)
+                return True
+            except Exception as e:
+                print(f"Error storing the response for Idempotency-Key {key} (attempt {attempt + 1}): {e}")
+        try:
+            self.abort(key, scope)
+        except Exception as e:
+            print(f"Error releasing Idempotency-Key {key}: {e}")
+        return False
+
+    def abort(self, key, scope):
+        """ The request failed without a response worth replaying: the next retry runs it again """
+        self.writer.execute(lambda cursor: cursor.execute(
+            "DELETE FROM idempotency_keys WHERE key = ? AND scope = ? AND status = 'in_flight'", (key, scope),
+        ))
+        with self._finished:
+            self._finished.notify_all()
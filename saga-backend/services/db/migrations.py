@@ -0,0 +1,456 @@
+# versioned schema migrations for journal.db.
+# the schema version is stored in `PRAGMA user_version`; migrate() applies every migration above it, in order,
+# each one in its own transaction. Migrations are written so they also work on databases that were created
+# before this existed (tables created ad hoc by main.py), i.e. "IF NOT EXISTS" and column checks.
+#
+# to change the schema: append a new function to MIGRATIONS, never edit one that has shipped.
+from services.db.compression import register as register_sql_functions, install_fts_triggers
+
+
+def column_exists(cursor, table, column):
+    return column in [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column(cursor, table, column, definition):
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def initial_schema(cursor):
+    """ The original journal_entries table """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS journal_entries (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        summary TEXT DEFAULT NULL,
+        prompt TEXT DEFAULT NULL,
+        promptType TEXT DEFAULT NULL,
+        summaryEmbedding BLOB,
+        use_for_prompt_generation BOOLEAN DEFAULT TRUE
+    );
+    """)
+
+
+def model_registry(cursor):
+    """ Embedding model versions (services/sbert/model_registry.py) """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS embedding_models (
+        version TEXT PRIMARY KEY,
+        model_name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        activated_at TEXT DEFAULT NULL
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS pending_embeddings (
+        entry_id TEXT NOT NULL,
+        version TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        PRIMARY KEY (entry_id, version)
+    );
+    """)
+    add_column(cursor, "journal_entries", "embeddingModel", "TEXT DEFAULT NULL")
+
+
+def backfill_checkpoints(cursor):
+    """ Progress of the backfill job (services/backfill/backfill.py) """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+        name TEXT PRIMARY KEY,
+        last_id TEXT NOT NULL,
+        processed INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL
+    );
+    """)
+
+
+def date_epoch_and_indexes(cursor):
+    """
+    Integer unix-epoch copy of `date` (kept in sync by triggers, so every writer gets it for free)
+    plus the indexes behind the hot queries.
+    """
+    add_column(cursor, "journal_entries", "date_epoch", "INTEGER")
+    # ISO strings with or without fractional seconds / timezone; naive times are read as UTC
+    cursor.execute("UPDATE journal_entries SET date_epoch = CAST(strftime('%s', date) AS INTEGER)")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS journal_entries_date_epoch_insert
+    AFTER INSERT ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET date_epoch = CAST(strftime('%s', NEW.date) AS INTEGER) WHERE id = NEW.id;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS journal_entries_date_epoch_update
+    AFTER UPDATE OF date ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET date_epoch = CAST(strftime('%s', NEW.date) AS INTEGER) WHERE id = NEW.id;
+    END;
+    """)
+    # RAG candidates in generate_prompt: only prompt-eligible rows that have an embedding
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_entries_prompt_eligible
+    ON journal_entries(embeddingModel, id)
+    WHERE use_for_prompt_generation = 1 AND summaryEmbedding IS NOT NULL
+    """)
+    # date ranges and newest-first listing. It also covers list views that do not need content/embeddings,
+    # so those are answered from the index alone, in date order
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_entries_date_epoch
+    ON journal_entries(date_epoch, id, title, date, summary, prompt, promptType, use_for_prompt_generation)
+    """)
+
+
+def month_day_index(cursor):
+    """
+    date_md = month * 100 + day (e.g. 1117 for November 17th), for "on this day" and month queries
+    across years, kept in sync by triggers like date_epoch
+    """
+    add_column(cursor, "journal_entries", "date_md", "INTEGER")
+    cursor.execute("UPDATE journal_entries SET date_md = CAST(strftime('%m%d', date) AS INTEGER)")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS journal_entries_date_md_insert
+    AFTER INSERT ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET date_md = CAST(strftime('%m%d', NEW.date) AS INTEGER) WHERE id = NEW.id;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS journal_entries_date_md_update
+    AFTER UPDATE OF date ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET date_md = CAST(strftime('%m%d', NEW.date) AS INTEGER) WHERE id = NEW.id;
+    END;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_date_md ON journal_entries(date_md, date_epoch, id)")
+
+
+def change_log(cursor):
+    """
+    One row per entry with the sequence number of its latest change ('upsert' or 'delete'), maintained by triggers.
+    Lets in-memory indexes (and clients) catch up on "what changed since seq N" without rescanning the table.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        entry_id TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        op TEXT NOT NULL
+    );
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_seq ON change_log(seq)")
+    # derived columns (date_epoch, date_md, ...) are left out, their triggers would log every change twice
+    next_seq = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM change_log)"
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_insert
+    AFTER INSERT ON journal_entries
+    BEGIN
+        INSERT OR REPLACE INTO change_log (entry_id, seq, op) VALUES (NEW.id, {next_seq}, 'upsert');
+    END;
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_update
+    AFTER UPDATE OF title, content, date, summary, prompt, promptType, summaryEmbedding, use_for_prompt_generation ON journal_entries
+    BEGIN
+        INSERT OR REPLACE INTO change_log (entry_id, seq, op) VALUES (NEW.id, {next_seq}, 'upsert');
+    END;
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_delete
+    AFTER DELETE ON journal_entries
+    BEGIN
+        INSERT OR REPLACE INTO change_log (entry_id, seq, op) VALUES (OLD.id, {next_seq}, 'delete');
+    END;
+    """)
+    cursor.execute(f"INSERT OR IGNORE INTO change_log (entry_id, seq, op) SELECT id, rowid, 'upsert' FROM journal_entries")
+
+
+def full_text_search(cursor):
+    """
+    FTS5 index over title, content and summary for lexical search.
+    External content (no second copy of the text), keyed by doc_id: a stable integer per entry.
+    (the implicit rowid of journal_entries can change on VACUUM, so it can not be used as the key)
+    """
+    add_column(cursor, "journal_entries", "doc_id", "INTEGER")
+    cursor.execute("UPDATE journal_entries SET doc_id = rowid WHERE doc_id IS NULL")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_entries_doc_id ON journal_entries(doc_id)")
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS journal_fts USING fts5(
+        title, content, summary,
+        content='journal_entries', content_rowid='doc_id',
+        tokenize='porter unicode61'
+    );
+    """)
+    cursor.execute("INSERT INTO journal_fts(journal_fts) VALUES('rebuild')")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS journal_fts_insert
+    AFTER INSERT ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET doc_id = (SELECT COALESCE(MAX(doc_id), 0) + 1 FROM journal_entries) WHERE id = NEW.id;
+        INSERT INTO journal_fts(rowid, title, content, summary)
+        SELECT doc_id, title, content, summary FROM journal_entries WHERE id = NEW.id;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS journal_fts_update
+    AFTER UPDATE OF title, content, summary ON journal_entries
+    BEGIN
+        INSERT INTO journal_fts(journal_fts, rowid, title, content, summary) VALUES('delete', OLD.doc_id, OLD.title, OLD.content, OLD.summary);
+        INSERT INTO journal_fts(rowid, title, content, summary) VALUES (NEW.doc_id, NEW.title, NEW.content, NEW.summary);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS journal_fts_delete
+    AFTER DELETE ON journal_entries
+    BEGIN
+        INSERT INTO journal_fts(journal_fts, rowid, title, content, summary) VALUES('delete', OLD.doc_id, OLD.title, OLD.content, OLD.summary);
+    END;
+    """)
+
+
+def related_entries(cursor):
+    """
+    Precomputed k-nearest-neighbour graph over summaryEmbedding (RAG/related.py).
+    entry_neighbors holds the ranked neighbours per entry, related_graph_state the model version and
+    change_log seq the graph is up to date with.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS entry_neighbors (
+        entry_id TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        neighbor_id TEXT NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (entry_id, rank)
+    ) WITHOUT ROWID;
+    """)
+    # reverse lookup: whose neighbour lists mention an entry that changed
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_entry_neighbors_neighbor ON entry_neighbors(neighbor_id)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS related_graph_state (
+        name TEXT PRIMARY KEY,
+        version TEXT NOT NULL,
+        last_seq INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """)
+
+
+def themes(cursor):
+    """
+    Theme clusters over the summary embeddings (RAG/themes.py): one centroid per theme,
+    the theme of every entry with its similarity to the centroid, and the sync state.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS themes (
+        theme_id INTEGER PRIMARY KEY,
+        centroid BLOB NOT NULL,
+        weight INTEGER NOT NULL
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS entry_themes (
+        entry_id TEXT PRIMARY KEY,
+        theme_id INTEGER NOT NULL,
+        similarity REAL NOT NULL
+    );
+    """)
+    # representatives of a theme: its members closest to the centroid
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_entry_themes_theme ON entry_themes(theme_id, similarity)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS theme_state (
+        name TEXT PRIMARY KEY,
+        version TEXT NOT NULL,
+        last_seq INTEGER NOT NULL,
+        built_size INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """)
+
+
+def idempotency_keys(cursor):
+    """ Stored responses of requests sent with an Idempotency-Key header (services/db/idempotency.py) """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT NOT NULL,
+        scope TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        status TEXT NOT NULL,
+        status_code INTEGER DEFAULT NULL,
+        response TEXT DEFAULT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (key, scope)
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at)")
+
+
+def content_compression(cursor):
+    """
+    Content may now be stored compressed (services/db/compression.py): dictionaries table, and the FTS index
+    reads the text through saga_content() - from a view for rebuilds, in the triggers for changes.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS compression_dicts (
+        dict_id INTEGER PRIMARY KEY,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL,
+        samples INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    """)
+    cursor.execute("""
+    CREATE VIEW IF NOT EXISTS journal_entries_text AS
+    SELECT doc_id, title, saga_content(content) AS content, summary FROM journal_entries
+    """)
+    for trigger in ("journal_fts_insert", "journal_fts_update", "journal_fts_delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS journal_fts")
+    cursor.execute("""
+    CREATE VIRTUAL TABLE journal_fts USING fts5(
+        title, content, summary,
+        content='journal_entries_text', content_rowid='doc_id',
+        tokenize='porter unicode61'
+    );
+    """)
+    cursor.execute("INSERT INTO journal_fts(journal_fts) VALUES('rebuild')")
+    cursor.execute("""
+    CREATE TRIGGER journal_fts_insert
+    AFTER INSERT ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET doc_id = (SELECT COALESCE(MAX(doc_id), 0) + 1 FROM journal_entries) WHERE id = NEW.id;
+        INSERT INTO journal_fts(rowid, title, content, summary)
+        SELECT doc_id, title, saga_content(content), summary FROM journal_entries WHERE id = NEW.id;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER journal_fts_update
+    AFTER UPDATE OF title, content, summary ON journal_entries
+    BEGIN
+        INSERT INTO journal_fts(journal_fts, rowid, title, content, summary) VALUES('delete', OLD.doc_id, OLD.title, saga_content(OLD.content), OLD.summary);
+        INSERT INTO journal_fts(rowid, title, content, summary) VALUES (NEW.doc_id, NEW.title, saga_content(NEW.content), NEW.summary);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER journal_fts_delete
+    AFTER DELETE ON journal_entries
+    BEGIN
+        INSERT INTO journal_fts(journal_fts, rowid, title, content, summary) VALUES('delete', OLD.doc_id, OLD.title, saga_content(OLD.content), OLD.summary);
+    END;
+    """)
+
+
+def undated_entries(cursor):
+    """
+    Entries whose date SQLite can not parse (stored before dates were validated) get date_epoch 0 instead of NULL:
+    they sort as the oldest entries and page like any other, a NULL never matches the keyset condition.
+    """
+    cursor.execute("UPDATE journal_entries SET date_epoch = 0 WHERE date_epoch IS NULL")
+    for trigger in ("journal_entries_date_epoch_insert", "journal_entries_date_epoch_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("""
+    CREATE TRIGGER journal_entries_date_epoch_insert
+    AFTER INSERT ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET date_epoch = COALESCE(CAST(strftime('%s', NEW.date) AS INTEGER), 0) WHERE id = NEW.id;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER journal_entries_date_epoch_update
+    AFTER UPDATE OF date ON journal_entries
+    BEGIN
+        UPDATE journal_entries SET date_epoch = COALESCE(CAST(strftime('%s', NEW.date) AS INTEGER), 0) WHERE id = NEW.id;
+    END;
+    """)
+
+
+def fts_without_app_functions(cursor):
+    """
+    Undo the saga_content() wiring of content_compression: the FTS index reads journal_entries again and its
+    triggers use the plain columns, so connections that do not register app functions (sqlite3 CLI, scripts,
+    restored backups) can still write entries. A database that already holds compressed rows keeps the decoding
+    triggers; services/db/compression.py switches them when compression is turned on or off.
+    """
+    for trigger in ("journal_fts_insert", "journal_fts_update", "journal_fts_delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP VIEW IF EXISTS journal_entries_text")
+    cursor.execute("DROP TABLE IF EXISTS journal_fts")
+    cursor.execute("""
+    CREATE VIRTUAL TABLE journal_fts USING fts5(
+        title, content, summary,
+        content='journal_entries', content_rowid='doc_id',
+        tokenize='porter unicode61'
+    );
+    """)
+    compressed = cursor.execute("SELECT 1 FROM journal_entries WHERE typeof(content) = 'blob' LIMIT 1").fetchone()
+    if compressed:
+        # 'rebuild' would index the compressed bytes
+        cursor.execute("""
+        INSERT INTO journal_fts(rowid, title, content, summary)
+        SELECT doc_id, title, saga_content(content), summary FROM journal_entries
+        """)
+    else:
+        cursor.execute("INSERT INTO journal_fts(journal_fts) VALUES('rebuild')")
+    install_fts_triggers(cursor, decode=bool(compressed))
+
+
+def neighbor_floors(cursor):
+    """
+    The score a new neighbour has to beat to get into an entry's related list (its k-th score, or -2 while the
+    list is shorter than k), indexed so an update only reads the lists a changed vector can get into.
+    related_graph_state is reset: k is not known here, the next update rebuilds the graph and fills the table.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS entry_neighbor_floor (
+        entry_id TEXT PRIMARY KEY,
+        score REAL NOT NULL
+    ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_entry_neighbor_floor_score ON entry_neighbor_floor(score)")
+    cursor.execute("DELETE FROM related_graph_state")
+
+
+MIGRATIONS = [
+    initial_schema,
+    model_registry,
+    backfill_checkpoints,
+    date_epoch_and_indexes,
+    month_day_index,
+    change_log,
+    full_text_search,
+    related_entries,
+    themes,
+    idempotency_keys,
+    content_compression,
+    undated_entries,
+    fts_without_app_functions,
+    neighbor_floors,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchall()[0][0]
+
+
+def migrate(conn):
+    """ Apply pending migrations. Returns the list of applied migration names """
+    # some migrations (and the FTS triggers of a compressed database) call saga_content()
+    register_sql_functions(conn)
+    applied = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if schema_version(conn) >= version:
+            continue
+        cursor = conn.cursor()
+        # IMMEDIATE: several worker processes may start at once, only one of them migrates
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < version:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+                applied.append(migration.__name__)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
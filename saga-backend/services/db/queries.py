@@ -0,0 +1,97 @@
+# shared SQL building blocks for entry queries: date filters, keyset pagination and the change sequence.
+# all filters map onto indexed columns (date_epoch, date_md, see migrations.py).
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+
+def to_epoch(value, end_of_day=False):
+    """
+    Parse an ISO date or datetime into unix seconds (naive values are UTC, like in the date_epoch trigger).
+    With end_of_day, a plain date means the end of that day, so `end=2025-11-17` includes the 17th.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1, seconds=-1)
+    return int(parsed.timestamp())
+
+
+def is_valid_date(value):
+    """ True if SQLite can parse value, i.e. the date_epoch trigger gets a real timestamp out of it """
+    conn = sqlite3.connect(":memory:")
+    try:
+        return conn.execute("SELECT strftime('%s', ?) IS NOT NULL", (value,)).fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def date_filters(start=None, end=None, month=None, day=None):
+    """
+    WHERE clauses + params for the temporal filters:
+    start/end (ISO date or datetime, inclusive), month (1-12) and/or day of month (1-31) across all years.
+    Raises ValueError on bad input.
+    """
+    clauses, params = [], []
+    if start:
+        clauses.append("date_epoch >= ?")
+        params.append(to_epoch(start))
+    if end:
+        clauses.append("date_epoch <= ?")
+        params.append(to_epoch(end, end_of_day=True))
+    if month is not None and day is not None:
+        clauses.append("date_md = ?")
+        params.append(month * 100 + day)
+    elif month is not None:
+        clauses.append("date_md BETWEEN ? AND ?")
+        params.extend([month * 100 + 1, month * 100 + 31])
+    elif day is not None:
+        # day of month in any month: twelve point lookups on the date_md index
+        clauses.append("date_md IN ({})".format(",".join("?" * 12)))
+        params.extend(m * 100 + day for m in range(1, 13))
+    return clauses, params
+
+
+def encode_cursor(date_epoch, entry_id):
+    return f"{date_epoch}_{entry_id}"
+
+
+def decode_cursor(cursor_value):
+    """ Cursor returned as next_cursor by a previous page: '<date_epoch>_<id>' """
+    date_epoch, _, entry_id = cursor_value.partition("_")
+    if not entry_id or not date_epoch.lstrip("-").isdigit():
+        raise ValueError("Invalid cursor")
+    return int(date_epoch), entry_id
+
+
+def keyset_page(clauses, params, sort="desc", cursor_value=None):
+    """
+    Add the keyset condition for the page after `cursor_value` and return the ORDER BY clause.
+    Pages are found with an index seek, so every page costs the same, however deep it is.
+    """
+    direction = "DESC" if sort == "desc" else "ASC"
+    if cursor_value:
+        date_epoch, entry_id = decode_cursor(cursor_value)
+        clauses.append("(date_epoch, id) {} (?, ?)".format("<" if sort == "desc" else ">"))
+        params.extend([date_epoch, entry_id])
+    return f"ORDER BY date_epoch {direction}, id {direction}"
+
+
+def current_seq(cursor):
+    """
+    Sequence number of the latest write to journal_entries (change_log, see migrations.py).
+    It only ever grows: every insert, update and delete gets a new, higher seq.
+    """
+    return cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+
+def etag_for(seq):
+    return f'"seq-{seq}"'
+
+
+def etag_matches(if_none_match, etag):
+    """ If-None-Match can be a list of tags, weak tags (W/"...") or * """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
@@ -0,0 +1,146 @@
+# single-writer group commit for journal.db.
+#
+# request threads do not commit themselves: they hand a mutation (a function that gets a cursor) to the writer
+# and wait. The writer thread takes whatever is queued - up to max_batch mutations, waiting at most max_wait_ms
+# after the first one for more to arrive - and runs them in one transaction, so one fsync covers the whole batch.
+# each mutation runs in its own SAVEPOINT: if it raises, only its own changes are rolled back and only its caller
+# gets the exception. Callers are acknowledged after the COMMIT, i.e. once their write is durable.
+#
+# in the app every write to the entries goes through it: the endpoints, idempotency keys, and the background
+# backfill and re-embedding jobs (through ModelRegistry.write, which also runs the switch-over of a new model).
+# not covered: the derived tables (related graph, themes) are rebuilt on connections of their own, off the request
+# path, and the command line tools (backfill, backup, compression.py's recompress) run without the app and commit
+# themselves, so they contend for the file lock with a running server.
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from services.metrics.tracker import metrics
+from services.db.compression import register
+
+_STOP = object()
+
+
+class GroupCommitWriter(threading.Thread):
+    def __init__(self, db_path, max_batch=64, max_wait_ms=2.0):
+        super().__init__(name="db-writer", daemon=True)
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "mutations": 0, "failed_mutations": 0, "failed_commits": 0}
+        self._batch_sizes = Counter()
+        self._ready = threading.Event()
+        self._error = None
+
+    def start(self):
+        super().start()
+        # fail at startup, not on the first write, if the database can not be opened
+        self._ready.wait()
+        if self._error:
+            raise self._error
+        return self
+
+    def submit(self, mutation):
+        """ Queue mutation(cursor). Returns a Future with its result, set once the batch is committed """
+        future = Future()
+        self._queue.put((mutation, future, time.perf_counter()))
+        return future
+
+    def execute(self, mutation):
+        """ Run mutation(cursor) in the next batch and wait until it is durable. Re-raises its exception """
+        return self.submit(mutation).result()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            sizes = dict(sorted(self._batch_sizes.items()))
+        stats["mean_batch_size"] = round(stats["mutations"] / stats["batches"], 2) if stats["batches"] else None
+        stats["batch_sizes"] = sizes
+        return stats
+
+    def _collect(self, first):
+        """ The first queued mutation plus whatever arrives within the latency window """
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # finish this batch first
+                break
+            batch.append(item)
+        return batch
+
+    def _run_batch(self, conn, batch):
+        cursor = conn.cursor()
+        results = []
+        started = time.perf_counter()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for mutation, _, _ in batch:
+                cursor.execute("SAVEPOINT mutation")
+                try:
+                    results.append((True, mutation(cursor)))
+                    cursor.execute("RELEASE mutation")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO mutation")
+                    cursor.execute("RELEASE mutation")
+                    results.append((False, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            print(f"Error committing a batch of {len(batch)} writes: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._lock:
+                self._stats["failed_commits"] += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        committed = time.perf_counter()
+        metrics.record("writer.commit", committed - started)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["mutations"] += len(batch)
+            self._stats["failed_mutations"] += sum(1 for ok, _ in results if not ok)
+            self._batch_sizes[len(batch)] += 1
+        for (_, future, queued_at), (ok, result) in zip(batch, results):
+            # queued -> durable, as seen by the request
+            metrics.record("writer.latency", committed - queued_at)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def run(self):
+        try:
+            # autocommit mode: transactions and savepoints are managed explicitly above
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL").fetchall()
+            conn.execute("PRAGMA synchronous=FULL")  # a commit is on disk before anyone is acknowledged
+            register(conn)  # saga_content(), used by the FTS triggers once content is compressed
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is _STOP:
+                    return
+                self._run_batch(conn, self._collect(first))
+        finally:
+            conn.close()
@@ -0,0 +1,65 @@
+# simple in-process metrics: rolling latency samples and counters per metric name.
+# exposed through GET /metrics in main.py
+import threading
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class MetricsTracker:
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """ Store one latency sample (in seconds) for the given metric """
+        with self._lock:
+            self._samples[name].append(seconds)
+
+    def increment(self, name, amount=1):
+        """ Increase a counter by amount """
+        with self._lock:
+            self._counters[name] += amount
+
+    def count(self, name):
+        """ Number of samples currently in the window for the given metric """
+        with self._lock:
+            return len(self._samples.get(name, ()))
+
+    def percentile(self, name, q):
+        """ Return the q-th percentile (0-100) of the recorded samples, or None if there are none """
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+        if not samples:
+            return None
+        return float(np.percentile(samples, q))
+
+    def summary(self):
+        """ Snapshot of all metrics, latencies reported in milliseconds """
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+            counters = dict(self._counters)
+
+        latencies = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            latencies[name] = {
+                "count": len(values),
+                "p50_ms": round(float(p50) * 1000, 2),
+                "p95_ms": round(float(p95) * 1000, 2),
+                "p99_ms": round(float(p99) * 1000, 2),
+            }
+        return {"latencies": latencies, "counters": counters}
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counters.clear()
+
+
+# shared instance used by the app and services
+metrics = MetricsTracker()
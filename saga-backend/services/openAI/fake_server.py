@@ -0,0 +1,181 @@
+# local fake OpenAI-compatible server for tests and load testing.
+# serves POST /v1/chat/completions (normal and stream=true) with injectable latency and errors.
+#
+# run standalone:  python -m services.openAI.fake_server --port 8100 --latency lognormal:400:0.5 --error-rate 0.02
+# then point the app at it:  OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake uvicorn main:app
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    """
+    Turn a latency spec into a function returning a delay in seconds.
+    fixed:MS | uniform:LOW_MS:HIGH_MS | lognormal:MEDIAN_MS:SIGMA | a plain number of ms
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda: spec / 1000
+    kind, *args = str(spec).split(":")
+    if kind == "fixed":
+        return lambda: float(args[0]) / 1000
+    if kind == "uniform":
+        low, high = float(args[0]), float(args[1])
+        return lambda: random.uniform(low, high) / 1000
+    if kind == "lognormal":
+        median, sigma = float(args[0]), float(args[1])
+        return lambda: random.lognormvariate(0, sigma) * median / 1000
+    return lambda: float(kind) / 1000
+
+
+class FakeOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0, error_rate=0.0, error_status=500, reply="This is a fake completion."):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply = reply
+        self.requests = 0
+        self._script = deque()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def script(self, *responses):
+        """
+        Queue (delay_seconds, status) tuples that are used, in order, for the next requests
+        before falling back to the configured latency / error rate.
+        """
+        with self._lock:
+            self._script.extend(responses)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next_behaviour(self):
+        with self._lock:
+            self.requests += 1
+            if self._script:
+                return self._script.popleft()
+        status = self.error_status if random.random() < self.error_rate else 200
+        return self.latency(), status
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+                delay, status = server._next_behaviour()
+                if status != 200:
+                    time.sleep(delay)
+                    return self._send_json(status, {"error": {"message": "injected error", "type": "server_error"}})
+
+                model = body.get("model", "gpt-3.5-turbo")
+                if body.get("stream"):
+                    return self._stream(model, delay)
+                time.sleep(delay)
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": server.reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                })
+
+            def _stream(self, model, delay):
+                # the delay is spent before the first token, the rest trickles in
+                time.sleep(delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                words = server.reply.split(" ")
+                try:
+                    for i, word in enumerate(words):
+                        chunk = {
+                            "id": completion_id,
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": model,
+                            "choices": [{
+                                "index": 0,
+                                "delta": {"content": word if i == 0 else " " + word},
+                                "finish_reason": None,
+                            }],
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                self.close_connection = True
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up (timeout) before we answered
+                    self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default="0", help="fixed:MS, uniform:LOW:HIGH, lognormal:MEDIAN_MS:SIGMA or plain ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(args.host, args.port, args.latency, args.error_rate, args.error_status)
+    print(f"Fake OpenAI server listening on {fake.base_url}")
+    try:
+        fake._httpd.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
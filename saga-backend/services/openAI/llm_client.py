@@ -0,0 +1,224 @@
+# shared wrapper around the OpenAI client used by every LLM call site in main.py
+# - per-call timeout (passed to the request, so the HTTP call itself is aborted)
+# - retries with jittered exponential backoff for transient errors
+# - optional hedged second request once the first one is slower than the observed p95
+# - circuit breaker that fails fast while the provider is unhealthy
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import openai
+
+from services.metrics.tracker import metrics
+
+
+class LLMUnavailableError(Exception):
+    """ Raised when the LLM could not be reached (circuit open, timeouts or repeated errors) """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    """ Client errors (bad request, auth, ...) will not get better by retrying, everything else might """
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return True
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failed calls the breaker opens
+    and calls are rejected for `reset_timeout` seconds. Then a single trial call is let through (half open):
+    success closes the breaker again, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def retry_after(self):
+        """ Seconds until the breaker lets a trial call through """
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    metrics.increment("llm.circuit_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def reset(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+
+class LLMClient:
+    def __init__(
+        self,
+        client,
+        model="gpt-3.5-turbo",
+        timeout=20.0,
+        max_retries=2,
+        backoff_base=0.25,
+        backoff_max=4.0,
+        hedge=True,
+        hedge_percentile=95,
+        hedge_min_samples=20,
+        breaker=None,
+        metric_name="llm.latency",
+        max_workers=16,
+    ):
+        self.client = client
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.metric_name = metric_name
+        # only hedges run here, primary requests never queue behind other calls
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+
+    def complete(self, messages, max_tokens=60, **kwargs):
+        """ Run a chat completion and return the stripped message text """
+        if not self.breaker.allow():
+            metrics.increment("llm.rejected")
+            raise LLMUnavailableError("LLM circuit breaker is open", retry_after=self.breaker.retry_after())
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                metrics.increment("llm.retries")
+                time.sleep(self._backoff(attempt))
+            try:
+                response = self._hedged_call(messages, max_tokens, **kwargs)
+                self.breaker.record_success()
+                return response.choices[0].message.content.strip()
+            except Exception as e:
+                last_error = e
+                metrics.increment("llm.errors")
+                if not is_retryable(e):
+                    # the provider answered, it just did not like the request
+                    self.breaker.record_success()
+                    raise
+
+        self.breaker.record_failure()
+        raise LLMUnavailableError(f"LLM call failed after {self.max_retries + 1} attempts: {last_error}") from last_error
+
+    def stream(self, messages, max_tokens=60, **kwargs):
+        """
+        Open a streaming chat completion. Tokens are forwarded to the client as they arrive,
+        so there are no retries or hedging once the stream has started, only the breaker and the timeout.
+        """
+        if not self.breaker.allow():
+            metrics.increment("llm.rejected")
+            raise LLMUnavailableError("LLM circuit breaker is open", retry_after=self.breaker.retry_after())
+        try:
+            # time to the first bytes only: kept apart from the completion latencies the hedge delay is taken from
+            stream = self._create(messages, max_tokens, metric_name=f"{self.metric_name}.stream_open", stream=True, **kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            else:
+                # the provider answered, it just did not like the request (also ends a half-open trial)
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return stream
+
+    def _create(self, messages, max_tokens, metric_name=None, **kwargs):
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            timeout=self.timeout,
+            **kwargs,
+        )
+        metrics.record(metric_name or self.metric_name, time.perf_counter() - started)
+        return response
+
+    def _hedge_delay(self):
+        """ Delay before sending a hedged request: the observed p95, once there are enough samples """
+        if not self.hedge:
+            return None
+        if metrics.count(self.metric_name) < self.hedge_min_samples:
+            return None
+        return metrics.percentile(self.metric_name, self.hedge_percentile)
+
+    def _hedged_call(self, messages, max_tokens, **kwargs):
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._create(messages, max_tokens, **kwargs)
+
+        # the primary request is the caller's own: a thread per call, so it is not capped by the pool size or
+        # queued behind other calls (the caller itself has to stay free to return a faster hedge)
+        primary = Future()
+        threading.Thread(
+            target=self._run, args=(primary, messages, max_tokens), kwargs=kwargs, name="llm-primary", daemon=True
+        ).start()
+        pending = {primary}
+        done, pending = wait(pending, timeout=delay)
+        if not done:
+            # first request is slower than p95: race a second one against it
+            metrics.increment("llm.hedged")
+            pending.add(self._executor.submit(self._create, messages, max_tokens, **kwargs))
+
+        last_error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+            if not pending:
+                raise last_error
+            # the per-request timeout bounds how long this can take
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def _run(self, future, messages, max_tokens, **kwargs):
+        try:
+            future.set_result(self._create(messages, max_tokens, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _backoff(self, attempt):
+        """ Full jitter: random delay between 0 and the exponential backoff for this attempt """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
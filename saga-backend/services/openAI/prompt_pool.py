@@ -0,0 +1,132 @@
+# pool of pre-generated writing prompts per prompt type, so "new prompt" is answered without an LLM round trip.
+#
+# a pooled prompt is only served for the exact context it was generated from: each prompt type keeps one pool,
+# keyed by a fingerprint of the messages sent to the LLM (system message + the eligible recent entries).
+# a request that fingerprints differently is a miss. After a write the app prefills the pool for the new context
+# and prompts made for the old one are dropped (fills still queued for it skip the LLM call). Every hit and miss
+# schedules a background top-up to `size`.
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from services.metrics.tracker import metrics
+
+PROMPT_TYPES = ("reflective", "daily", "creative")
+
+
+def fingerprint(messages):
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+
+
+class PromptPool:
+    def __init__(self, llm, size=2, max_age=6 * 3600, max_tokens=60, max_workers=2):
+        self.llm = llm
+        self.size = size
+        self.max_age = max_age
+        self.max_tokens = max_tokens
+        self._pools = {}  # prompt type -> {"fingerprint": ..., "prompts": deque of (prompt, created_at)}
+        self._inflight = {}  # (prompt type, fingerprint) -> fills running
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prompt-pool")
+        self.hits = 0
+        self.misses = 0
+
+    def warm_types(self):
+        """ Prompt types that have been requested, only those are prefilled after writes """
+        with self._lock:
+            return list(self._pools)
+
+    def take(self, prompt_type, messages):
+        """ A pooled prompt generated from these exact messages, or None. Tops the pool up in the background """
+        key = fingerprint(messages)
+        now = time.time()
+        prompt = None
+        with self._lock:
+            pool = self._pools.get(prompt_type)
+            if pool is not None and pool["fingerprint"] == key:
+                while pool["prompts"]:
+                    text, created_at = pool["prompts"].popleft()
+                    if now - created_at <= self.max_age:
+                        prompt = text
+                        metrics.record("prompt_pool.age", now - created_at)
+                        break
+                    metrics.increment("prompt_pool.expired")
+            if prompt is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.increment("prompt_pool.hits" if prompt is not None else "prompt_pool.misses")
+        self.prefill(prompt_type, messages)
+        return prompt
+
+    def prefill(self, prompt_type, messages):
+        """ Generate prompts for these messages in the background until the pool holds `size` of them """
+        key = fingerprint(messages)
+        with self._lock:
+            pool = self._pools.get(prompt_type)
+            if pool is None or pool["fingerprint"] != key:
+                # the context changed: prompts made for the old one are stale
+                if pool is not None and pool["prompts"]:
+                    metrics.increment("prompt_pool.invalidated", len(pool["prompts"]))
+                pool = {"fingerprint": key, "prompts": deque()}
+                self._pools[prompt_type] = pool
+            inflight = self._inflight.get((prompt_type, key), 0)
+            missing = self.size - len(pool["prompts"]) - inflight
+            if missing <= 0:
+                return
+            self._inflight[(prompt_type, key)] = inflight + missing
+        for _ in range(missing):
+            self._executor.submit(self._fill, prompt_type, key, messages)
+
+    def _finish(self, prompt_type, key):
+        # caller holds the lock
+        remaining = self._inflight.get((prompt_type, key), 1) - 1
+        if remaining > 0:
+            self._inflight[(prompt_type, key)] = remaining
+        else:
+            self._inflight.pop((prompt_type, key), None)
+
+    def _fill(self, prompt_type, key, messages):
+        with self._lock:
+            pool = self._pools.get(prompt_type)
+            # queued behind fills for a context that has changed since: skip the LLM call
+            if pool is None or pool["fingerprint"] != key:
+                self._finish(prompt_type, key)
+                metrics.increment("prompt_pool.skipped_stale")
+                return
+        try:
+            prompt = self.llm.complete(messages, max_tokens=self.max_tokens)
+            metrics.increment("prompt_pool.fills")
+        except Exception as e:
+            print(f"Error pre-generating a {prompt_type} prompt: {e}")
+            metrics.increment("prompt_pool.fill_errors")
+            prompt = None
+        with self._lock:
+            self._finish(prompt_type, key)
+            pool = self._pools.get(prompt_type)
+            # the context may have changed while the LLM was working
+            if prompt and pool is not None and pool["fingerprint"] == key:
+                pool["prompts"].append((prompt, time.time()))
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            pools = {
+                prompt_type: {
+                    "size": len(pool["prompts"]),
+                    "fingerprint": pool["fingerprint"][:12],
+                    "oldest_s": round(now - pool["prompts"][0][1], 1) if pool["prompts"] else None,
+                    "filling": self._inflight.get((prompt_type, pool["fingerprint"]), 0),
+                }
+                for prompt_type, pool in self._pools.items()
+            }
+        return {
+            "pools": pools,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
@@ -0,0 +1,17 @@
+# one-sentence summaries of journal entries, used by add_entry, update_entry and the backfill job
+
+# stored when the LLM could not be reached; the backfill job looks for it to retry later
+FALLBACK_SUMMARY = "Could not generate summary."
+
+
+def summary_messages(content):
+    prompt_text = f"Summarize this journal post in one short sentence, in the second person in past tense: \"{content}\""
+    return [
+        {"role": "system", "content": "You summarize journal entries in a single sentence."},
+        {"role": "user", "content": prompt_text}
+    ]
+
+
+def summarize(llm, content):
+    """ Ask the LLM (an LLMClient) for a summary; raises if it could not be generated """
+    return llm.complete(summary_messages(content), max_tokens=60)
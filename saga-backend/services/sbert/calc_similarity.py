@@ -1,9 +1,8 @@
-from sentence_transformers import SentenceTransformer
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
+from services.sbert.embeddings_sbert import get_model
 
+# reuse the model loaded by embeddings_sbert instead of loading a second copy
 def calc_similarity(query, doc):
-    similarity = model.similarity(query, doc)
+    similarity = get_model().similarity(query, doc)
     return similarity 
 
-# print(model.similarity_fn_name) # should print cosine, can be edited to other similarity functions
\ No newline at end of file
+# print(get_model().similarity_fn_name) # should print cosine, can be edited to other similarity functions
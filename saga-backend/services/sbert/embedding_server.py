@@ -0,0 +1,252 @@
+# optional out-of-process embedding service.
+# one process owns the SBERT model (and torch), API workers send texts over a Unix socket.
+# requests arriving within a few milliseconds of each other are encoded together in one batched encode call.
+# the server loads every model version it is asked for (see model_registry.py), so re-embedding works remotely too,
+# but only models on its allow-list (the default model + SAGA_ALLOWED_MODELS, the same list POST /admin/models checks).
+# a model is loaded in the thread of the connection asking for it, the batcher keeps encoding meanwhile.
+#
+# the connection unpickles what it receives: the server refuses to start without an authkey (SAGA_EMBEDDING_AUTHKEY,
+# the API workers need the same one) and the socket file is only accessible to its owner.
+#
+# start the server:   SAGA_EMBEDDING_AUTHKEY=... python -m services.sbert.embedding_server --socket /tmp/saga-embeddings.sock
+# point the API at it: SAGA_EMBEDDING_SOCKET=/tmp/saga-embeddings.sock uvicorn main:app --workers 4
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from services.sbert.inference_pool import LANES, InferenceSaturatedError, configure_torch_threads
+from services.metrics.tracker import metrics
+
+
+class EmbeddingServer:
+    def __init__(self, address, model=None, model_name="all-MiniLM-L6-v2", max_batch=64, max_wait_ms=5, max_queue=None,
+                 authkey=None, allowed_models=()):
+        self.model_name = model_name
+        self.models = {model_name: model or self._load(model_name)}
+        self.allowed_models = {model_name, *allowed_models}
+        self._load_lock = threading.Lock()
+        self.address = address
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = {"interactive": 256, "bulk": 1024}
+        self.max_queue.update(max_queue or {})
+        self.authkey = authkey
+        self.batches = 0
+        self.encoded = 0
+        self._pending = {lane: deque() for lane in LANES}
+        self._cond = threading.Condition()
+        self._listener = None
+        self._closed = False
+
+    @property
+    def model(self):
+        """ The default model """
+        return self.models[self.model_name]
+
+    def _load(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    def start(self):
+        """ Listen on the socket and serve in background threads """
+        if not self.authkey:
+            raise ValueError("The embedding server needs an authkey (SAGA_EMBEDDING_AUTHKEY)")
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # created owner-only from the start, not chmod-ed afterwards
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        threading.Thread(target=self._batcher, name="embedding-batcher", daemon=True).start()
+        threading.Thread(target=self._accept, name="embedding-accept", daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        while not self._closed:
+            time.sleep(1)
+
+    def stop(self):
+        self._closed = True
+        if self._listener:
+            self._listener.close()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                metrics.increment("embedding_server.auth_failed")  # a wrong key must not stop the server
+                continue
+            except (OSError, EOFError):
+                if self._closed:
+                    return
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        """ One thread per client connection: request -> wait for its batch -> response """
+        with conn:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if op == "info":
+                    conn.send(("ok", {"model": self.model_name, "models": list(self.models), "batches": self.batches, "encoded": self.encoded}))
+                elif op == "encode":
+                    texts, lane, model_name = payload
+                    try:
+                        model_name = self._ensure_loaded(model_name or self.model_name)
+                        conn.send(("ok", self._enqueue(texts, lane, model_name).result()))
+                    except InferenceSaturatedError as e:
+                        conn.send(("busy", e.retry_after))
+                    except Exception as e:
+                        conn.send(("error", str(e)))
+                else:
+                    conn.send(("error", f"unknown operation {op}"))
+
+    def _ensure_loaded(self, model_name):
+        """ Load an allowed model before its texts are queued, so the batcher never waits for a download """
+        if model_name not in self.allowed_models:
+            raise ValueError(f"Model {model_name} is not allowed on this server")
+        if model_name not in self.models:
+            with self._load_lock:
+                if model_name not in self.models:
+                    self.models[model_name] = self._load(model_name)
+        return model_name
+
+    def _enqueue(self, texts, lane, model_name):
+        future = Future()
+        with self._cond:
+            pending = self._pending[lane]
+            if len(pending) >= self.max_queue[lane]:
+                metrics.increment(f"embedding_server.{lane}.rejected")
+                raise InferenceSaturatedError(lane, 1)
+            pending.append((texts, model_name, future))
+            self._cond.notify()
+        return future
+
+    def _take_batch(self):
+        """
+        Collect requests (interactive first) until max_batch texts or max_wait has passed.
+        A batch only holds requests for one model.
+        """
+        batch, size, model_name = [], 0, None
+        with self._cond:
+            while not any(self._pending.values()):
+                if self._closed:
+                    return None, []
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                lane = next(
+                    (lane for lane in LANES if self._pending[lane] and model_name in (None, self._pending[lane][0][1])),
+                    None,
+                )
+                if lane is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                texts, model_name, future = self._pending[lane].popleft()
+                batch.append((texts, future))
+                size += len(texts)
+        return model_name, batch
+
+    def _batcher(self):
+        while not self._closed:
+            model_name, batch = self._take_batch()
+            if not batch:
+                continue
+            all_texts = [text for texts, _ in batch for text in texts]
+            try:
+                embeddings = self.models[model_name].encode(all_texts, batch_size=self.max_batch)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.encoded += len(all_texts)
+            metrics.record("embedding_server.batch_size", len(all_texts))
+            offset = 0
+            for texts, future in batch:
+                future.set_result(np.asarray(embeddings[offset:offset + len(texts)], dtype=np.float32))
+                offset += len(texts)
+
+
+class EmbeddingClient:
+    """ Thread-safe client for EmbeddingServer, keeps a small pool of open connections """
+
+    def __init__(self, address, authkey=None):
+        self.address = address
+        self.authkey = authkey
+        self._connections = queue.LifoQueue()
+
+    def _request(self, op, payload):
+        try:
+            conn = self._connections.get_nowait()
+        except queue.Empty:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        try:
+            conn.send((op, payload))
+            status, result = conn.recv()
+        except Exception:
+            conn.close()
+            raise
+        self._connections.put(conn)
+        if status == "busy":
+            raise InferenceSaturatedError(payload[1] if op == "encode" else "interactive", result)
+        if status != "ok":
+            raise RuntimeError(f"Embedding server error: {result}")
+        return result
+
+    def encode(self, text, lane="interactive", model_name=None):
+        """ Same contract as model.encode: a str gives a 1D array, a list of str gives a 2D array """
+        single = isinstance(text, str)
+        embeddings = self._request("encode", ([text] if single else list(text), lane, model_name))
+        return embeddings[0] if single else embeddings
+
+    def info(self):
+        return self._request("info", None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared SBERT embedding server")
+    parser.add_argument("--socket", default=os.getenv("SAGA_EMBEDDING_SOCKET", "/tmp/saga-embeddings.sock"))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--torch-threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    authkey = os.getenv("SAGA_EMBEDDING_AUTHKEY")
+    if not authkey:
+        parser.error("set SAGA_EMBEDDING_AUTHKEY (the API workers use the same value)")
+    configure_torch_threads(args.torch_threads)
+    server = EmbeddingServer(
+        args.socket,
+        model_name=args.model,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        authkey=authkey.encode(),
+        allowed_models={name.strip() for name in os.getenv("SAGA_ALLOWED_MODELS", "").split(",") if name.strip()},
+    )
+    print(f"Embedding server ({args.model}) listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
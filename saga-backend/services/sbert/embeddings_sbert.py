@@ -2,17 +2,76 @@
 # pip3 install torch torchvision --index-url https://download.pytorch.org/whl/cpu
 # pip install -U sentence-transformers
 # https://www.sbert.net/ 
+import os
+import threading
+from collections import deque
 import numpy as np 
-from sentence_transformers import SentenceTransformer
 
-# Load pre-trained model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from services.sbert.inference_pool import InferenceExecutor
+from services.sbert.embedding_server import EmbeddingClient
 
-def get_embedding(text):
+MODEL_NAME = 'all-MiniLM-L6-v2'  # default model, the active one is chosen by the model registry (model_registry.py)
+
+# if set, embeddings come from the shared embedding server (embedding_server.py) and no model is loaded here
+EMBEDDING_SOCKET = os.getenv("SAGA_EMBEDDING_SOCKET")
+_authkey = os.getenv("SAGA_EMBEDDING_AUTHKEY")
+remote = EmbeddingClient(EMBEDDING_SOCKET, authkey=_authkey.encode() if _authkey else None) if EMBEDDING_SOCKET else None
+
+_models = {}
+_model_lock = threading.Lock()
+_active_model_name = MODEL_NAME
+
+def set_active_model(model_name):
+    """ Model used by get_embedding when no model_name is given """
+    global _active_model_name
+    _active_model_name = model_name
+
+def get_model(model_name=None):
+    """ Load a pre-trained model once per process """
+    model_name = model_name or _active_model_name
+    with _model_lock:
+        if model_name not in _models:
+            # imported here: with a shared embedding server the API workers never load sentence_transformers/torch
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(model_name)
+        return _models[model_name]
+
+# all local encode calls go through this bounded executor (see inference_pool.py)
+inference = InferenceExecutor.from_env()
+
+# Load pre-trained model at startup (unless a shared embedding server is used)
+if remote is None:
+    get_model()
+
+def get_embedding(text, lane="interactive", model_name=None):
     # Generate embedding
-    embedding = model.encode(text) # returns a numpy array
+    model_name = model_name or _active_model_name
+    if remote is not None:
+        return remote.encode(text, lane=lane, model_name=model_name)
+    embedding = inference.run(get_model(model_name).encode, text, lane=lane) # returns a numpy array
     return embedding
 
+def get_embeddings(texts, lane="bulk", batch_size=64, model_name=None):
+    """ Encode many texts, returns a 2D numpy array (one row per text) """
+    model_name = model_name or _active_model_name
+    texts = list(texts)
+    # one task (or server request) per batch_size texts, so interactive work queued meanwhile runs in between
+    chunks = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    if len(chunks) <= 1:
+        chunks = [texts]
+    if remote is not None:
+        results = [remote.encode(chunk, lane=lane, model_name=model_name) for chunk in chunks]
+    else:
+        model = get_model(model_name)
+        # at most one chunk per worker queued at a time, a long job does not fill the lane
+        results, pending = [], deque()
+        for chunk in chunks:
+            if len(pending) >= inference.workers:
+                results.append(pending.popleft().result())
+            pending.append(inference.submit(model.encode, chunk, lane=lane, batch_size=batch_size))
+        results.extend(future.result() for future in pending)
+    return results[0] if len(results) == 1 else np.vstack(results)
+
 def embedding_to_blob(embedding):
     """ Convert numpy array to bytes for BLOB storage """ # Or JSON? 
     return embedding.tobytes()
@@ -33,4 +92,4 @@ if __name__ == "__main__":
     print("Are they equal?", np.array_equal(embedding, restored_embedding))
     # check what datatype the embedding is
     print(type(embedding)) #  <class 'numpy.ndarray'>,  sql cannot store as numpy array, need to convert to BLOB or list
-    print(embedding.shape) # (384,) for 'all-MiniLM-L6-v2'
\ No newline at end of file
+    print(embedding.shape) # (384,) for 'all-MiniLM-L6-v2'
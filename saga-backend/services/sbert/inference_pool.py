@@ -0,0 +1,135 @@
+# bounded executor for CPU-bound model inference (SBERT encode).
+# request threads never run torch themselves: they queue work here and wait for the result.
+# - a fixed number of worker threads, with an explicit torch thread configuration, so a burst of
+#   requests can not oversubscribe the cores
+# - per-priority lanes: "interactive" work (RAG queries, new entries) always runs before "bulk" work (re-embedding)
+# - admission control: when a lane's queue is full, submit() raises InferenceSaturatedError instead of queueing
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from services.metrics.tracker import metrics
+
+LANES = ("interactive", "bulk")
+
+
+class InferenceSaturatedError(Exception):
+    """ Raised when a lane's queue is full. retry_after is a hint in seconds for the client """
+
+    def __init__(self, lane, retry_after):
+        super().__init__(f"Inference queue '{lane}' is full")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def configure_torch_threads(intra_op_threads, inter_op_threads=1):
+    """ Pin torch's thread pools, so workers * intra_op_threads stays within the available cores """
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(intra_op_threads)
+    try:
+        torch.set_num_interop_threads(inter_op_threads)
+    except RuntimeError:
+        # can only be set once, before any parallel work has started
+        pass
+
+
+class InferenceExecutor:
+    def __init__(self, workers=1, max_queue=None, torch_threads=None):
+        self.workers = workers
+        self.max_queue = {"interactive": 32, "bulk": 256}
+        self.max_queue.update(max_queue or {})
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+        self._queues = {lane: deque() for lane in LANES}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._started = False
+
+    @classmethod
+    def from_env(cls):
+        workers = int(os.getenv("SAGA_INFERENCE_WORKERS", "1"))
+        torch_threads = os.getenv("SAGA_TORCH_THREADS")
+        return cls(
+            workers=workers,
+            max_queue={
+                "interactive": int(os.getenv("SAGA_INFERENCE_QUEUE_INTERACTIVE", "32")),
+                "bulk": int(os.getenv("SAGA_INFERENCE_QUEUE_BULK", "256")),
+            },
+            torch_threads=int(torch_threads) if torch_threads else None,
+        )
+
+    def _start(self):
+        # workers are started lazily, on the first submit
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        configure_torch_threads(self.torch_threads)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, *args, lane="interactive", **kwargs):
+        """ Queue fn(*args, **kwargs) on the given lane and return a Future """
+        if lane not in self._queues:
+            raise ValueError(f"Unknown inference lane: {lane}")
+        self._start()
+        future = Future()
+        with self._cond:
+            queue = self._queues[lane]
+            if len(queue) >= self.max_queue[lane]:
+                metrics.increment(f"inference.{lane}.rejected")
+                raise InferenceSaturatedError(lane, self._retry_after(lane, len(queue)))
+            queue.append((future, fn, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def run(self, fn, *args, lane="interactive", **kwargs):
+        """ Submit and wait for the result """
+        return self.submit(fn, *args, lane=lane, **kwargs).result()
+
+    def queue_depth(self, lane):
+        with self._cond:
+            return len(self._queues[lane])
+
+    def stats(self):
+        with self._cond:
+            depths = {lane: len(queue) for lane, queue in self._queues.items()}
+        return {
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "queue_depth": depths,
+            "max_queue": dict(self.max_queue),
+        }
+
+    def _retry_after(self, lane, depth):
+        """ Rough time to drain the queue: depth * median service time / workers, at least one second """
+        service_time = metrics.percentile(f"inference.{lane}", 50) or 0.05
+        return max(1, math.ceil(depth * service_time / self.workers))
+
+    def _next_task(self):
+        # strict priority: bulk work only runs when no interactive work is waiting
+        with self._cond:
+            while not any(self._queues.values()):
+                self._cond.wait()
+            for lane in LANES:
+                if self._queues[lane]:
+                    return lane, self._queues[lane].popleft()
+
+    def _worker(self):
+        while True:
+            lane, (future, fn, args, kwargs) = self._next_task()
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            metrics.record(f"inference.{lane}", time.perf_counter() - started)
@@ -0,0 +1,274 @@
+# registry of embedding models and the version each stored embedding was made with.
+#
+# every row in journal_entries carries `embeddingModel`, the version of the model that produced summaryEmbedding.
+# upgrading the model:
+#   1. register a new version -> status "building"
+#   2. a throttled background job re-embeds all summaries with the new model into `pending_embeddings`
+#      (not the fallback summary of a failed LLM call: those rows keep a NULL vector, the backfill job redoes them)
+#      (resumable: rows already in pending_embeddings are skipped after a restart)
+#   3. meanwhile queries keep using the active model and the vectors in journal_entries
+#   4. once every row has a pending vector, one transaction copies them into journal_entries and
+#      flips the active version, so queries switch over atomically
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from services.sbert import embeddings_sbert
+from services.sbert.embeddings_sbert import get_embeddings, embedding_to_blob
+from services.metrics.tracker import metrics
+from services.openAI.summaries import FALLBACK_SUMMARY
+from services.db.migrations import migrate
+from services.db.compression import register as register_sql_functions
+
+DEFAULT_VERSION = "v1"
+
+
+class ModelRegistry:
+    def __init__(self, db_path, refresh_interval=5.0, writer=None):
+        self.db_path = db_path
+        # the app's GroupCommitWriter: entry writes of the jobs go through it. None in the command line tools
+        self.writer = writer
+        self.refresh_interval = refresh_interval
+        self._active = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.job = None
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @contextmanager
+    def session(self):
+        """ Short-lived connection: commits on success, always closed """
+        conn = self.connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def write(self, mutation):
+        """ Run mutation(cursor) through the writer, or in a transaction of its own without one. Returns its result """
+        if self.writer is not None:
+            return self.writer.execute(mutation)
+        conn = self.connect()
+        try:
+            register_sql_functions(conn)  # the FTS triggers of a compressed database need saga_content()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = mutation(cursor)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.close()
+
+    def bootstrap(self, default_model_name=embeddings_sbert.MODEL_NAME):
+        """ Register the current model as v1 on a fresh database, and tag untagged embeddings with it """
+        conn = self.connect()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        with self.session() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM embedding_models")
+            if cursor.fetchone()[0] == 0:
+                now = datetime.now().isoformat()
+                cursor.execute(
+                    "INSERT INTO embedding_models (version, model_name, status, created_at, activated_at) VALUES (?, ?, 'active', ?, ?)",
+                    (DEFAULT_VERSION, default_model_name, now, now),
+                )
+            active_version, _ = self._read_active(cursor)
+            cursor.execute(
+                "UPDATE journal_entries SET embeddingModel = ? WHERE embeddingModel IS NULL AND summaryEmbedding IS NOT NULL",
+                (active_version,),
+            )
+        self.active_version(force=True)
+
+    def _read_active(self, cursor):
+        cursor.execute("SELECT version, model_name FROM embedding_models WHERE status = 'active'")
+        return cursor.fetchone()
+
+    def active_model(self, force=False):
+        """
+        (version, model_name) new embeddings are made with and tagged with. Re-read from the db every few seconds,
+        so other worker processes pick up a switch-over too. Resolve it once per write and encode with that
+        model_name: the default model of get_embedding may flip in between.
+        """
+        with self._lock:
+            if force or self._active is None or time.monotonic() - self._checked_at > self.refresh_interval:
+                with self.session() as conn:
+                    version, model_name = self._read_active(conn.cursor())
+                if self._active != (version, model_name):
+                    embeddings_sbert.set_active_model(model_name)
+                self._active = (version, model_name)
+                self._checked_at = time.monotonic()
+            return self._active
+
+    def active_version(self, force=False):
+        """ Version of the active model (see active_model) """
+        return self.active_model(force)[0]
+
+    def building_version(self):
+        with self.session() as conn:
+            row = conn.execute("SELECT version, model_name FROM embedding_models WHERE status = 'building'").fetchone()
+        return row
+
+    def list_models(self):
+        with self.session() as conn:
+            rows = conn.execute("SELECT version, model_name, status, created_at, activated_at FROM embedding_models ORDER BY created_at").fetchall()
+        return [
+            {"version": r[0], "model_name": r[1], "status": r[2], "created_at": r[3], "activated_at": r[4]}
+            for r in rows
+        ]
+
+    def register(self, version, model_name):
+        """ Add a new model version to build. Only one version can be building at a time """
+        with self.session() as conn:
+            cursor = conn.cursor()
+            if cursor.execute("SELECT 1 FROM embedding_models WHERE version = ?", (version,)).fetchone():
+                raise ValueError(f"Model version {version} already exists")
+            if cursor.execute("SELECT 1 FROM embedding_models WHERE status = 'building'").fetchone():
+                raise ValueError("Another model version is still being built")
+            cursor.execute(
+                "INSERT INTO embedding_models (version, model_name, status, created_at) VALUES (?, ?, 'building', ?)",
+                (version, model_name, datetime.now().isoformat()),
+            )
+
+    def invalidate(self, entry_id, conn=None):
+        """ An entry's summary changed: drop its pending vector so the re-embed job redoes it """
+        if conn is not None:
+            conn.execute("DELETE FROM pending_embeddings WHERE entry_id = ?", (entry_id,))
+            return
+        with self.session() as own_conn:
+            own_conn.execute("DELETE FROM pending_embeddings WHERE entry_id = ?", (entry_id,))
+
+    def switch_over(self, version):
+        """
+        Copy the pending vectors into journal_entries and make `version` the active model, in one transaction.
+        Returns False (and changes nothing) if some rows still miss a pending vector.
+        """
+        def switch(cursor):
+            cursor.execute("""
+                SELECT COUNT(*) FROM journal_entries e
+                WHERE e.summary IS NOT NULL AND e.summary != ?
+                AND NOT EXISTS (SELECT 1 FROM pending_embeddings p WHERE p.entry_id = e.id AND p.version = ?)
+            """, (FALLBACK_SUMMARY, version))
+            if cursor.fetchone()[0] > 0:
+                return False
+            cursor.execute("""
+                UPDATE journal_entries
+                SET summaryEmbedding = (SELECT p.embedding FROM pending_embeddings p WHERE p.entry_id = journal_entries.id AND p.version = ?),
+                    embeddingModel = ?
+                WHERE summary IS NOT NULL AND summary != ?
+            """, (version, version, FALLBACK_SUMMARY))
+            now = datetime.now().isoformat()
+            cursor.execute("UPDATE embedding_models SET status = 'retired' WHERE status = 'active'")
+            cursor.execute("UPDATE embedding_models SET status = 'active', activated_at = ? WHERE version = ?", (now, version))
+            cursor.execute("DELETE FROM pending_embeddings WHERE version = ?", (version,))
+            return True
+
+        if not self.write(switch):
+            return False
+        self.active_version(force=True)
+        return True
+
+    def start_reembedding(self, batch_size=64, rows_per_second=50.0):
+        """ Start (or resume) the background job for the version being built, if any """
+        building = self.building_version()
+        if building is None:
+            return None
+        if self.job is not None and self.job.is_alive():
+            return self.job
+        version, model_name = building
+        self.job = ReembedJob(self, version, model_name, batch_size=batch_size, rows_per_second=rows_per_second)
+        self.job.start()
+        return self.job
+
+
+class ReembedJob(threading.Thread):
+    def __init__(self, registry, version, model_name, batch_size=64, rows_per_second=50.0):
+        super().__init__(name=f"reembed-{version}", daemon=True)
+        self.registry = registry
+        self.version = version
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.rows_per_second = rows_per_second
+        self.processed = 0
+        self.remaining = None
+        self.status = "pending"
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def progress(self):
+        return {
+            "version": self.version,
+            "model_name": self.model_name,
+            "status": self.status,
+            "processed": self.processed,
+            "remaining": self.remaining,
+            "error": self.error,
+        }
+
+    def _next_batch(self, cursor):
+        cursor.execute("""
+            SELECT e.id, e.summary FROM journal_entries e
+            WHERE e.summary IS NOT NULL AND e.summary != ?
+            AND NOT EXISTS (SELECT 1 FROM pending_embeddings p WHERE p.entry_id = e.id AND p.version = ?)
+            LIMIT ?
+        """, (FALLBACK_SUMMARY, self.version, self.batch_size))
+        return cursor.fetchall()
+
+    def run(self):
+        self.status = "running"
+        conn = self.registry.connect()
+        try:
+            cursor = conn.cursor()
+            while not self._stop_event.is_set():
+                rows = self._next_batch(cursor)
+                if not rows:
+                    # every row has a vector for the new version: try to switch (fails if a write sneaked in)
+                    if self.registry.switch_over(self.version):
+                        self.status = "complete"
+                        return
+                    continue
+
+                started = time.perf_counter()
+                embeddings = get_embeddings([row[1] for row in rows], lane="bulk", model_name=self.model_name)
+                # only store the vector if the summary did not change while we were encoding it
+                pending = [(row[0], self.version, embedding_to_blob(embedding), row[0], row[1]) for row, embedding in zip(rows, embeddings)]
+                self.registry.write(lambda write_cursor: write_cursor.executemany(
+                    """
+                    INSERT OR REPLACE INTO pending_embeddings (entry_id, version, embedding)
+                    SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM journal_entries WHERE id = ? AND summary = ?)
+                    """,
+                    pending,
+                ))
+                self.processed += len(rows)
+                metrics.increment("reembed.rows", len(rows))
+                cursor.execute("""
+                    SELECT COUNT(*) FROM journal_entries e
+                    WHERE e.summary IS NOT NULL AND e.summary != ?
+                    AND NOT EXISTS (SELECT 1 FROM pending_embeddings p WHERE p.entry_id = e.id AND p.version = ?)
+                """, (FALLBACK_SUMMARY, self.version))
+                self.remaining = cursor.fetchone()[0]
+
+                # throttle: keep the bulk lane from hogging the inference workers
+                elapsed = time.perf_counter() - started
+                self._stop_event.wait(max(0.0, len(rows) / self.rows_per_second - elapsed))
+            self.status = "stopped"
+        except Exception as e:
+            print(f"Error while re-embedding with {self.model_name}: {e}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            conn.close()
@@ -0,0 +1,335 @@
+# end-to-end load harness: the real HTTP service under uvicorn, the LLM replaced by the local fake OpenAI server.
+#
+# the app runs in its own process against a fresh database, with OPENAI_BASE_URL pointing at
+# services/openAI/fake_server.py (latency distribution and error rate are configurable). The harness seeds some
+# entries, then drives a mixed workload (create, update, list, search, generate-prompt) open-loop at each target
+# RPS in turn: requests are sent on schedule whether or not earlier ones have finished, and latency is measured
+# from the scheduled send time, so a backed-up server shows up in the percentiles instead of slowing the load down.
+#
+# per step it reports p50/p95/p99 per operation, error rate and the throughput actually achieved; the first step
+# that misses its target (too slow, too many errors, or not keeping up with the offered rate) is the saturation point.
+# the JSON report carries the git commit, so runs can be compared across commits.
+# --backup starts an online backup (POST /admin/backup) at the beginning of every step, to see what it costs the
+# requests running next to it (compare with a run without it):
+#
+#   cd saga-backend
+#   python ../tests/performance_test/load_harness.py --rps 5 10 20 40 --duration 20 --llm-latency lognormal:400:0.5 --out load.json
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+BACKEND = Path(__file__).resolve().parent.parent.parent / "saga-backend"
+sys.path.insert(0, str(BACKEND))
+
+from services.openAI.fake_server import FakeOpenAIServer
+
+# relative weight of each operation in the mix
+DEFAULT_MIX = {"create": 2, "update": 1, "list": 4, "search": 2, "prompt": 1}
+PROMPT_TYPES = ["daily", "reflective", "creative"]
+WORDS = (
+    "today walk river garden work friend family coffee rain sun morning evening tired happy worried grateful "
+    "meeting project book music dinner sleep run city train weekend plan idea letter call quiet busy"
+).split()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def latency_summary(samples):
+    """ count / p50 / p95 / p99 / max in milliseconds """
+    if not samples:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(p50) * 1000, 2),
+        "p95_ms": round(float(p95) * 1000, 2),
+        "p99_ms": round(float(p99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+
+class AppServer:
+    """ The FastAPI app under uvicorn in a child process, on its own database """
+
+    def __init__(self, llm_base_url, db_path, port=None, startup_timeout=120, env=None):
+        self.port = port or free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.startup_timeout = startup_timeout
+        self.env = {
+            **os.environ,
+            "OPENAI_BASE_URL": llm_base_url,
+            "OPENAI_API_KEY": "fake",
+            "SAGA_DB_PATH": db_path,
+            **(env or {}),
+        }
+        self._process = None
+
+    def start(self):
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND,
+            env=self.env,
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self._process.returncode} during startup")
+            try:
+                if httpx.get(self.base_url + "/", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"App did not start within {self.startup_timeout}s")
+
+    def stop(self):
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class Workload:
+    """ Picks the next operation by weight and builds its request from the entries created so far """
+
+    def __init__(self, mix=None, seed=0):
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.rng = random.Random(seed)
+        self.entries = []  # ids of entries the app knows about, newest last
+
+    def next_operation(self):
+        names = [name for name, weight in self.mix.items() if weight > 0]
+        operation = self.rng.choices(names, weights=[self.mix[name] for name in names])[0]
+        if operation == "update" and not self.entries:
+            return "create"
+        return operation
+
+    def request(self, operation):
+        """ (method, path, json body) """
+        if operation == "create":
+            return "POST", "/journal/", {"title": random_text(self.rng, 3), "content": random_text(self.rng, 80)}
+        if operation == "update":
+            entry_id = self.rng.choice(self.entries)
+            return "PUT", f"/journal/{entry_id}", {"title": random_text(self.rng, 3), "content": random_text(self.rng, 80)}
+        if operation == "list":
+            return "GET", "/journal/?limit=20&include_content=false", None
+        if operation == "search":
+            return "GET", f"/journal/search?q={random_text(self.rng, 2).rstrip('.')}&k=10", None
+        recent = [{"id": entry_id, "title": "Recent", "content": random_text(self.rng, 40)} for entry_id in self.entries[-3:]]
+        return "POST", "/generate-prompt", {"promptType": self.rng.choice(PROMPT_TYPES), "recentEntries": recent}
+
+    def record(self, operation, response):
+        if operation == "create" and response.status_code == 200:
+            self.entries.append(response.json()["entry"]["id"])
+
+
+async def timed_request(client, workload, operation, scheduled, results):
+    method, path, body = workload.request(operation)
+    try:
+        response = await client.request(method, path, json=body)
+        status = response.status_code
+        workload.record(operation, response)
+    except httpx.HTTPError as e:
+        status = type(e).__name__  # timeout / connection error
+    # from the scheduled send time: time spent waiting for a free connection counts too
+    results.append((operation, time.perf_counter() - scheduled, status))
+
+
+async def run_step(client, workload, rps, duration, max_in_flight, arrivals="poisson"):
+    """ Send requests open-loop at rps for duration seconds. Returns the step report """
+    results, tasks, dropped = [], set(), 0
+    started = time.perf_counter()
+    next_send = started
+    while next_send < started + duration:
+        await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+        if len(tasks) >= max_in_flight:
+            dropped += 1  # the client is saturated: counted as an error, not queued
+        else:
+            task = asyncio.create_task(timed_request(client, workload, workload.next_operation(), next_send, results))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        next_send += workload.rng.expovariate(rps) if arrivals == "poisson" else 1 / rps
+    if tasks:
+        await asyncio.wait(tasks)
+    elapsed = time.perf_counter() - started
+
+    by_operation = defaultdict(list)
+    errors = defaultdict(int)
+    for operation, seconds, status in results:
+        if status == 200:
+            by_operation[operation].append(seconds)
+        else:
+            errors[f"{operation}:{status}"] += 1
+    sent = len(results) + dropped
+    ok = sum(len(samples) for samples in by_operation.values())
+    return {
+        "target_rps": rps,
+        "duration_s": round(elapsed, 2),
+        "sent": sent,
+        "dropped": dropped,
+        # poisson arrivals: over a short step the offered rate can be well off the target
+        "offered_rps": round(sent / duration, 2),
+        "achieved_rps": round(ok / elapsed, 2),
+        "error_rate": round((sent - ok) / sent, 4) if sent else 0.0,
+        "errors": dict(errors),
+        "latency": latency_summary([seconds for samples in by_operation.values() for seconds in samples]),
+        "operations": {operation: latency_summary(samples) for operation, samples in sorted(by_operation.items())},
+    }
+
+
+def saturation_reason(step, slo_p99_ms, max_error_rate, min_throughput=0.9):
+    """ Why this step counts as saturated, or None """
+    if step["error_rate"] > max_error_rate:
+        return f"error rate {step['error_rate']} > {max_error_rate}"
+    if step["achieved_rps"] < min_throughput * step["offered_rps"]:
+        return f"achieved {step['achieved_rps']} rps < {min_throughput:.0%} of the {step['offered_rps']} offered"
+    p99 = step["latency"].get("p99_ms")
+    if p99 is not None and p99 > slo_p99_ms:
+        return f"p99 {p99} ms > {slo_p99_ms} ms"
+    return None
+
+
+async def drive(base_url, rps_steps, duration, mix, seed_entries, max_in_flight, slo_p99_ms, max_error_rate,
+                arrivals, timeout, stop_at_saturation, backup=False):
+    workload = Workload(mix)
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for _ in range(seed_entries):
+            method, path, body = workload.request("create")
+            workload.record("create", await client.request(method, path, json=body))
+
+        steps, saturation = [], None
+        for rps in rps_steps:
+            if backup:
+                (await client.post("/admin/backup")).raise_for_status()
+            step = await run_step(client, workload, rps, duration, max_in_flight, arrivals)
+            step["server_metrics"] = (await client.get("/metrics")).json()
+            if backup:
+                step["backup"] = (await client.get("/admin/backup")).json()["backup"]
+            steps.append(step)
+            reason = saturation_reason(step, slo_p99_ms, max_error_rate)
+            print(f"{rps:>7} rps: achieved {step['achieved_rps']}, p99 {step['latency'].get('p99_ms')} ms, errors {step['error_rate']}"
+                  + (f"  <- saturated ({reason})" if reason else ""), file=sys.stderr)
+            if reason and saturation is None:
+                saturation = {"target_rps": rps, "reason": reason}
+                if stop_at_saturation:
+                    break
+    sustained = [step["target_rps"] for step in steps if not saturation or step["target_rps"] < saturation["target_rps"]]
+    return steps, saturation, max(sustained) if sustained else None
+
+
+def run_load(rps_steps=(5, 10, 20), duration=10.0, llm_latency="lognormal:400:0.5", llm_error_rate=0.0, mix=None,
+             seed_entries=20, max_in_flight=256, slo_p99_ms=2000.0, max_error_rate=0.01, arrivals="poisson",
+             timeout=30.0, stop_at_saturation=True, app_env=None, backup=False):
+    """ Boot the fake LLM and the app, run every step, return the JSON-able report """
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeOpenAIServer(latency=llm_latency, error_rate=llm_error_rate) as fake_llm, \
+            AppServer(fake_llm.base_url, os.path.join(tmp, "journal.db"), env={"SAGA_BACKUP_DIR": os.path.join(tmp, "backups"), **(app_env or {})}) as app:
+        steps, saturation, sustained = asyncio.run(drive(
+            app.base_url, list(rps_steps), duration, mix, seed_entries, max_in_flight, slo_p99_ms, max_error_rate,
+            arrivals, timeout, stop_at_saturation, backup,
+        ))
+        llm_requests = fake_llm.requests
+    return {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(),
+        "config": {
+            "rps_steps": list(rps_steps),
+            "duration_s": duration,
+            "mix": dict(mix or DEFAULT_MIX),
+            "arrivals": arrivals,
+            "llm_latency": str(llm_latency),
+            "llm_error_rate": llm_error_rate,
+            "seed_entries": seed_entries,
+            "max_in_flight": max_in_flight,
+            "slo_p99_ms": slo_p99_ms,
+            "max_error_rate": max_error_rate,
+            "app_env": dict(app_env or {}),
+            "backup": backup,
+        },
+        "steps": steps,
+        "saturation": saturation,
+        "max_sustained_rps": sustained,
+        "llm_requests": llm_requests,
+    }
+
+
+def parse_mix(spec):
+    """ "create=2,list=4" -> {"create": 2.0, "list": 4.0}, unknown operations rejected """
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {sorted(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the journal API end to end against a fake OpenAI server")
+    parser.add_argument("--rps", type=float, nargs="+", default=[5, 10, 20, 40], help="target request rates, one step each")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per step")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="operation weights, e.g. create=2,update=1,list=4,search=2,prompt=1")
+    parser.add_argument("--arrivals", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--llm-latency", default="lognormal:400:0.5", help="fake LLM latency: fixed:MS, uniform:LOW:HIGH, lognormal:MEDIAN_MS:SIGMA")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed-entries", type=int, default=20)
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--slo-p99-ms", type=float, default=2000)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--backup", action="store_true", help="run an online backup during every step")
+    parser.add_argument("--keep-going", action="store_true", help="run every step, also after the saturation point")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="extra environment for the app (repeatable)")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    report = run_load(
+        args.rps, args.duration, args.llm_latency, args.llm_error_rate, args.mix, args.seed_entries, args.max_in_flight,
+        args.slo_p99_ms, args.max_error_rate, args.arrivals, args.timeout, not args.keep_going,
+        dict(item.split("=", 1) for item in args.env), args.backup,
+    )
+    output = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(output)
+    else:
+        print(output)
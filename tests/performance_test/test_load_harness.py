@@ -0,0 +1,32 @@
+from load_harness import Workload, run_load, saturation_reason, parse_mix
+
+# Run by: pytest tests/performance_test/test_load_harness.py
+# a full load test is run from the command line, see load_harness.py
+
+
+def step(target_rps, achieved_rps, error_rate=0.0, p99_ms=100.0):
+    return {"target_rps": target_rps, "offered_rps": target_rps, "achieved_rps": achieved_rps, "error_rate": error_rate, "latency": {"p99_ms": p99_ms}}
+
+
+def test_saturation_reasons():
+    assert saturation_reason(step(10, 9.8), slo_p99_ms=500, max_error_rate=0.01) is None
+    assert "error rate" in saturation_reason(step(10, 9.8, error_rate=0.05), 500, 0.01)
+    assert "achieved" in saturation_reason(step(10, 6), 500, 0.01)
+    assert "p99" in saturation_reason(step(10, 10, p99_ms=900), 500, 0.01)
+
+
+def test_workload_mix():
+    workload = Workload(parse_mix("create=1,list=1"), seed=1)
+    operations = {workload.next_operation() for _ in range(100)}
+    assert operations == {"create", "list"}
+    # nothing to update yet: falls back to a create
+    assert Workload({"update": 1}).next_operation() == "create"
+
+
+def test_short_run_end_to_end():
+    report = run_load(rps_steps=[5], duration=1, llm_latency="fixed:5", seed_entries=2)
+    [result] = report["steps"]
+    assert result["sent"] > 0
+    assert result["error_rate"] == 0.0
+    assert {"p50_ms", "p95_ms", "p99_ms"} <= set(result["latency"])
+    assert report["llm_requests"] >= 2  # the app summarized through the fake server
@@ -32,4 +32,51 @@ def db_connection():
     
     yield conn  # Pass connection to the test
     
-    conn.close() # Cleanup after test is done
\ No newline at end of file
+    conn.close() # Cleanup after test is done
+
+@pytest.fixture
+def migrated_db():
+    """
+    In-memory database with the full, migrated schema (services/db/migrations.py)
+    """
+    from services.db.migrations import migrate
+
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+
+    yield conn
+
+    conn.close()
+
+
+class FakeRegistry:
+    """ Stands in for the ModelRegistry: v1 is the active embedding model, tests switch by setting version """
+    version = "v1"
+
+    def active_model(self):
+        return self.version, f"model-{self.version}"
+
+    def active_version(self):
+        return self.version
+
+
+@pytest.fixture
+def registry():
+    return FakeRegistry()
+
+
+@pytest.fixture
+def migrated_db_file(tmp_path):
+    """
+    Migrated database in a temporary file, for code that opens its own connections (index, graph, themes).
+    Yields (db_path, conn)
+    """
+    from services.db.migrations import migrate
+
+    db_path = str(tmp_path / "journal.db")
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+
+    yield db_path, conn
+
+    conn.close()
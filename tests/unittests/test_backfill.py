@@ -0,0 +1,176 @@
+import sqlite3
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from services.backfill.backfill import BackfillJob
+from services.db.writer import GroupCommitWriter
+from services.openAI.summaries import FALLBACK_SUMMARY
+from services.sbert.model_registry import ModelRegistry
+from services.sbert.embeddings_sbert import embedding_to_blob
+import main
+
+# backfill runs on a temporary database with a fake LLM and get_embeddings replaced by a deterministic function
+
+
+class FakeLLM:
+    def __init__(self, fail_on=()):
+        self.calls = []
+        self.fail_on = fail_on
+
+    def complete(self, messages, max_tokens=60):
+        content = messages[1]["content"]
+        self.calls.append(content)
+        if any(text in content for text in self.fail_on):
+            raise Exception("LLM down")
+        return "You wrote a summary."
+
+
+def fake_embeddings(texts, lane="bulk", model_name=None):
+    return np.ones((len(texts), 3), dtype=np.float32)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+    CREATE TABLE journal_entries (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        summary TEXT DEFAULT NULL,
+        prompt TEXT DEFAULT NULL,
+        promptType TEXT DEFAULT NULL,
+        summaryEmbedding BLOB,
+        use_for_prompt_generation BOOLEAN DEFAULT TRUE
+    );
+    """)
+    blob = embedding_to_blob(np.zeros(3, dtype=np.float32))
+    conn.executemany(
+        "INSERT INTO journal_entries (id, title, content, summary, summaryEmbedding) VALUES (?, 't', ?, ?, ?)",
+        [
+            ("a", "fallback", FALLBACK_SUMMARY, None),     # OpenAI failed in add_entry
+            ("b", "no embedding", "You did b.", None),     # update_entry wrote NULL
+            ("c", "fine", "You did c.", blob),             # nothing to do
+            ("d", "no summary", None, None),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    with patch("services.sbert.model_registry.embeddings_sbert.set_active_model"):
+        registry = ModelRegistry(db_path)
+        registry.bootstrap()
+        yield db_path, registry
+
+
+def read_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, summary, summaryEmbedding IS NOT NULL, embeddingModel FROM journal_entries ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def test_backfill_fills_missing_summaries_and_embeddings(db):
+    db_path, registry = db
+    llm = FakeLLM()
+    with patch("services.backfill.backfill.get_embeddings", side_effect=fake_embeddings) as encode:
+        job = BackfillJob(db_path, llm, registry, batch_size=10)
+        job.run()
+
+    assert job.status == "complete"
+    assert len(llm.calls) == 2  # only a and d needed a summary
+    assert encode.call_count == 1  # one batched encode for the whole batch
+    assert read_rows(db_path) == [
+        ("a", "You wrote a summary.", 1, "v1"),
+        ("b", "You did b.", 1, "v1"),
+        ("c", "You did c.", 1, "v1"),
+        ("d", "You wrote a summary.", 1, "v1"),
+    ]
+    assert job.progress()["processed"] == 3
+
+
+def test_backfill_writes_through_the_group_commit_writer(db):
+    db_path, registry = db
+    registry.writer = GroupCommitWriter(db_path).start()
+    try:
+        with patch("services.backfill.backfill.get_embeddings", side_effect=fake_embeddings):
+            job = BackfillJob(db_path, FakeLLM(), registry, batch_size=2)
+            job.run()
+        assert job.status == "complete"
+        # two batches (rows with their checkpoint) and the final checkpoint reset
+        assert registry.writer.stats()["mutations"] == 3
+    finally:
+        registry.writer.close()
+    assert [row[2] for row in read_rows(db_path)] == [1, 1, 1, 1]
+
+
+def test_backfill_resumes_from_checkpoint(db):
+    db_path, registry = db
+    with patch("services.backfill.backfill.get_embeddings", side_effect=fake_embeddings):
+        first = BackfillJob(db_path, FakeLLM(), registry, batch_size=1, max_batches=1)
+        first.run()
+        assert first.status == "stopped"
+
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT last_id FROM backfill_checkpoints").fetchone() == ("a",)
+        conn.close()
+
+        llm = FakeLLM()
+        second = BackfillJob(db_path, llm, registry, batch_size=1)
+        second.run()
+
+    assert second.status == "complete"
+    assert second.stats["processed"] == 2  # b and d
+    assert len(llm.calls) == 1
+
+
+def test_failed_summaries_are_left_for_the_next_run(db):
+    db_path, registry = db
+    with patch("services.backfill.backfill.get_embeddings", side_effect=fake_embeddings):
+        job = BackfillJob(db_path, FakeLLM(fail_on=["fallback"]), registry, batch_size=10)
+        job.run()
+
+    assert job.stats["failed"] == 1
+    assert read_rows(db_path)[0] == ("a", FALLBACK_SUMMARY, 0, None)
+
+
+@patch('main.client.chat.completions.create')
+def test_update_without_summary_change_keeps_embedding(mock_create):
+    mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="Kept summary."))])
+    client = TestClient(main.app)
+    entry_id = client.post("/journal/", json={"title": "Old", "content": "Same content"}).json()["entry"]["id"]
+
+    response = client.put(f"/journal/{entry_id}", json={"title": "New title", "content": "Same content"})
+    assert response.status_code == 200
+
+    main.cursor.execute("SELECT summaryEmbedding, embeddingModel FROM journal_entries WHERE id = ?", (entry_id,))
+    embedding, model_version = main.cursor.fetchone()
+    assert embedding is not None
+    assert model_version == main.registry.active_version()
+
+
+def test_backfill_encodes_with_the_model_of_its_version_tag(db):
+    db_path, registry = db
+    with patch.object(registry, "active_model", return_value=("v1", "model-of-v1")), \
+            patch("services.backfill.backfill.get_embeddings", side_effect=fake_embeddings) as encode:
+        BackfillJob(db_path, FakeLLM(), registry, batch_size=10).run()
+    assert {call.kwargs["model_name"] for call in encode.call_args_list} == {"model-of-v1"}
+
+
+@patch('main.client.chat.completions.create')
+def test_writes_encode_with_the_model_they_are_tagged_with(mock_create):
+    mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="A summary."))])
+    client = TestClient(main.app)
+    # another worker switched models: the version read for the tag and the model used must be the same pair
+    with patch.object(main.registry, "active_model", return_value=("v-next", "next-model")), \
+            patch("main.get_embedding", return_value=np.zeros(384, dtype=np.float32)) as encode:
+        entry_id = client.post("/journal/", json={"title": "Switch", "content": "During a switch"}).json()["entry"]["id"]
+    try:
+        assert encode.call_args.kwargs["model_name"] == "next-model"
+        main.cursor.execute("SELECT embeddingModel FROM journal_entries WHERE id = ?", (entry_id,))
+        assert main.cursor.fetchone()[0] == "v-next"
+    finally:
+        client.delete(f"/journal/{entry_id}")
@@ -0,0 +1,73 @@
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from main import app
+from services.db.queries import etag_for, etag_matches
+
+client = TestClient(app)
+
+
+def test_etag_matching():
+    etag = etag_for(12)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"seq-3", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"seq-11"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_feed_reads_change_log_by_seq(migrated_db):
+    plan = " | ".join(row[3] for row in migrated_db.execute(
+        "EXPLAIN QUERY PLAN SELECT c.seq FROM change_log c LEFT JOIN journal_entries e ON e.id = c.entry_id WHERE c.seq > ? ORDER BY c.seq LIMIT ?",
+        (0, 10),
+    ))
+    assert "idx_change_log_seq" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@patch('main.client.chat.completions.create')
+def test_conditional_get_and_change_feed(mock_create):
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "Summary"
+    mock_create.return_value = mock_response
+
+    listing = client.get("/journal/")
+    assert listing.status_code == 200
+    etag, since = listing.headers["ETag"], int(listing.headers["X-Change-Seq"])
+
+    # nothing changed: 304 without a body
+    unchanged = client.get("/journal/", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert client.get("/journal/changes", params={"since": since}, headers={"If-None-Match": etag}).status_code == 304
+
+    first = client.post("/journal/", json={"title": "One", "content": "First"}).json()["entry"]
+    second = client.post("/journal/", json={"title": "Two", "content": "Second"}).json()["entry"]
+    try:
+        client.put(f"/journal/{first['id']}", json={"title": "One, edited", "content": "First"})
+        client.delete(f"/journal/{second['id']}")
+
+        # the list changed: new tag
+        changed = client.get("/journal/", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+
+        feed = client.get("/journal/changes", params={"since": since}).json()
+        changes = {change.get("id") or change["entry"]["id"]: change for change in feed["changes"]}
+        assert changes[first["id"]]["op"] == "upsert"
+        assert changes[first["id"]]["entry"]["title"] == "One, edited"  # latest version, listed once
+        assert changes[second["id"]] == {"seq": changes[second["id"]]["seq"], "op": "delete", "id": second["id"]}
+        seqs = [change["seq"] for change in feed["changes"]]
+        assert seqs == sorted(seqs)
+        assert feed["next_since"] == seqs[-1] and not feed["has_more"]
+
+        # paging through the feed
+        page = client.get("/journal/changes", params={"since": since, "limit": 1}).json()
+        assert len(page["changes"]) == 1 and page["has_more"]
+        rest = client.get("/journal/changes", params={"since": page["next_since"]}).json()
+        assert [c["seq"] for c in page["changes"] + rest["changes"]] == seqs
+
+        # caught up
+        caught_up = client.get("/journal/changes", params={"since": feed["next_since"]}).json()
+        assert caught_up["changes"] == [] and caught_up["next_since"] == feed["next_since"]
+    finally:
+        client.delete(f"/journal/{first['id']}")
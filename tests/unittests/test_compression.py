@@ -0,0 +1,104 @@
+import sqlite3
+from unittest.mock import patch, MagicMock
+import pytest
+from fastapi.testclient import TestClient
+import main
+from main import app
+from services.db.migrations import migrate
+from services.db.compression import register, train, recompress, storage_report, fts_decoding, set_fts_decoding, MAGIC
+
+client = TestClient(app)
+
+TEXT = "Today I went for a long walk by the river with my sister and we talked about the garden and the weekend plans."
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "journal.db"))
+    migrate(conn)
+    for i in range(20):
+        conn.execute(
+            "INSERT INTO journal_entries (id, title, content, date) VALUES (?, ?, ?, ?)",
+            (f"e{i}", f"Day {i}", f"{TEXT} Entry number {i}.", f"2024-01-{i + 1:02d}T09:00:00"),
+        )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_encode_decode_roundtrip_with_dictionary(conn):
+    codec = register(conn)
+    assert train(conn, "zlib") is not None
+
+    stored = codec.encode(TEXT, "zlib")
+    assert isinstance(stored, bytes) and stored.startswith(MAGIC)
+    assert len(stored) < len(TEXT.encode())
+    assert codec.decode(stored) == TEXT
+    # short texts and plain rows are left alone
+    assert codec.encode("short", "zlib") == "short"
+    assert codec.decode(TEXT) == TEXT
+
+
+def test_plain_connections_can_write_until_compression_is_used(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    conn.close()
+
+    # no app functions registered: the sqlite3 CLI, scripts, a restored backup
+    plain = sqlite3.connect(db_path)
+    plain.execute("INSERT INTO journal_entries (id, title, content) VALUES ('p', 't', 'plain walk')")
+    plain.execute("UPDATE journal_entries SET content = 'plain run' WHERE id = 'p'")
+    assert plain.execute("SELECT COUNT(*) FROM journal_fts WHERE journal_fts MATCH 'run'").fetchone()[0] == 1
+    plain.execute("DELETE FROM journal_entries WHERE id = 'p'")
+    plain.commit()
+    assert not fts_decoding(plain)
+    plain.close()
+
+
+def test_recompress_keeps_rows_readable_and_searchable(conn):
+    train(conn, "zlib")
+    assert recompress(conn, "zlib") == 20
+
+    assert fts_decoding(conn)
+    report = storage_report(conn)
+    assert report["compressed_rows"] == 20
+    assert report["ratio"] > 1
+
+    content = conn.execute("SELECT saga_content(content) FROM journal_entries WHERE id = 'e3'").fetchone()[0]
+    assert content == f"{TEXT} Entry number 3."
+    # full-text search indexes the text, not the stored bytes
+    hits = conn.execute(
+        "SELECT COUNT(*) FROM journal_fts WHERE journal_fts MATCH 'river AND sister'"
+    ).fetchone()[0]
+    assert hits == 20
+
+    # and back to plain text
+    assert recompress(conn, None) == 20
+    assert storage_report(conn)["compressed_rows"] == 0
+    assert not fts_decoding(conn)  # plain triggers again
+    assert conn.execute("SELECT content FROM journal_entries WHERE id = 'e3'").fetchone()[0] == f"{TEXT} Entry number 3."
+
+
+@patch('main.client.chat.completions.create')
+def test_api_stores_compressed_content(mock_create):
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "Summary"
+    mock_create.return_value = mock_response
+
+    set_fts_decoding(main.conn, True)  # what startup does with SAGA_COMPRESS_CONTENT set
+    with patch.object(main, "CONTENT_COMPRESSION", "zlib"):
+        created = client.post("/journal/", json={"title": "Compressed", "content": TEXT}).json()["entry"]
+    entry_id = created["id"]
+    try:
+        stored = main.conn.execute("SELECT content FROM journal_entries WHERE id = ?", (entry_id,)).fetchone()[0]
+        assert isinstance(stored, bytes)
+
+        entries = client.get("/journal/", params={"search": "river"}).json()["entries"]
+        assert next(e for e in entries if e["id"] == entry_id)["content"] == TEXT
+
+        listed = client.get("/journal/", params={"include_content": "false"}).json()["entries"]
+        assert next(e for e in listed if e["id"] == entry_id)["content"] is None
+    finally:
+        client.delete(f"/journal/{entry_id}")
+        set_fts_decoding(main.conn, False)
@@ -0,0 +1,113 @@
+import inspect
+import os
+import subprocess
+import sys
+import threading
+import numpy as np
+import pytest
+from services.sbert.embedding_server import EmbeddingServer, EmbeddingClient
+from services.sbert.inference_pool import InferenceSaturatedError
+
+# the server is tested with a tiny stand-in model, so these tests check the transport and batching,
+# not SBERT itself (that is covered in test_embeddings.py)
+
+
+class LengthModel:
+    """ Encodes a text as [len(text), 1, 0, ...], records the size of every encode call """
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32):
+        self.calls.append(len(texts))
+        embeddings = np.zeros((len(texts), 4), dtype=np.float32)
+        embeddings[:, 0] = [len(t) for t in texts]
+        embeddings[:, 1] = 1
+        return embeddings
+
+
+AUTHKEY = b"test-key"
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = EmbeddingServer(str(tmp_path / "embeddings.sock"), model=LengthModel(), max_wait_ms=50, authkey=AUTHKEY).start()
+    yield server
+    server.stop()
+
+
+def test_encode_single_and_many(server):
+    client = EmbeddingClient(server.address, authkey=AUTHKEY)
+
+    single = client.encode("hello")
+    assert single.shape == (4,)
+    assert single[0] == 5
+
+    many = client.encode(["a", "abc"])
+    assert many.shape == (2, 4)
+    assert list(many[:, 0]) == [1, 3]
+
+
+def test_concurrent_requests_are_batched(server):
+    client = EmbeddingClient(server.address, authkey=AUTHKEY)
+    texts = ["x" * i for i in range(1, 13)]
+    results = {}
+
+    def worker(text):
+        results[text] = client.encode(text)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # every caller gets its own vector back
+    assert all(results[t][0] == len(t) for t in texts)
+    # but the model was called fewer times than there were requests
+    assert sum(server.model.calls) == len(texts)
+    assert len(server.model.calls) < len(texts)
+
+
+def test_full_queue_is_reported_as_saturated(server):
+    server.max_queue["bulk"] = 0
+    client = EmbeddingClient(server.address, authkey=AUTHKEY)
+
+    with pytest.raises(InferenceSaturatedError):
+        client.encode(["a"], lane="bulk")
+
+
+def test_server_is_locked_down(server, tmp_path):
+    # owner-only socket, and no start without an authkey
+    assert os.stat(server.address).st_mode & 0o777 == 0o600
+    with pytest.raises(ValueError):
+        EmbeddingServer(str(tmp_path / "open.sock"), model=LengthModel()).start()
+    with pytest.raises(Exception):
+        EmbeddingClient(server.address, authkey=b"wrong").encode("hello")
+    # and a client with the wrong key does not take the server down
+    assert EmbeddingClient(server.address, authkey=AUTHKEY).encode("hello")[0] == 5
+
+
+def test_only_allowed_models_are_loaded_outside_the_batcher(server):
+    loaded = []
+    server.allowed_models.add("second-model")
+    server._load = lambda model_name: loaded.append(model_name) or LengthModel()
+    client = EmbeddingClient(server.address, authkey=AUTHKEY)
+
+    with pytest.raises(RuntimeError, match="not allowed"):
+        client.encode("hello", model_name="someone/any-model")
+    assert client.encode("hello", model_name="second-model")[0] == 5
+    assert loaded == ["second-model"]
+
+
+def test_remote_mode_does_not_load_torch(tmp_path):
+    # a fresh interpreter: in this one the local model is already loaded
+    code = (
+        "import sys; import services.sbert.embeddings_sbert as e; "
+        "assert e.remote is not None and not e._models; "
+        "assert 'sentence_transformers' not in sys.modules and 'torch' not in sys.modules, sorted(sys.modules)"
+    )
+    env = {**os.environ, "SAGA_EMBEDDING_SOCKET": str(tmp_path / "embeddings.sock")}
+    backend = os.path.dirname(os.path.dirname(os.path.dirname(inspect.getfile(EmbeddingServer))))
+    result = subprocess.run([sys.executable, "-c", code], cwd=backend, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
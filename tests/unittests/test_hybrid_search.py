@@ -0,0 +1,169 @@
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services.sbert.embeddings_sbert import embedding_to_blob
+from RAG.vector_index import VectorIndex
+from RAG.hybrid_search import HybridSearcher, fts_query, rrf_fuse
+
+client = TestClient(app)
+
+# the index and the searcher are tested on a temporary database file with hand-made 3-d vectors:
+# "hiking" points along x, "cooking" along y, "music" along z
+VECTORS = {
+    "hiking": [1.0, 0.0, 0.0],
+    "cooking": [0.0, 1.0, 0.0],
+    "music": [0.0, 0.0, 1.0],
+}
+
+
+def fake_embedding(text, lane="interactive", model_name=None):
+    for word, vector in VECTORS.items():
+        if word in text:
+            return np.array(vector, dtype=np.float32)
+    return np.array([0.3, 0.3, 0.3], dtype=np.float32)
+
+
+def insert(conn, entry_id, title, content, summary, date="2024-05-01T10:00:00", vector=None, model="v1", prompt_type=None):
+    embedding = embedding_to_blob(np.array(vector, dtype=np.float32)) if vector is not None else None
+    conn.execute(
+        "INSERT INTO journal_entries (id, title, content, date, summary, promptType, summaryEmbedding, embeddingModel) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (entry_id, title, content, date, summary, prompt_type, embedding, model),
+    )
+    conn.commit()
+
+
+@pytest.fixture
+def db(migrated_db_file):
+    db_path, conn = migrated_db_file
+    insert(conn, "a", "Mountain day", "We went hiking up the ridge", "A hiking trip", vector=VECTORS["hiking"], prompt_type="daily")
+    insert(conn, "b", "Dinner", "Tried a new pasta recipe", "Cooking pasta", date="2023-01-10T19:00:00", vector=VECTORS["cooking"])
+    insert(conn, "c", "Concert", "Live music in the park, then a short hike home", "Music night", vector=VECTORS["music"])
+    return db_path, conn
+
+
+def test_fts_query_quotes_words():
+    assert fts_query('hiking AND "trip"*') == '"hiking" OR "and" OR "trip"'
+    assert fts_query("  ,, ") == ""
+
+
+def test_rrf_fuse_rewards_agreement():
+    fused = rrf_fuse([["a", "b", "c"], ["b", "a", "d"]], rrf_k=60)
+    assert [entry_id for entry_id, _ in fused[:2]] in (["a", "b"], ["b", "a"])
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert {entry_id for entry_id, _ in fused[2:]} == {"c", "d"}
+
+
+def test_vector_index_catches_up_through_change_log(db, registry):
+    db_path, conn = db
+    index = VectorIndex(db_path, registry)
+    assert index.refresh() is None  # first call: full load
+    assert len(index) == 3
+
+    insert(conn, "d", "Band practice", "Guitar", "More music", vector=VECTORS["music"])
+    conn.execute("DELETE FROM journal_entries WHERE id = 'b'")
+    conn.execute("UPDATE journal_entries SET summaryEmbedding = ? WHERE id = 'a'", (embedding_to_blob(np.array([0.0, 0.0, 2.0], dtype=np.float32)),))
+    conn.commit()
+
+    assert sorted(index.refresh()) == ["a", "b", "d"]
+    assert sorted(index.ids) == ["a", "c", "d"]
+    hits = index.search(np.array(VECTORS["music"], dtype=np.float32), k=3)
+    assert {entry_id for entry_id, _ in hits} == {"a", "c", "d"}
+    assert hits[0][1] == pytest.approx(1.0)
+    # an allow-list restricts the candidates
+    assert [entry_id for entry_id, _ in index.search(np.array(VECTORS["music"]), k=3, allowed_ids={"c"})] == ["c"]
+
+
+def test_vector_index_appends_a_batch_of_new_rows(db, registry):
+    db_path, conn = db
+    index = VectorIndex(db_path, registry)
+    index.refresh()
+    rng = np.random.default_rng(0)
+    vectors = {f"n{i}": rng.random(3).astype(np.float32) for i in range(200)}
+    for entry_id, vector in vectors.items():
+        insert(conn, entry_id, "t", "c", "s", vector=vector)
+    conn.execute("DELETE FROM journal_entries WHERE id = 'a'")
+    conn.commit()
+
+    index.refresh()
+    assert len(index) == index.matrix.shape[0] == 202
+    # every id still points at its own vector
+    for entry_id in ("n0", "n137", "n199", "c"):
+        expected = vectors[entry_id] if entry_id in vectors else np.array(VECTORS["music"], dtype=np.float32)
+        assert index.vector(entry_id) == pytest.approx(expected / np.linalg.norm(expected))
+
+
+def test_vector_index_reloads_on_model_switch(db, registry):
+    db_path, conn = db
+    index = VectorIndex(db_path, registry)
+    index.refresh()
+    registry.version = "v2"
+    index.refresh()
+    assert len(index) == 0  # no vectors of v2 yet, v1 vectors must not be compared with v2 queries
+
+
+def test_hybrid_search_fuses_both_retrievers(db, registry):
+    db_path, conn = db
+    searcher = HybridSearcher(db_path, VectorIndex(db_path, registry))
+    with patch("RAG.hybrid_search.get_embedding", side_effect=fake_embedding):
+        result = searcher.search("hiking", k=3)
+
+    hits = result["hits"]
+    # "a" is first for both retrievers, "c" only matches lexically (porter stemming: hike ~ hiking)
+    assert hits[0]["id"] == "a"
+    assert hits[0]["lexical_rank"] == 1 and hits[0]["semantic_rank"] == 1
+    concert = next(hit for hit in hits if hit["id"] == "c")
+    assert concert["lexical_rank"] == 2
+    assert set(result["timings_ms"]) >= {"lexical", "embed", "semantic", "retrieval", "fusion", "hydrate", "total"}
+
+
+def test_semantic_side_encodes_with_the_model_of_the_index_version(db, registry):
+    db_path, conn = db
+    searcher = HybridSearcher(db_path, VectorIndex(db_path, registry))
+    with patch("RAG.hybrid_search.get_embedding", side_effect=fake_embedding) as encode:
+        assert searcher.search("hiking", k=3)["hits"][0]["semantic_rank"] == 1
+    assert encode.call_args.kwargs["model_name"] == "model-v1"
+
+    # the query was encoded for v1, but the index has moved on to v2 meanwhile: no semantic hits
+    index = searcher.index
+    assert index.search(fake_embedding("hiking"), k=3, version="v1")
+    registry.version = "v2"
+    assert index.search(fake_embedding("hiking"), k=3, version="v1") == []
+
+
+def test_hybrid_search_applies_filters_to_both_retrievers(db, registry):
+    db_path, conn = db
+    searcher = HybridSearcher(db_path, VectorIndex(db_path, registry))
+    with patch("RAG.hybrid_search.get_embedding", side_effect=fake_embedding):
+        result = searcher.search("cooking pasta", ["date_epoch >= ?"], [1704067200], k=3)  # 2024 and later
+    assert "b" not in [hit["id"] for hit in result["hits"]]
+
+
+def test_lexical_query_uses_fts_index(db):
+    db_path, conn = db
+    plan = " | ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT e.id FROM journal_fts JOIN journal_entries e ON e.doc_id = journal_fts.rowid WHERE journal_fts MATCH ?",
+        ('"hiking"',),
+    ))
+    assert "VIRTUAL TABLE INDEX" in plan
+    assert "idx_entries_doc_id" in plan
+
+
+@patch('main.client.chat.completions.create')
+def test_search_endpoint(mock_create):
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "Summary about kayaking"
+    mock_create.return_value = mock_response
+
+    created = client.post("/journal/", json={"title": "Kayak", "content": "Paddled across the lake in a kayak"}).json()["entry"]
+    try:
+        response = client.get("/journal/search", params={"q": "kayak lake", "k": 5})
+        assert response.status_code == 200
+        data = response.json()
+        assert created["id"] in [hit["id"] for hit in data["hits"]]
+        assert "total" in data["timings_ms"]
+
+        assert client.get("/journal/search", params={"q": "kayak", "start": "not-a-date"}).status_code == 422
+    finally:
+        client.delete(f"/journal/{created['id']}")
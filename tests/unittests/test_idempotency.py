@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+import time
+import uuid
+from unittest.mock import patch, MagicMock
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services.db.migrations import migrate
+from services.db.writer import GroupCommitWriter
+from services.db.idempotency import IdempotencyStore, IdempotencyConflict, RUN, REPLAY
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def store(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    conn.close()
+    writer = GroupCommitWriter(db_path).start()
+    yield IdempotencyStore(db_path, writer, wait_timeout=2, poll_interval=0.01)
+    writer.close()
+
+
+def test_retry_waits_for_request_in_flight(store):
+    assert store.begin("k1", "POST /journal/", {"a": 1}) == (RUN, None)
+
+    results = []
+    retry = threading.Thread(target=lambda: results.append(store.begin("k1", "POST /journal/", {"a": 1})))
+    retry.start()
+    time.sleep(0.1)
+    assert results == []  # still waiting for the first request
+
+    store.complete("k1", "POST /journal/", 200, {"id": "x"})
+    retry.join(2)
+    assert results == [(REPLAY, (200, {"id": "x"}))]
+
+
+def test_key_reused_for_other_request_is_rejected(store):
+    store.begin("k1", "POST /journal/", {"a": 1})
+    with pytest.raises(IdempotencyConflict) as error:
+        store.begin("k1", "POST /journal/", {"a": 2})
+    assert error.value.status_code == 422
+    # the same key in another scope is a different request
+    assert store.begin("k1", "PUT /journal/1", {"a": 2}) == (RUN, None)
+
+
+def test_aborted_request_runs_again(store):
+    store.begin("k1", "POST /journal/", {"a": 1})
+    store.abort("k1", "POST /journal/")
+    assert store.begin("k1", "POST /journal/", {"a": 1}) == (RUN, None)
+
+
+def test_response_that_can_not_be_stored_releases_the_key(store):
+    store.begin("k1", "POST /journal/", {"a": 1})
+    # not JSON serializable: storing fails every time
+    assert store.settle("k1", "POST /journal/", 200, {"id": object()}) is False
+    # the retry runs instead of waiting for a request that already finished
+    store.wait_timeout = 0.05
+    assert store.begin("k1", "POST /journal/", {"a": 1}) == (RUN, None)
+
+    # a passing hiccup is retried
+    with patch.object(store, "complete", side_effect=[RuntimeError("disk I/O error"), None]) as complete:
+        assert store.settle("k1", "POST /journal/", 200, {"id": "x"}) is True
+    assert complete.call_count == 2
+
+
+def test_wait_gives_up_and_stale_claims_are_taken_over(store):
+    store.begin("k1", "POST /journal/", {"a": 1})
+    store.wait_timeout = 0.05
+    with pytest.raises(IdempotencyConflict) as error:
+        store.begin("k1", "POST /journal/", {"a": 1})
+    assert error.value.status_code == 409
+
+    store.lease = 0  # the first request died halfway
+    time.sleep(0.01)
+    assert store.begin("k1", "POST /journal/", {"a": 1}) == (RUN, None)
+
+
+def test_expired_keys_are_forgotten(store):
+    store.ttl = 0
+    store.begin("k1", "POST /journal/", {"a": 1})
+    store.complete("k1", "POST /journal/", 200, {"id": "x"})
+    time.sleep(0.01)
+    assert store.begin("k1", "POST /journal/", {"a": 2}) == (RUN, None)
+
+
+@patch('main.client.chat.completions.create')
+def test_create_with_idempotency_key(mock_create):
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "Summary"
+    mock_create.return_value = mock_response
+    entry = {"title": "Retry", "content": "Sent twice"}
+    headers = {"Idempotency-Key": str(uuid.uuid4())}  # journal.db outlives the test run
+
+    first = client.post("/journal/", json=entry, headers=headers)
+    retry = client.post("/journal/", json=entry, headers=headers)
+    try:
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert mock_create.call_count == 1  # one summary, one row
+
+        other = client.post("/journal/", json={**entry, "content": "Something else"}, headers=headers)
+        assert other.status_code == 422
+    finally:
+        client.delete(f"/journal/{first.json()['entry']['id']}")
+
+
+def test_client_errors_are_replayed():
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    body = {"title": "t", "content": "c"}
+    assert client.put("/journal/missing-id", json=body, headers=headers).status_code == 404
+    replay = client.put("/journal/missing-id", json=body, headers=headers)
+    assert replay.status_code == 404
+    assert replay.headers["Idempotent-Replayed"] == "true"
@@ -0,0 +1,106 @@
+import threading
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import main
+from main import app
+from services.sbert import embeddings_sbert
+from services.sbert.inference_pool import InferenceExecutor, InferenceSaturatedError
+
+client = TestClient(app)
+
+
+def blocked_executor(**kwargs):
+    """ Executor whose single worker is stuck on a task until the returned event is set """
+    executor = InferenceExecutor(workers=1, torch_threads=1, **kwargs)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    executor.submit(block)
+    started.wait(5)
+    return executor, release
+
+
+def test_run_returns_result():
+    executor = InferenceExecutor(workers=2, torch_threads=1)
+    assert executor.run(lambda x: x * 2, 21) == 42
+
+
+def test_full_lane_is_rejected():
+    executor, release = blocked_executor(max_queue={"interactive": 2})
+    executor.submit(lambda: None)
+    executor.submit(lambda: None)
+
+    with pytest.raises(InferenceSaturatedError) as error:
+        executor.submit(lambda: None)
+    assert error.value.retry_after >= 1
+
+    # other lanes have their own limit
+    executor.submit(lambda: None, lane="bulk")
+    release.set()
+
+
+def test_interactive_runs_before_bulk():
+    executor, release = blocked_executor()
+    order = []
+    bulk = executor.submit(order.append, "bulk", lane="bulk")
+    interactive = executor.submit(order.append, "interactive", lane="interactive")
+
+    release.set()
+    bulk.result(5)
+    interactive.result(5)
+    assert order == ["interactive", "bulk"]
+
+
+def test_saturation_returns_503_with_retry_after():
+    with patch('main.get_embedding', side_effect=InferenceSaturatedError("interactive", 3)):
+        response = client.post("/generate-prompt", json={"promptType": "daily", "recentEntries": [], "customPrompt": "my dog"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+@patch('main.client.chat.completions.create')
+def test_saturated_embedding_keeps_the_summary_of_a_new_entry(mock_create):
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "You walked by the river."
+    mock_create.return_value = mock_response
+
+    with patch('main.get_embedding', side_effect=InferenceSaturatedError("interactive", 3)):
+        response = client.post("/journal/", json={"title": "Walk", "content": "A walk by the river"})
+    assert response.status_code == 200
+    entry_id = response.json()["entry"]["id"]
+    try:
+        row = main.conn.execute(
+            "SELECT summary, summaryEmbedding, embeddingModel FROM journal_entries WHERE id = ?", (entry_id,)
+        ).fetchone()
+        # the LLM summary is kept, the backfill job adds the vector
+        assert row == ("You walked by the river.", None, None)
+        assert mock_create.call_count == 1
+    finally:
+        client.delete(f"/journal/{entry_id}")
+
+
+def test_bulk_encodes_are_split_so_interactive_work_interleaves():
+    executor = InferenceExecutor(workers=1, torch_threads=1)
+    order = []
+
+    class Model:
+        def encode(self, texts, batch_size=32):
+            order.append(len(texts))
+            if len(order) == 1:
+                # an interactive request arrives while the bulk job is running
+                executor.submit(order.append, "interactive")
+            return np.ones((len(texts), 4), dtype=np.float32)
+
+    with patch.object(embeddings_sbert, "inference", executor), \
+            patch.object(embeddings_sbert, "get_model", return_value=Model()):
+        embeddings = embeddings_sbert.get_embeddings([f"text {i}" for i in range(10)], batch_size=4)
+
+    assert embeddings.shape == (10, 4)
+    assert order == [4, "interactive", 4, 2]
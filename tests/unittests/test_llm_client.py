@@ -0,0 +1,132 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import openai
+import pytest
+from services.openAI.fake_server import FakeOpenAIServer
+from services.openAI.llm_client import LLMClient, CircuitBreaker, LLMUnavailableError
+from services.metrics.tracker import metrics
+
+# these tests run the LLM wrapper against a local fake OpenAI-compatible server,
+# with latency and errors injected per request.
+
+MESSAGES = [{"role": "user", "content": "Summarize this."}]
+
+
+@pytest.fixture
+def fake_openai():
+    server = FakeOpenAIServer(reply="You had a good day.").start()
+    yield server
+    server.stop()
+
+
+def make_llm(server, **kwargs):
+    metrics.reset()
+    client = openai.OpenAI(base_url=server.base_url, api_key="fake", max_retries=0)
+    kwargs.setdefault("backoff_base", 0.01)
+    return LLMClient(client, **kwargs)
+
+
+def test_complete_returns_text(fake_openai):
+    llm = make_llm(fake_openai)
+    assert llm.complete(MESSAGES) == "You had a good day."
+
+
+def test_retries_transient_errors(fake_openai):
+    llm = make_llm(fake_openai, max_retries=2)
+    fake_openai.script((0, 500), (0, 503))
+
+    assert llm.complete(MESSAGES) == "You had a good day."
+    assert fake_openai.requests == 3
+    assert metrics.summary()["counters"]["llm.retries"] == 2
+
+
+def test_does_not_retry_client_errors(fake_openai):
+    llm = make_llm(fake_openai, max_retries=2)
+    fake_openai.script((0, 400))
+
+    with pytest.raises(openai.BadRequestError):
+        llm.complete(MESSAGES)
+    assert fake_openai.requests == 1
+
+
+def test_timeout_is_retried(fake_openai):
+    llm = make_llm(fake_openai, timeout=0.2, max_retries=1)
+    fake_openai.script((1.0, 200))
+
+    started = time.perf_counter()
+    assert llm.complete(MESSAGES) == "You had a good day."
+    assert time.perf_counter() - started < 1.0
+
+
+def test_hedged_request_beats_slow_first_request(fake_openai):
+    llm = make_llm(fake_openai, hedge_min_samples=5, max_retries=0)
+    for _ in range(5):
+        metrics.record("llm.latency", 0.05)
+    fake_openai.script((1.5, 200), (0, 200))
+
+    started = time.perf_counter()
+    assert llm.complete(MESSAGES) == "You had a good day."
+    assert time.perf_counter() - started < 1.0
+    assert metrics.summary()["counters"]["llm.hedged"] == 1
+
+
+def test_primary_requests_do_not_queue_behind_each_other(fake_openai):
+    # one hedge worker, hedging armed but never reached: concurrent calls still run side by side
+    llm = make_llm(fake_openai, hedge_min_samples=5, max_retries=0, max_workers=1)
+    for _ in range(5):
+        metrics.record("llm.latency", 5.0)
+    fake_openai.script(*[(0.3, 200)] * 4)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        replies = list(pool.map(lambda _: llm.complete(MESSAGES), range(4)))
+    assert replies == ["You had a good day."] * 4
+    assert time.perf_counter() - started < 1.0
+
+
+def test_circuit_breaker_fails_fast_and_recovers(fake_openai):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.3)
+    llm = make_llm(fake_openai, max_retries=0, breaker=breaker)
+    fake_openai.script((0, 500), (0, 500))
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            llm.complete(MESSAGES)
+    assert breaker.state == "open"
+
+    # open: rejected without touching the provider
+    with pytest.raises(LLMUnavailableError) as error:
+        llm.complete(MESSAGES)
+    assert error.value.retry_after > 0
+    assert fake_openai.requests == 2
+
+    # after the reset timeout a trial call goes through and closes the breaker
+    time.sleep(0.35)
+    assert llm.complete(MESSAGES) == "You had a good day."
+    assert breaker.state == "closed"
+
+
+def test_rejected_stream_ends_a_half_open_trial(fake_openai):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    llm = make_llm(fake_openai, max_retries=0, breaker=breaker)
+    fake_openai.script((0, 500), (0, 400))
+    with pytest.raises(LLMUnavailableError):
+        llm.complete(MESSAGES)
+    assert breaker.state == "open"
+
+    time.sleep(0.15)
+    # the trial call is a stream the provider rejects (e.g. a prompt that is too long)
+    with pytest.raises(openai.BadRequestError):
+        llm.stream(MESSAGES)
+    assert breaker.state == "closed"
+    assert llm.complete(MESSAGES) == "You had a good day."
+
+
+def test_stream_yields_tokens(fake_openai):
+    llm = make_llm(fake_openai)
+    stream = llm.stream(MESSAGES)
+    tokens = [chunk.choices[0].delta.content for chunk in stream if chunk.choices and chunk.choices[0].delta.content]
+    assert "".join(tokens) == "You had a good day."
+    # opening a stream is not a completion: it must not pull the hedge delay down
+    assert metrics.count("llm.latency") == 0
+    assert metrics.count("llm.latency.stream_open") == 1
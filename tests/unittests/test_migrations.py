@@ -0,0 +1,68 @@
+from services.db.migrations import migrate, schema_version, MIGRATIONS
+
+# the hot queries must stay index-backed: these tests look at EXPLAIN QUERY PLAN,
+# so adding a column or changing a query can not silently turn them into full table scans.
+
+
+def query_plan(conn, sql, params=()):
+    return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_migrate_sets_version_and_is_idempotent(migrated_db):
+    assert schema_version(migrated_db) == len(MIGRATIONS)
+    assert migrate(migrated_db) == []
+
+
+def test_migrate_upgrades_legacy_database(db_connection):
+    # db_connection has the schema main.py used to create ad hoc, with user_version 0
+    db_connection.execute(
+        "INSERT INTO journal_entries (id, title, content, date) VALUES ('old', 't', 'c', '2025-11-17T12:00:00.000Z')"
+    )
+    db_connection.commit()
+
+    applied = migrate(db_connection)
+
+    assert applied == [m.__name__ for m in MIGRATIONS]
+    row = db_connection.execute("SELECT date_epoch, embeddingModel FROM journal_entries WHERE id = 'old'").fetchone()
+    assert row == (1763380800, None)
+
+
+def test_date_epoch_is_kept_in_sync(migrated_db):
+    migrated_db.execute(
+        "INSERT INTO journal_entries (id, title, content, date) VALUES ('a', 't', 'c', '2025-11-17T12:00:00.123456')"
+    )
+    assert migrated_db.execute("SELECT date_epoch FROM journal_entries").fetchone()[0] == 1763380800
+
+    migrated_db.execute("UPDATE journal_entries SET date = '2025-11-18T13:00:00+01:00' WHERE id = 'a'")
+    assert migrated_db.execute("SELECT date_epoch FROM journal_entries").fetchone()[0] == 1763380800 + 86400
+
+
+def test_prompt_candidates_use_partial_index(migrated_db):
+    plan = query_plan(migrated_db, """
+        SELECT id, summaryEmbedding FROM journal_entries
+        WHERE use_for_prompt_generation = 1 AND summaryEmbedding IS NOT NULL AND embeddingModel = ?
+    """, ("v1",))
+    assert "idx_entries_prompt_eligible" in plan
+    assert "SCAN journal_entries" not in plan
+
+
+def test_list_is_ordered_by_index(migrated_db):
+    plan = query_plan(migrated_db, """
+        SELECT id, title, content, date, summary, prompt, promptType, use_for_prompt_generation
+        FROM journal_entries ORDER BY date_epoch DESC, id DESC
+    """)
+    assert "idx_entries_date_epoch" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_list_without_content_is_covered(migrated_db):
+    plan = query_plan(migrated_db, """
+        SELECT id, title, date, summary, prompt, promptType, use_for_prompt_generation
+        FROM journal_entries ORDER BY date_epoch DESC, id DESC
+    """)
+    assert "COVERING INDEX idx_entries_date_epoch" in plan
+
+
+def test_date_range_uses_index(migrated_db):
+    plan = query_plan(migrated_db, "SELECT id FROM journal_entries WHERE date_epoch BETWEEN ? AND ?", (0, 1))
+    assert "SEARCH journal_entries USING COVERING INDEX idx_entries_date_epoch" in plan
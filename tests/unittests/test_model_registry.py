@@ -0,0 +1,135 @@
+import sqlite3
+from unittest.mock import patch
+import numpy as np
+import pytest
+from services.sbert.model_registry import ModelRegistry
+from services.openAI.summaries import FALLBACK_SUMMARY
+from services.sbert.embeddings_sbert import embedding_to_blob, embedding_from_blob
+
+# the registry is tested on a temporary database file, with get_embeddings replaced by a
+# deterministic function so no second model has to be downloaded
+
+
+def fake_embeddings(texts, lane="bulk", model_name=None):
+    return np.array([[len(t), 2.0, 0.0] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+    CREATE TABLE journal_entries (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        summary TEXT DEFAULT NULL,
+        prompt TEXT DEFAULT NULL,
+        promptType TEXT DEFAULT NULL,
+        summaryEmbedding BLOB,
+        use_for_prompt_generation BOOLEAN DEFAULT TRUE
+    );
+    """)
+    old = embedding_to_blob(np.array([1.0, 1.0, 1.0], dtype=np.float32))
+    conn.executemany(
+        "INSERT INTO journal_entries (id, title, content, summary, summaryEmbedding) VALUES (?, ?, ?, ?, ?)",
+        [(f"e{i}", "t", "c", "s" * (i + 1), old) for i in range(5)],
+    )
+    conn.commit()
+    conn.close()
+
+    registry = ModelRegistry(db_path)
+    with patch("services.sbert.model_registry.embeddings_sbert.set_active_model"):
+        registry.bootstrap()
+        yield registry
+
+
+def test_bootstrap_tags_existing_embeddings(registry):
+    assert registry.active_version() == "v1"
+    with registry.session() as conn:
+        tags = {row[0] for row in conn.execute("SELECT embeddingModel FROM journal_entries")}
+    assert tags == {"v1"}
+
+
+def test_reembedding_switches_over_atomically(registry):
+    registry.register("v2", "some-new-model")
+    with patch("services.sbert.model_registry.get_embeddings", side_effect=fake_embeddings) as encode:
+        job = registry.start_reembedding(batch_size=2, rows_per_second=1000)
+        job.join(10)
+
+    assert job.status == "complete"
+    assert job.processed == 5
+    assert encode.call_count == 3  # batches of 2, 2, 1
+    assert registry.active_version() == "v2"
+
+    with registry.session() as conn:
+        rows = conn.execute("SELECT summary, summaryEmbedding, embeddingModel FROM journal_entries").fetchall()
+        pending = conn.execute("SELECT COUNT(*) FROM pending_embeddings").fetchone()[0]
+    assert pending == 0
+    for summary, blob, tag in rows:
+        assert tag == "v2"
+        assert embedding_from_blob(blob)[0] == len(summary)
+
+    statuses = {m["version"]: m["status"] for m in registry.list_models()}
+    assert statuses == {"v1": "retired", "v2": "active"}
+
+
+def test_fallback_summaries_are_not_reembedded(registry):
+    with registry.session() as conn:
+        conn.executemany(
+            "INSERT INTO journal_entries (id, title, content, summary) VALUES (?, 't', 'c', ?)",
+            [("f1", FALLBACK_SUMMARY), ("f2", FALLBACK_SUMMARY)],
+        )
+    registry.register("v2", "some-new-model")
+    with patch("services.sbert.model_registry.get_embeddings", side_effect=fake_embeddings):
+        job = registry.start_reembedding(batch_size=10, rows_per_second=1000)
+        job.join(10)
+
+    assert job.status == "complete"
+    assert job.processed == 5
+    with registry.session() as conn:
+        rows = conn.execute("SELECT summaryEmbedding, embeddingModel FROM journal_entries WHERE id LIKE 'f%'").fetchall()
+    # left for the backfill job, which summarizes them again first
+    assert rows == [(None, None), (None, None)]
+
+
+def test_job_resumes_from_pending_rows(registry):
+    registry.register("v2", "some-new-model")
+    with registry.session() as conn:
+        conn.execute(
+            "INSERT INTO pending_embeddings (entry_id, version, embedding) VALUES ('e0', 'v2', ?)",
+            (embedding_to_blob(np.zeros(3, dtype=np.float32)),),
+        )
+
+    with patch("services.sbert.model_registry.get_embeddings", side_effect=fake_embeddings):
+        job = registry.start_reembedding(batch_size=10, rows_per_second=1000)
+        job.join(10)
+
+    assert job.processed == 4
+
+
+def test_switch_over_refuses_incomplete_version(registry):
+    registry.register("v2", "some-new-model")
+    assert registry.switch_over("v2") is False
+    assert registry.active_version() == "v1"
+
+
+def test_only_one_version_can_be_building(registry):
+    registry.register("v2", "model-a")
+    with pytest.raises(ValueError):
+        registry.register("v3", "model-b")
+
+
+def test_admin_model_registration_is_restricted(monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+    client = TestClient(main.app)
+
+    response = client.post("/admin/models", json={"version": "v-evil", "model_name": "someone/arbitrary-model"})
+    assert response.status_code == 403
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert client.get("/admin/models").status_code == 401
+    assert client.get("/admin/models", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.get("/admin/models", headers={"X-Admin-Token": "secret"}).status_code == 200
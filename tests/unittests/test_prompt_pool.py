@@ -0,0 +1,127 @@
+import threading
+import time
+from unittest.mock import patch, MagicMock
+import numpy as np
+from fastapi.testclient import TestClient
+from main import app
+import main
+from services.openAI.prompt_pool import PromptPool, fingerprint
+
+client = TestClient(app)
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def complete(self, messages, max_tokens=60):
+        self.calls += 1
+        return f"pooled prompt {self.calls}"
+
+
+def messages(text):
+    return [{"role": "system", "content": "sys"}, {"role": "user", "content": text}]
+
+
+def wait_until_full(pool, prompt_type, size, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = pool.stats()["pools"].get(prompt_type)
+        if stats and stats["size"] >= size and stats["filling"] == 0:
+            return
+        time.sleep(0.01)
+    raise AssertionError("pool was not refilled")
+
+
+def test_miss_then_hit():
+    llm = FakeLLM()
+    pool = PromptPool(llm, size=2)
+
+    assert pool.take("daily", messages("a")) is None  # cold: miss, fills in the background
+    wait_until_full(pool, "daily", 2)
+    assert pool.take("daily", messages("a")).startswith("pooled prompt")
+    wait_until_full(pool, "daily", 2)  # topped up again after the hit
+    assert llm.calls == 3
+
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_new_context_invalidates_pool():
+    pool = PromptPool(FakeLLM(), size=2)
+    pool.prefill("daily", messages("old entries"))
+    wait_until_full(pool, "daily", 2)
+
+    # the entries changed: prompts for the old context must not be served
+    assert pool.take("daily", messages("new entries")) is None
+    wait_until_full(pool, "daily", 2)
+    assert pool.take("daily", messages("new entries")) is not None
+    assert pool.take("daily", messages("old entries")) is None
+
+
+def test_queued_fills_for_an_old_context_skip_the_llm():
+    release = threading.Event()
+
+    class SlowLLM(FakeLLM):
+        def complete(self, messages, max_tokens=60):
+            release.wait(5)
+            return super().complete(messages, max_tokens)
+
+    llm = SlowLLM()
+    pool = PromptPool(llm, size=3, max_workers=1)
+    pool.prefill("daily", messages("old entries"))  # one fill running, two queued
+    pool.prefill("daily", messages("new entries"))
+    release.set()
+    wait_until_full(pool, "daily", 3)
+    assert llm.calls == 4  # the running old fill and the three new ones
+
+
+def test_expired_prompts_are_not_served():
+    pool = PromptPool(FakeLLM(), size=1, max_age=0.05)
+    pool.prefill("creative", messages("a"))
+    wait_until_full(pool, "creative", 1)
+    time.sleep(0.1)
+    assert pool.take("creative", messages("a")) is None
+
+
+def test_failed_fills_are_not_pooled():
+    llm = MagicMock()
+    llm.complete.side_effect = RuntimeError("down")
+    pool = PromptPool(llm, size=2)
+    pool.prefill("daily", messages("a"))
+    wait_until_full(pool, "daily", 0)
+    assert pool.stats()["pools"]["daily"]["size"] == 0
+
+
+@patch('main.client.chat.completions.create')
+def test_generate_prompt_served_from_pool(mock_create):
+    mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="Fresh prompt."))])
+    pool = PromptPool(FakeLLM(), size=1)
+    request = {"promptType": "reflective", "recentEntries": [{"title": "t", "content": "A walk in the rain"}]}
+
+    with patch("main.prompt_pool", pool):
+        assert client.post("/generate-prompt", json=request).json() == {"prompt": "Fresh prompt."}
+        wait_until_full(pool, "reflective", 1)
+        assert client.post("/generate-prompt", json=request).json() == {"prompt": "pooled prompt 1"}
+        assert mock_create.call_count == 1
+
+        # custom prompts always go to the LLM
+        custom = {**request, "recentEntries": [], "customPrompt": "my dog"}
+        with patch("main.get_embedding", return_value=np.zeros(384, dtype=np.float32)):
+            assert client.post("/generate-prompt", json=custom).json() == {"prompt": "Fresh prompt."}
+
+        assert client.get("/metrics").json()["prompt_pool"]["hits"] == 1
+
+
+def test_writes_prefill_warm_pools_for_the_new_context():
+    pool = PromptPool(FakeLLM(), size=1)
+    pool.prefill("daily", messages("context before the write"))
+    wait_until_full(pool, "daily", 1)
+
+    with patch("main.prompt_pool", pool):
+        main.refill_prompt_pool()
+        wait_until_full(pool, "daily", 1)
+
+    expected = fingerprint(main.build_prompt_messages(main.default_prompt_request("daily")))
+    assert pool.stats()["pools"]["daily"]["fingerprint"] == expected[:12]
+    assert set(pool.warm_types()) == {"daily"}  # types nobody asked for are not generated
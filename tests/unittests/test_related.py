@@ -0,0 +1,167 @@
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import main
+from main import app
+from services.sbert.embeddings_sbert import embedding_to_blob
+from RAG.vector_index import VectorIndex
+from RAG.related import RelatedGraph
+from RAG.derived import DerivedRefresher
+from services.metrics.tracker import metrics
+
+client = TestClient(app)
+
+# the graph is tested on a temporary database with random vectors and compared against a brute-force kNN
+
+
+def random_blob(rng):
+    return embedding_to_blob(rng.standard_normal(8).astype(np.float32))
+
+
+def brute_force(conn, k):
+    rows = conn.execute("SELECT id, summaryEmbedding FROM journal_entries WHERE summaryEmbedding IS NOT NULL").fetchall()
+    ids = [row[0] for row in rows]
+    matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+    matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    sims = matrix @ matrix.T
+    np.fill_diagonal(sims, -np.inf)
+    return {entry_id: [ids[j] for j in np.argsort(-sims[i])[:k]] for i, entry_id in enumerate(ids)}
+
+
+def stored(conn):
+    graph = {}
+    for entry_id, neighbor_id in conn.execute("SELECT entry_id, neighbor_id FROM entry_neighbors ORDER BY entry_id, rank"):
+        graph.setdefault(entry_id, []).append(neighbor_id)
+    return graph
+
+
+@pytest.fixture
+def db(migrated_db_file):
+    db_path, conn = migrated_db_file
+    rng = np.random.default_rng(0)
+    conn.executemany(
+        "INSERT INTO journal_entries (id, title, content, summary, summaryEmbedding, embeddingModel) VALUES (?, 't', 'c', 's', ?, 'v1')",
+        [(f"e{i:02d}", random_blob(rng)) for i in range(40)],
+    )
+    conn.commit()
+    return db_path, conn, rng
+
+
+def test_build_matches_brute_force(db, registry):
+    db_path, conn, rng = db
+    graph = RelatedGraph(db_path, VectorIndex(db_path, registry), k=5, block_size=7)  # several blocks
+    graph.update()
+    assert stored(conn) == brute_force(conn, 5)
+
+
+def test_incremental_updates_match_brute_force(db, registry):
+    db_path, conn, rng = db
+    graph = RelatedGraph(db_path, VectorIndex(db_path, registry), k=5, block_size=16)
+    graph.update()
+
+    conn.execute("INSERT INTO journal_entries (id, title, content, summary, summaryEmbedding, embeddingModel) VALUES ('new', 't', 'c', 's', ?, 'v1')", (random_blob(rng),))
+    conn.execute("UPDATE journal_entries SET summaryEmbedding = ? WHERE id = 'e03'", (random_blob(rng),))
+    conn.execute("DELETE FROM journal_entries WHERE id = 'e07'")
+    # an entry losing its vector (e.g. the summary failed) drops out of the graph
+    conn.execute("UPDATE journal_entries SET summaryEmbedding = NULL WHERE id = 'e11'")
+    conn.commit()
+    graph.update()
+
+    expected = brute_force(conn, 5)
+    assert stored(conn) == expected
+    assert "e07" not in stored(conn) and "e11" not in stored(conn)
+    state = conn.execute("SELECT last_seq FROM related_graph_state").fetchone()[0]
+    assert state == conn.execute("SELECT MAX(seq) FROM change_log").fetchone()[0]
+    # the floors follow the lists
+    floors = dict(conn.execute("SELECT entry_id, score FROM entry_neighbor_floor"))
+    assert floors == dict(conn.execute("SELECT entry_id, MIN(score) FROM entry_neighbors GROUP BY entry_id"))
+
+
+def test_merge_only_reads_lists_a_change_can_get_into(db, registry):
+    db_path, conn, rng = db
+    graph = RelatedGraph(db_path, VectorIndex(db_path, registry), k=3)
+    graph.update()
+    plan = " | ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT entry_id, score FROM entry_neighbor_floor WHERE score < ?", (0.5,)
+    ))
+    assert "USING COVERING INDEX idx_entry_neighbor_floor_score" in plan
+
+    # a new entry: the only lists rewritten are the ones it got into
+    merged_before = metrics._counters["related.merged_lists"]
+    conn.execute("INSERT INTO journal_entries (id, title, content, summary, summaryEmbedding, embeddingModel) VALUES ('new', 't', 'c', 's', ?, 'v1')", (random_blob(rng),))
+    conn.commit()
+    graph.update()
+    assert stored(conn) == brute_force(conn, 3)
+    joined = [entry_id for entry_id, neighbors in stored(conn).items() if "new" in neighbors]
+    assert 0 < len(joined) < 40
+    assert metrics._counters["related.merged_lists"] - merged_before == len(joined)
+
+
+def test_refresher_coalesces_a_burst_of_requests():
+    class Counter:
+        calls = 0
+
+        def update(self):
+            self.calls += 1
+
+    counter = Counter()
+    refresher = DerivedRefresher({"counter": counter}, debounce_ms=50).start()
+    try:
+        for _ in range(20):
+            refresher.request()
+        assert refresher.flush(timeout=5)
+        assert counter.calls == 1
+        refresher.request()
+        assert refresher.flush(timeout=5)
+        assert counter.calls == 2
+    finally:
+        refresher.close()
+
+
+def test_model_switch_rebuilds(db, registry):
+    db_path, conn, rng = db
+    graph = RelatedGraph(db_path, VectorIndex(db_path, registry), k=5)
+    graph.update()
+    registry.version = "v2"  # no v2 vectors yet
+    graph.update()
+    assert stored(conn) == {}
+
+
+def test_related_lookup_is_a_primary_key_read(db):
+    db_path, conn, rng = db
+    plan = " | ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT n.neighbor_id FROM entry_neighbors n JOIN journal_entries e ON e.id = n.neighbor_id WHERE n.entry_id = ? ORDER BY n.rank",
+        ("e01",),
+    ))
+    assert "SEARCH n USING PRIMARY KEY (entry_id=?)" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@patch('main.client.chat.completions.create')
+def test_related_endpoint(mock_create):
+    mock_response = MagicMock()
+    mock_create.return_value = mock_response
+
+    ids = []
+    try:
+        for text in ["Morning run by the river", "Evening run by the river", "Baking bread"]:
+            mock_response.choices[0].message.content = text
+            ids.append(client.post("/journal/", json={"title": text, "content": text}).json()["entry"]["id"])
+        main.derived.flush()  # the graph is updated in the background
+
+        response = client.get(f"/journal/{ids[0]}/related")
+        assert response.status_code == 200
+        related_ids = [hit["id"] for hit in response.json()["related"]]
+        assert ids[1] in related_ids
+        assert ids[0] not in related_ids
+
+        client.delete(f"/journal/{ids[1]}")
+        main.derived.flush()
+        related_ids = [hit["id"] for hit in client.get(f"/journal/{ids[0]}/related").json()["related"]]
+        assert ids[1] not in related_ids
+
+        assert client.get("/journal/missing-id/related").status_code == 404
+    finally:
+        for entry_id in ids:
+            client.delete(f"/journal/{entry_id}")
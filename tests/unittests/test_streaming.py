@@ -0,0 +1,67 @@
+import json
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from main import app
+from services.metrics.tracker import metrics
+
+client = TestClient(app)
+
+
+def make_chunk(token):
+    """ Build a fake OpenAI streaming chunk carrying one token """
+    return MagicMock(choices=[MagicMock(delta=MagicMock(content=token))])
+
+
+def parse_events(body):
+    """ Split an SSE body into (event, data) tuples """
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = "message", None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+@patch('main.client.chat.completions.create')
+def test_stream_forwards_tokens(mock_create):
+    metrics.reset()
+    mock_create.return_value = iter([make_chunk("What "), make_chunk(None), make_chunk("made you smile?")])
+
+    response = client.post("/generate-prompt/stream", json={"promptType": "daily", "recentEntries": []})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert events == [
+        ("message", {"token": "What "}),
+        ("message", {"token": "made you smile?"}),
+        ("done", {"prompt": "What made you smile?"}),
+    ]
+    assert mock_create.call_args[1]["stream"] is True
+
+    # time-to-first-token is tracked
+    assert metrics.summary()["latencies"]["generate_prompt_stream.ttft"]["count"] == 1
+
+
+@patch('main.client.chat.completions.create')
+def test_stream_reports_openai_errors(mock_create):
+    mock_create.side_effect = Exception("boom")
+
+    response = client.post("/generate-prompt/stream", json={"promptType": "creative", "recentEntries": []})
+
+    assert response.status_code == 200
+    assert parse_events(response.text) == [("error", {"detail": "Could not generate prompt."})]
+
+
+@patch('main.client.chat.completions.create')
+def test_non_streaming_endpoint_still_works(mock_create):
+    mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="A prompt."))])
+
+    response = client.post("/generate-prompt", json={"promptType": "reflective", "recentEntries": []})
+
+    assert response.status_code == 200
+    assert response.json() == {"prompt": "A prompt."}
@@ -0,0 +1,98 @@
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from main import app
+from services.db.queries import date_filters, keyset_page
+
+client = TestClient(app)
+
+# entries are dated in the 1990s so they do not mix with entries created by other tests
+DATES = [
+    "1997-03-05T09:00:00",
+    "1998-03-05T18:30:00",
+    "1998-07-14T12:00:00",
+    "1999-03-05T07:15:00",
+    "1999-03-20T12:00:00",
+]
+
+
+def query_plan(conn, clauses, params, order_by):
+    sql = "SELECT id, title, date FROM journal_entries"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql + " " + order_by, params))
+
+
+def test_on_this_day_uses_month_day_index(migrated_db):
+    clauses, params = date_filters(month=3, day=5)
+    plan = query_plan(migrated_db, clauses, params, "")
+    assert "idx_entries_date_md" in plan
+
+
+def test_date_range_page_uses_date_index(migrated_db):
+    clauses, params = date_filters(start="2025-01-01", end="2025-01-31")
+    order_by = keyset_page(clauses, params, "desc", "1735700000_some-id")
+    plan = query_plan(migrated_db, clauses, params, order_by)
+    assert "idx_entries_date_epoch" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@patch('main.client.chat.completions.create')
+def test_temporal_filters_and_pagination(mock_create):
+    mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="Summary."))])
+    ids = {}
+    for date in DATES:
+        response = client.post("/journal/", json={"title": "Temporal", "content": f"Entry on {date}", "date": date})
+        ids[date] = response.json()["entry"]["id"]
+    try:
+        check_temporal_queries(ids)
+    finally:
+        for entry_id in ids.values():
+            client.delete(f"/journal/{entry_id}")
+
+
+def check_temporal_queries(ids):
+    old = {"end": "1999-12-31"}
+
+    # date range, inclusive end date
+    response = client.get("/journal/", params={"start": "1998-01-01", "end": "1999-03-05"})
+    assert [e["date"] for e in response.json()["entries"]] == [DATES[3], DATES[2], DATES[1]]
+
+    # on this day in past years
+    response = client.get("/journal/", params={"month": 3, "day": 5, "sort": "asc", **old})
+    assert [e["id"] for e in response.json()["entries"]] == [ids[DATES[0]], ids[DATES[1]], ids[DATES[3]]]
+
+    # whole month across years
+    response = client.get("/journal/", params={"month": 3, **old})
+    assert len(response.json()["entries"]) == 4
+
+    # most recent N, then follow next_cursor until the end
+    seen = []
+    params = {"limit": 2, **old}
+    while True:
+        body = client.get("/journal/", params=params).json()
+        seen.extend(e["date"] for e in body["entries"])
+        if not body["next_cursor"]:
+            break
+        params["cursor"] = body["next_cursor"]
+    assert seen == sorted(DATES, reverse=True)
+
+
+def test_invalid_temporal_params():
+    assert client.get("/journal/", params={"start": "yesterday"}).status_code == 422
+    assert client.get("/journal/", params={"month": 13}).status_code == 422
+    assert client.get("/journal/", params={"sort": "sideways"}).status_code == 422
+
+
+def test_unparseable_dates_are_rejected_and_legacy_ones_still_page(migrated_db):
+    assert client.post("/journal/", json={"title": "t", "content": "c", "date": "last tuesday"}).status_code == 422
+
+    # a row stored before dates were validated: no NULL date_epoch, so keyset paging reaches it
+    migrated_db.execute("INSERT INTO journal_entries (id, title, content, date) VALUES ('legacy', 't', 'c', 'last tuesday')")
+    migrated_db.execute("INSERT INTO journal_entries (id, title, content, date) VALUES ('dated', 't', 'c', '2020-01-01')")
+    assert migrated_db.execute("SELECT date_epoch FROM journal_entries WHERE id = 'legacy'").fetchone()[0] == 0
+
+    clauses, params = [], []
+    order_by = keyset_page(clauses, params, "desc", "1577836800_dated")
+    rows = migrated_db.execute("SELECT id FROM journal_entries WHERE " + " AND ".join(clauses) + " " + order_by, params).fetchall()
+    assert rows == [("legacy",)]
+    assert client.get("/journal/", params={"cursor": "None_some-id"}).status_code == 422
@@ -0,0 +1,134 @@
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services.sbert.embeddings_sbert import embedding_to_blob
+from RAG.vector_index import VectorIndex
+from RAG.themes import ThemeModel
+
+client = TestClient(app)
+
+# three well separated groups of 4-d vectors around the first three axes
+
+
+def near(axis, rng):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector + 0.05 * rng.standard_normal(4).astype(np.float32)
+
+
+def insert(conn, entry_id, vector, summary="s", eligible=True, date="2099-01-01T00:00:00"):
+    conn.execute(
+        "INSERT INTO journal_entries (id, title, content, date, summary, summaryEmbedding, embeddingModel, use_for_prompt_generation) VALUES (?, 't', 'c', ?, ?, ?, 'v1', ?)",
+        (entry_id, date, summary, embedding_to_blob(vector), eligible),
+    )
+
+
+def theme_of(conn, entry_id):
+    row = conn.execute("SELECT theme_id FROM entry_themes WHERE entry_id = ?", (entry_id,)).fetchone()
+    return row[0] if row else None
+
+
+@pytest.fixture
+def db(migrated_db_file, registry):
+    db_path, conn = migrated_db_file
+    rng = np.random.default_rng(1)
+    for group in range(3):
+        for i in range(6):
+            insert(conn, f"g{group}-{i}", near(group, rng), summary=f"group {group} summary {i}", eligible=i != 0)
+    conn.commit()
+    model = ThemeModel(db_path, VectorIndex(db_path, registry), n_themes=3, min_entries=6)
+    model.update()
+    return conn, model, rng
+
+
+def test_build_separates_groups(db):
+    conn, model, rng = db
+    for group in range(3):
+        assert len({theme_of(conn, f"g{group}-{i}") for i in range(6)}) == 1
+    assert len({theme_of(conn, f"g{group}-0") for group in range(3)}) == 3
+
+
+def test_new_entries_join_nearest_theme(db):
+    conn, model, rng = db
+    theme = theme_of(conn, "g1-1")
+    weight = conn.execute("SELECT weight FROM themes WHERE theme_id = ?", (theme,)).fetchone()[0]
+
+    insert(conn, "new", near(1, rng))
+    conn.execute("DELETE FROM journal_entries WHERE id = 'g2-3'")
+    conn.commit()
+    model.update()
+
+    assert theme_of(conn, "new") == theme
+    assert conn.execute("SELECT weight FROM themes WHERE theme_id = ?", (theme,)).fetchone()[0] == weight + 1
+    assert theme_of(conn, "g2-3") is None
+
+
+def test_weights_follow_moves_edits_and_deletes(db):
+    conn, model, rng = db
+    weight = dict(conn.execute("SELECT theme_id, weight FROM themes"))
+    from_theme, to_theme = theme_of(conn, "g0-1"), theme_of(conn, "g1-1")
+
+    # an edit that keeps the vector is not counted again
+    conn.execute("UPDATE journal_entries SET title = 'edited' WHERE id = 'g0-2'")
+    # a vector that now belongs to another theme moves its weight along
+    conn.execute("UPDATE journal_entries SET summaryEmbedding = ? WHERE id = 'g0-1'", (embedding_to_blob(near(1, rng)),))
+    conn.execute("DELETE FROM journal_entries WHERE id = 'g1-3'")
+    conn.commit()
+    model.update()
+
+    assert theme_of(conn, "g0-1") == to_theme
+    after = dict(conn.execute("SELECT theme_id, weight FROM themes"))
+    assert after[from_theme] == weight[from_theme] - 1
+    assert after[to_theme] == weight[to_theme]  # g0-1 joined, g1-3 left
+    assert sum(after.values()) == conn.execute("SELECT COUNT(*) FROM entry_themes").fetchone()[0]
+
+
+def test_rebuilds_when_journal_doubles(db):
+    conn, model, rng = db
+    for i in range(20):
+        insert(conn, f"more-{i}", near(3, rng))
+    conn.commit()
+    model.update()
+    assert conn.execute("SELECT built_size FROM theme_state").fetchone()[0] == 38
+
+
+def test_digest_uses_only_eligible_recent_entries(db):
+    conn, model, rng = db
+    themes = model.themes(conn, max_themes=5, representatives=10)
+    assert len(themes) == 3
+    assert all(theme["size"] == 5 for theme in themes)  # entry 0 of each group is not prompt-eligible
+    summaries = [summary for theme in themes for summary in theme["summaries"]]
+    assert not any(summary.endswith("summary 0") for summary in summaries)
+
+    digest = model.digest(conn, max_themes=2, representatives=2)
+    assert len(digest.splitlines()) == 2
+    assert digest.startswith("- 5 entries: group")
+
+    # entries older than the window do not count
+    assert model.digest(conn, window_days=1) == model.digest(conn)
+    conn.execute("UPDATE journal_entries SET date = '2000-01-01T00:00:00'")
+    conn.commit()
+    assert model.digest(conn, window_days=30) == ""
+
+
+@patch('main.theme_model.digest', return_value="- 3 entries: hiking | mountains")
+@patch('main.client.chat.completions.create')
+def test_generate_prompt_sends_theme_digest(mock_create, mock_digest):
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "What draws you to the mountains?"
+    mock_create.return_value = mock_response
+
+    entry = {"title": "Hike", "content": "A very long entry text that should not be sent", "date": "2025-11-17T12:00:00"}
+    response = client.post("/generate-prompt", json={"promptType": "daily", "recentEntries": [entry], "context": "themes"})
+    assert response.status_code == 200
+
+    user_message = mock_create.call_args.kwargs["messages"][1]["content"]
+    assert "hiking | mountains" in user_message
+    assert "A very long entry text" not in user_message
+
+    # default context: the entries themselves
+    client.post("/generate-prompt", json={"promptType": "daily", "recentEntries": [entry]})
+    user_message = mock_create.call_args.kwargs["messages"][1]["content"]
+    assert "A very long entry text" in user_message
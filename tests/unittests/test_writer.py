@@ -0,0 +1,77 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from services.db.migrations import migrate
+from services.db.writer import GroupCommitWriter
+
+
+@pytest.fixture
+def writer(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    conn.close()
+    writer = GroupCommitWriter(db_path, max_batch=16, max_wait_ms=20).start()
+    yield writer, db_path
+    writer.close()
+
+
+def insert(entry_id):
+    return lambda cursor: cursor.execute(
+        "INSERT INTO journal_entries (id, title, content) VALUES (?, 't', 'c')", (entry_id,)
+    ).rowcount
+
+
+def count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM journal_entries").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_acknowledged_writes_are_committed(writer):
+    writer, db_path = writer
+    assert writer.execute(insert("a")) == 1
+    # visible to any other connection as soon as execute returns
+    assert count(db_path) == 1
+
+
+def test_concurrent_writes_share_commits(writer):
+    writer, db_path = writer
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(lambda i: writer.execute(insert(f"e{i}")), range(64)))
+
+    assert results == [1] * 64
+    assert count(db_path) == 64
+    stats = writer.stats()
+    assert stats["mutations"] == 64
+    assert stats["batches"] < 64
+    assert max(stats["batch_sizes"]) <= 16
+
+
+def test_failing_mutation_only_fails_its_caller(writer):
+    writer, db_path = writer
+    futures = [
+        writer.submit(insert("ok-1")),
+        writer.submit(insert("ok-1")),  # duplicate primary key
+        writer.submit(insert("ok-2")),
+    ]
+    assert futures[0].result() == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result()
+    assert futures[2].result() == 1
+    assert count(db_path) == 2
+    assert writer.stats()["failed_mutations"] == 1
+
+
+def test_mutation_is_rolled_back_completely(writer):
+    writer, db_path = writer
+
+    def half_done(cursor):
+        cursor.execute("INSERT INTO journal_entries (id, title, content) VALUES ('half', 't', 'c')")
+        raise ValueError("changed my mind")
+
+    with pytest.raises(ValueError):
+        writer.execute(half_done)
+    assert count(db_path) == 0